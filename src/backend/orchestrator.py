@@ -1,9 +1,11 @@
 import asyncio
+import collections
 import random
 import subprocess
 import sys
 import platform
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status, UploadFile, File, Form
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import os
 from fastapi.middleware.cors import CORSMiddleware
@@ -12,7 +14,30 @@ from typing import List, Dict, Optional, Any
 import json
 import time
 import shlex
-from sentinel_ai_classifier import classify_traffic as hybrid_classify, init_sentry
+import functools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from sentinel_ai_classifier import classify_traffic as hybrid_classify, classify_batch as hybrid_classify_batch, init_sentry
+from sentinel_ai_classifier import SENTRY_CONFIDENCE_THRESHOLD, sentry_features, sentry_payload, sentry_predict_batch, sentry_predict_columns
+from sentinel_ai_classifier import cascade_status, set_destination_index, set_domain_rules, set_escalation_controller, set_rule_gate
+from flow_index import IndexedStore, MAX_PAGE_SIZE
+from metrics_engine import MetricsEngine, METRIC_NAMES
+from profile_sketch import HeavyHitterDetector, profile_fingerprint
+from qos_enforcer import NftEnforcer
+from qos_reconciler import Reconciler
+from policy_matcher import PolicyMatcher
+from tc_config import TcConfigurator
+from tc_stats import TcCounterCollector
+from netflow_collector import start_collector as start_netflow_collector
+from bulk_ingest import HAS_PYARROW, arrow_chunks, ndjson_chunks, validate_columns
+from online_flows import OnlineFlowTable
+from load_generator import LoadGenerator
+from whatif import heuristic_predict, run_scenario, scenario_grid, scenario_rows
+from traffic_replay import SegmentRecorder
+from continual_training import LabelHarvester, retrain, save_payload
+from sentry_artifact import ArtifactModel, artifact_path, is_artifact
+from escalation_control import ESCALATE, EscalationController
+from destination_index import DestinationIndex
 
 # Optional dependency for Sentry model loading
 try:
@@ -58,6 +83,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Files the service writes at runtime (harvested labels, learned indexes) go under
+# SENTINEL_STATE_DIR rather than the working directory; the default is git-ignored.
+STATE_DIR = os.environ.get("SENTINEL_STATE_DIR", os.path.join("data", "state"))
+
 # In-memory state to simulate the system
 # In a real system, this would be a more robust data store
 state = {
@@ -66,7 +95,6 @@ state = {
     "policy_map": {},
     "investigations": [],
     "suggestions": [],
-    "suggestion_counters": {},
     "metrics": {
         "high_prio": {"bandwidth": 0, "packets": 0},
         "video_stream": {"bandwidth": 0, "packets": 0},
@@ -75,6 +103,104 @@ state = {
     }
 }
 
+# Secondary indexes for the /flows and /policies query API. The stores own the
+# record dicts, so state["active_flows"] / state["policy_map"] stay plain
+# mappings for readers; all writes go through _put_flow / _put_policy.
+MAX_ACTIVE_FLOWS = int(os.environ.get("SENTINEL_MAX_FLOWS", "10000"))
+FLOW_INDEX_FIELDS = ("app_type", "engine", "dest_port", "status")
+POLICY_INDEX_FIELDS = ("app_type", "engine", "dest_port", "status", "dscp_class", "tc_class")
+
+
+def _on_flow_evicted(flow_id: str, flow: Dict[str, Any]):
+    # Evicted flows no longer need their per-flow policy or DSCP mark
+    policy_store.remove(flow_id)
+    reconciler.clear(flow_id)
+
+
+flow_store = IndexedStore(FLOW_INDEX_FIELDS, cidr_fields=("source_ip",), capacity=MAX_ACTIVE_FLOWS, on_evict=_on_flow_evicted)
+policy_store = IndexedStore(POLICY_INDEX_FIELDS, cidr_fields=("source_ip",))
+state["active_flows"] = flow_store.records
+state["policy_map"] = policy_store.records
+
+
+def _policy_attrs(flow_id: str) -> Dict[str, Any]:
+    # Policies are indexed by the attributes of the flow they belong to
+    flow = flow_store.get(flow_id) or {}
+    return {k: flow.get(k) for k in ("engine", "dest_port", "status", "source_ip")}
+
+
+def _put_flow(flow: Dict[str, Any]) -> Dict[str, Any]:
+    flow_store.upsert(flow["id"], flow)
+    if flow["id"] in policy_store:
+        policy_store.touch(flow["id"], _policy_attrs(flow["id"]))
+        _sync_desired(flow["id"])
+    return flow
+
+
+def _put_policy(key: str, policy: Dict[str, Any]) -> Dict[str, Any]:
+    policy_store.upsert(key, policy, _policy_attrs(key))
+    _sync_desired(key)
+    return policy
+
+
+def _remove_flow(flow_id: str):
+    flow_store.remove(flow_id)
+    policy_store.remove(flow_id)
+    reconciler.clear(flow_id)
+
+
+# --- Policy enforcement ---
+# Per-flow DSCP marks are derived from policy_map: _put_flow/_put_policy declare
+# the desired mark and reconcile_loop applies the diff against what is actually
+# installed. SENTINEL_ENFORCE=nft applies batches with `nft -f` (needs root); any
+# other value appends each batch to the SENTINEL_NFT_RULESET log so the
+# orchestrator stays runnable without privileges; GET /admin/enforcement/ruleset
+# renders the full effective ruleset.
+ENFORCE_MODE = os.environ.get("SENTINEL_ENFORCE", "dry-run")
+ENFORCE_INTERVAL = float(os.environ.get("SENTINEL_ENFORCE_INTERVAL", "1.0"))
+FLOW_TTL = float(os.environ.get("SENTINEL_FLOW_TTL", "300"))
+enforcer = NftEnforcer(dry_run=ENFORCE_MODE != "nft", ruleset_path=os.environ.get("SENTINEL_NFT_RULESET", "sentinel_qos.nft"))
+reconciler = Reconciler(enforcer, ttl_s=FLOW_TTL, full_resync_every=int(os.environ.get("SENTINEL_RESYNC_EVERY", "60")))
+
+
+def _sync_desired(flow_id: str):
+    """Declare the DSCP mark for a flow once both the flow and its policy exist."""
+    flow = flow_store.get(flow_id)
+    policy = policy_store.get(flow_id)
+    if not flow or not policy:
+        return
+    key = (flow["source_ip"], flow["dest_ip"], int(flow["dest_port"]))
+    current = reconciler.desired.get(key)
+    reconciler.set_desired(flow_id, key, policy["dscp_class"])
+    if current != (flow_id, policy["dscp_class"]):
+        msg = f"[{'NFT' if not enforcer.dry_run else 'SIM'}] Mark {key[0]}->{key[1]}:{key[2]} as DSCP={policy['dscp_class']}"
+        # Keep a copy in the in-memory log for the frontend to show
+        state["classification_log"].insert(0, {"timestamp": "now", "message": msg})
+
+
+async def reconcile_loop():
+    """Garbage-collect expired flows and apply the desired/applied diff every ENFORCE_INTERVAL seconds.
+
+    Only the transaction itself runs in a worker thread; diffing and bookkeeping
+    stay on the event loop so they never race with request handlers.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(ENFORCE_INTERVAL)
+        for flow_id in reconciler.pop_expired():
+            _remove_flow(flow_id)
+        batch = reconciler.begin()
+        if not batch["adds"] and not batch["deletes"]:
+            reconciler.complete(batch, 0.0)
+            continue
+        try:
+            elapsed_ms = await loop.run_in_executor(None, enforcer.execute, batch["adds"], batch["deletes"])
+        except Exception as e:
+            reconciler.abort(batch)
+            state["classification_log"].insert(0, {"timestamp": "now", "message": f"Enforcement batch failed: {e}"})
+            continue
+        reconciler.complete(batch, elapsed_ms)
+
 # Admin runtime flags
 state.setdefault("admin", {})
 state["admin"]["simulate_enabled"] = True
@@ -92,6 +218,102 @@ POLICY_DEFINITIONS = {
 }
 TRAFFIC_TYPES = list(POLICY_DEFINITIONS.keys())
 
+# Time-series metrics: one series per QoS class ("class:high_prio") and per app ("app:Gaming")
+METRIC_SERIES = [f"class:{k}" for k in state["metrics"]] + [f"app:{a}" for a in TRAFFIC_TYPES]
+metrics_engine = MetricsEngine(METRIC_SERIES)
+
+
+def _record_traffic(app_type: str, nbytes: int, packets: int, ts: Optional[float] = None):
+    """Account traffic for an app in the time-series engine and the cumulative counters.
+
+    When the tc counter collector runs, per-class numbers come from the
+    kernel and only the per-app series is recorded here.
+    """
+    metrics_engine.record(f"app:{app_type}", nbytes, packets, ts)
+    metric_key = POLICY_DEFINITIONS.get(app_type, {}).get("metric_key")
+    if tc_collector is None and metric_key and metric_key in state["metrics"]:
+        metrics_engine.record(f"class:{metric_key}", nbytes, packets, ts)
+        state["metrics"][metric_key]["packets"] += int(packets)
+        state["metrics"][metric_key]["bandwidth"] += int(nbytes)
+
+
+# HTB classes are generated from POLICY_DEFINITIONS and resized from measured
+# per-class load. SENTINEL_TC=tc applies `tc -batch` files to SENTINEL_IFACE
+# (needs root); any other value writes them to SENTINEL_TC_BATCH.
+TC_MODE = os.environ.get("SENTINEL_TC", "dry-run")
+TC_INTERVAL = float(os.environ.get("SENTINEL_TC_INTERVAL", "30"))
+TC_WINDOW = int(os.environ.get("SENTINEL_TC_WINDOW", "300"))
+tc_configurator = TcConfigurator(
+    POLICY_DEFINITIONS,
+    iface=os.environ.get("SENTINEL_IFACE", "eth0"),
+    link_bps=float(os.environ.get("SENTINEL_LINK_MBIT", "1000")) * 1e6,
+    dry_run=TC_MODE != "tc",
+    batch_path=os.environ.get("SENTINEL_TC_BATCH", "sentinel_qos.tc"),
+)
+
+
+def _class_demand_bps(window_s: int) -> Dict[str, float]:
+    """Observed load per tc classid (bit/s) over the last window_s seconds."""
+    return {str(c["classid"]): metrics_engine.rate(f"class:{c['metric_key']}", window_s=window_s) * 8
+            for c in tc_configurator.classes}
+
+
+# Per-class counters measured from the HTB classes. SENTINEL_TC_STATS=tc samples
+# `tc -s -j class show` on SENTINEL_IFACE; a file path reads that JSON from the
+# file instead (fixture replay). Unset keeps the simulated per-class numbers.
+TC_STATS_SOURCE = os.environ.get("SENTINEL_TC_STATS", "")
+TC_STATS_INTERVAL = float(os.environ.get("SENTINEL_TC_STATS_INTERVAL", "1.0"))
+tc_collector = (
+    TcCounterCollector([str(c["classid"]) for c in tc_configurator.classes], iface=tc_configurator.iface,
+                       fixture_path=None if TC_STATS_SOURCE == "tc" else TC_STATS_SOURCE)
+    if TC_STATS_SOURCE else None
+)
+_classid_metric_key = {str(c["classid"]): c["metric_key"] for c in tc_configurator.classes}
+
+
+def _record_class_counters(deltas: Dict[str, Dict[str, int]], ts: Optional[float] = None):
+    """Account measured per-class byte/packet deltas in the metrics engine and cumulative counters."""
+    for cid, delta in deltas.items():
+        metric_key = _classid_metric_key.get(cid)
+        if metric_key not in state["metrics"]:
+            continue
+        metrics_engine.record(f"class:{metric_key}", delta["bytes"], delta["packets"], ts)
+        state["metrics"][metric_key]["packets"] += delta["packets"]
+        state["metrics"][metric_key]["bandwidth"] += delta["bytes"]
+
+
+async def tc_stats_loop():
+    """Sample the HTB class counters every TC_STATS_INTERVAL seconds."""
+    loop = asyncio.get_event_loop()
+    failing = False
+    while True:
+        await asyncio.sleep(TC_STATS_INTERVAL)
+        try:
+            _, deltas = await loop.run_in_executor(None, tc_collector.sample)
+        except Exception as e:
+            # log the first failure of a streak only; this runs every second
+            if not failing:
+                state["classification_log"].insert(0, {"timestamp": "now", "message": f"tc counter sampling failed: {e}"})
+            failing = True
+            continue
+        failing = False
+        _record_class_counters(deltas)
+
+
+async def tc_loop():
+    """Install the HTB tree on startup, then resize classes every TC_INTERVAL seconds."""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            rates = await loop.run_in_executor(None, tc_configurator.apply, _class_demand_bps(TC_WINDOW))
+        except Exception as e:
+            state["classification_log"].insert(0, {"timestamp": "now", "message": f"tc update failed: {e}"})
+            rates = None
+        if rates:
+            msg = ", ".join(f"{cid}={r // 1000000}mbit" for cid, r in rates.items())
+            state["classification_log"].insert(0, {"timestamp": "now", "message": f"[{'TC' if not tc_configurator.dry_run else 'SIM'}] HTB rates: {msg}"})
+        await asyncio.sleep(TC_INTERVAL)
+
 # --- Pydantic Models for API Type Safety ---
 class Flow(BaseModel):
     id: str
@@ -100,6 +322,7 @@ class Flow(BaseModel):
     dest_port: int
     status: str
     app_type: Optional[str] = None
+    engine: Optional[str] = None
 
 class LogEntry(BaseModel):
     timestamp: str
@@ -141,14 +364,38 @@ class Suggestion(BaseModel):
     status: str = "pending"  # pending | approved | denied
 
 
+# Bounded, decayed counts of profile:app pairs; a suggestion fires once a pair
+# becomes a heavy hitter within roughly one half-life. min_count=1.8 keeps the
+# old "seen twice" behaviour for two sightings a few minutes apart.
+suggestion_sketch = HeavyHitterDetector(half_life_s=float(os.environ.get("SENTINEL_SUGGESTION_HALF_LIFE", "600")), min_count=1.8)
+# profile:app key -> its entry in state["suggestions"], least recently seen first. Both hold
+# the same suggestions, so a key is suggested once for as long as it is listed; past the cap
+# the least recently seen suggestion that is not approved leaves both.
+SUGGESTED_KEYS_MAX = int(os.environ.get("SENTINEL_SUGGESTED_KEYS_MAX", "4096"))
+_suggested_keys: "collections.OrderedDict[str, Dict[str, Any]]" = collections.OrderedDict()
+
+
+def _evict_suggestions():
+    while len(_suggested_keys) > SUGGESTED_KEYS_MAX:
+        # approved suggestions own a policy rule and stay listed so they can still be denied
+        key = next((k for k, s in _suggested_keys.items() if s["status"] != "approved"), None)
+        if key is None:
+            return
+        state["suggestions"].remove(_suggested_keys.pop(key))
+
+
 def _record_suggestion(profile_id: str, app: str, rationale: str):
-    # Create or increment a suggestion counter for recurring patterns
+    # Count recurring patterns in the sketch instead of an unbounded dict
     key = f"{profile_id}:{app}"
-    cnt = state.get("suggestion_counters", {}).get(key, 0) + 1
-    state.setdefault("suggestion_counters", {})[key] = cnt
-
-    # If seen at least twice, propose a suggestion
-    if cnt >= 2:
+    estimate, is_heavy = suggestion_sketch.observe(key)
+    cnt = int(round(estimate))
+
+    # Propose a suggestion once the pattern is a heavy hitter
+    if is_heavy:
+        if key in _suggested_keys:
+            # Avoid duplicates
+            _suggested_keys.move_to_end(key)
+            return _suggested_keys[key]
         sug_id = f"sugg_{int(time.time()*1000)}"
         suggestion = {
             "id": sug_id,
@@ -160,11 +407,10 @@ def _record_suggestion(profile_id: str, app: str, rationale: str):
             "votes": cnt,
             "status": "pending",
         }
-        # Avoid duplicates
-        existing = [s for s in state.get("suggestions", []) if s["profile_id"] == profile_id and s["suggested_app"] == app]
-        if not existing:
-            state["suggestions"].insert(0, suggestion)
-            state["classification_log"].insert(0, {"timestamp": "now", "message": f"New policy suggestion: {sug_id} for profile {profile_id} -> {app}"})
+        _suggested_keys[key] = suggestion
+        state["suggestions"].insert(0, suggestion)
+        _evict_suggestions()
+        state["classification_log"].insert(0, {"timestamp": "now", "message": f"New policy suggestion: {sug_id} for profile {profile_id} -> {app}"})
         return suggestion
     return None
 
@@ -174,14 +420,22 @@ async def list_suggestions():
     return state.get("suggestions", [])
 
 
+@app.get("/suggestions/heavy-hitters")
+async def suggestion_heavy_hitters():
+    """Recurring profile:app pairs currently tracked by the suggestion sketch."""
+    return [{"key": k, "count": round(c, 3)} for k, c in suggestion_sketch.heavy_hitters()]
+
+
 @app.post("/suggestions/{sugg_id}/approve")
 async def approve_suggestion(sugg_id: str):
     for s in state.get("suggestions", []):
         if s["id"] == sugg_id:
             s["status"] = "approved"
-            # When approved, add to policy_map as a named policy (demo only)
+            # When approved, add to policy_map as a named policy and compile a
+            # profile rule so matching flows skip Sentry/Vanguard
             policy_key = f"policy_suggested_{sugg_id}"
-            state["policy_map"][policy_key] = {"flow_id": policy_key, "app_type": s["suggested_app"], "dscp_class": s["suggested_dscp"], "tc_class": s["suggested_tc"], "explanation": s["rationale"]}
+            _put_policy(policy_key, {"flow_id": policy_key, "app_type": s["suggested_app"], "dscp_class": s["suggested_dscp"], "tc_class": s["suggested_tc"], "explanation": s["rationale"]})
+            policy_matcher.add_rule({"id": policy_key, "app_type": s["suggested_app"], "profile_id": s["profile_id"]})
             state["classification_log"].insert(0, {"timestamp": "now", "message": f"Suggestion {sugg_id} approved and new policy {policy_key} created."})
             return s
     return {"error": "not found"}
@@ -192,11 +446,65 @@ async def deny_suggestion(sugg_id: str):
     for s in state.get("suggestions", []):
         if s["id"] == sugg_id:
             s["status"] = "denied"
+            # Denying a previously approved suggestion withdraws its rule
+            policy_key = f"policy_suggested_{sugg_id}"
+            if policy_matcher.remove_rule(policy_key) is not None:
+                policy_store.remove(policy_key)
             state["classification_log"].insert(0, {"timestamp": "now", "message": f"Suggestion {sugg_id} denied."})
             return s
     return {"error": "not found"}
 
 
+# --- Operator-defined policy rules ---
+# Approved suggestions and operator rules are compiled into policy_matcher;
+# /classify consults it before Sentry and Vanguard.
+policy_matcher = PolicyMatcher()
+_rule_counter = 0
+
+
+class PolicyRuleSpec(BaseModel):
+    app_type: str
+    src_cidr: Optional[str] = None
+    dst_cidr: Optional[str] = None
+    port_min: Optional[int] = None
+    port_max: Optional[int] = None
+    protocol: Optional[str] = None
+    profile_id: Optional[str] = None
+    priority: int = 0
+
+
+@app.get("/admin/policy-rules")
+async def list_policy_rules(authorized: bool = Depends(require_admin)):
+    return list(policy_matcher.rules.values())
+
+
+@app.post("/admin/policy-rules")
+async def add_policy_rule(spec: PolicyRuleSpec, authorized: bool = Depends(require_admin)):
+    """Compile an operator rule; matching flows are classified without Sentry/Vanguard."""
+    global _rule_counter
+    policy = POLICY_DEFINITIONS.get(spec.app_type)
+    if policy is None:
+        raise HTTPException(status_code=400, detail=f"app_type must be one of {TRAFFIC_TYPES}")
+    _rule_counter += 1
+    rule_id = f"policy_rule_{_rule_counter}"
+    try:
+        rule = policy_matcher.add_rule({"id": rule_id, **spec.dict()})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _put_policy(rule_id, {"flow_id": rule_id, "app_type": spec.app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": "Operator-defined rule"})
+    state["classification_log"].insert(0, {"timestamp": "now", "message": f"Policy rule {rule_id} added for {spec.app_type}."})
+    return rule
+
+
+@app.delete("/admin/policy-rules/{rule_id}")
+async def delete_policy_rule(rule_id: str, authorized: bool = Depends(require_admin)):
+    rule = policy_matcher.remove_rule(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail="rule not found")
+    policy_store.remove(rule_id)
+    return rule
+
+
 class SystemStatus(BaseModel):
     active_flows: List[Flow]
     classification_log: List[LogEntry]
@@ -215,6 +523,8 @@ class FlowFeatures(BaseModel):
     duration_seconds: float
     bytes_total: int
     protocol: Optional[str] = None
+    # TLS SNI or DNS-derived name of the destination (pcap_ingest), matched against the domain rules
+    hostname: Optional[str] = None
 
 
 class ClassificationResult(BaseModel):
@@ -264,13 +574,11 @@ def compute_shap_map(features: FlowFeatures) -> Optional[Dict[str, float]]:
         if _np is None or ('SENTRY_EXPLAINER' in globals() and globals().get('SENTRY_EXPLAINER') is None):
             return None
 
-        fv = _np.array([[
-            features.packet_count,
-            features.avg_pkt_len,
-            features.duration_seconds,
-            features.bytes_total,
-            features.dest_port,
-        ]])
+        # the explainer sees what the model sees: the model's feature pipeline output
+        model_features = sentry_features([features.dict()])
+        if model_features is None:
+            return None
+        model_columns, fv = model_features
         sv = None
         try:
             sv = SENTRY_EXPLAINER.shap_values(fv)
@@ -293,7 +601,7 @@ def compute_shap_map(features: FlowFeatures) -> Optional[Dict[str, float]]:
         except Exception:
             feature_names = []
         if not feature_names:
-            feature_names = ['packet_count', 'avg_pkt_len', 'duration_seconds', 'bytes_total', 'dest_port']
+            feature_names = list(model_columns)
 
         # Normalize shap values
         try:
@@ -312,57 +620,17 @@ def compute_shap_map(features: FlowFeatures) -> Optional[Dict[str, float]]:
         return None
 
 # --- Core Simulation Logic ---
-def apply_iptables_rule(source_ip: str, dest_ip: str, dest_port: int, dscp_class: str):
-    """Simulate applying an iptables DSCP mark for a flow.
-
-    On Linux with appropriate privileges this could run iptables/tc. For this
-    prototype (and when running on macOS) we only log the intended action so
-    the orchestrator remains runnable without root privileges.
-    """
-    msg = f"[SIM] Mark {source_ip}->{dest_ip}:{dest_port} as DSCP={dscp_class}"
-    print(msg)
-    # Keep a copy in the in-memory log for the frontend to show
-    state["classification_log"].insert(0, {"timestamp": "now", "message": msg})
-    # If running on Linux and the user wants to enable real marking, they can
-    # replace this block with a subprocess call to iptables/tc and ensure sudo.
-
-
 def sentry_predict(features: FlowFeatures) -> ClassificationResult:
     """Lightweight fast classifier (Sentry).
 
-    Tries to use LightGBM if available (model file 'sentry_model.joblib').
-    If not available, falls back to a fast heuristic that returns a label
-    and a confidence score.
+    Uses the loaded Sentry model (see init_sentry), whose feature pipeline
+    builds its inputs. If no model is loaded, falls back to a fast heuristic
+    that returns a label and a confidence score.
     """
-    # Try to load a pre-trained model if present
-    if HAS_JOBLIB and joblib is not None:
-        try:
-            model = None
-            try:
-                try:
-                    model = joblib.load("sentry_model.joblib")
-                except Exception:
-                    model = joblib.load("sentry_model.pkl")
-            except Exception:
-                model = None
-            if model is not None:
-                # convert features to the expected feature vector
-                fv = [
-                    features.packet_count,
-                    features.avg_pkt_len,
-                    features.duration_seconds,
-                    features.bytes_total,
-                    features.dest_port,
-                ]
-                # model must implement predict_proba
-                probs = model.predict_proba([fv])[0]
-                best_idx = int(probs.argmax())
-                label = model.classes_[best_idx]
-                confidence = float(probs[best_idx])
-                return ClassificationResult(flow_id="", app_type=label, confidence=confidence, engine=None)
-        except Exception:
-            # silent fallback to heuristic
-            pass
+    predictions = sentry_predict_batch([features.dict()])
+    if predictions:
+        label, confidence = predictions[0]
+        return ClassificationResult(flow_id="", app_type=label, confidence=confidence, engine=None)
 
     # Heuristic fallback logic
     # Video: large avg packet and sustained bytes
@@ -438,14 +706,36 @@ def vanguard_query_llm(features: FlowFeatures, prompt_text: Optional[str] = None
     return ClassificationResult(flow_id="", app_type=chosen, confidence=confidence, explanation=explanation, engine=None)
 
 
+# Load-generator mode for capacity testing: SENTINEL_SIM_RATE (flows/s) or POST /admin/simulate rate=...
+SIM_RATE = float(os.environ.get("SENTINEL_SIM_RATE", "0"))
+SIM_BATCH = int(os.environ.get("SENTINEL_SIM_BATCH", "1000"))
+load_generator: Optional[LoadGenerator] = None
+
+
+async def _loadgen_sink(batch: List[Dict[str, Any]]):
+    # synthetic flows never reach the LLM: one real call per escalated flow would measure Ollama, not the pipeline
+    await classify_flow_batch(batch, "loadgen", simulate_vanguard=True)
+
+
+async def _set_load_rate(rate: float):
+    """Replace the running load generator; a rate of 0 goes back to the slow demo loop."""
+    global load_generator
+    if load_generator is not None:
+        await load_generator.stop()
+        load_generator = None
+    if rate > 0:
+        load_generator = LoadGenerator(_loadgen_sink, rate, batch_size=SIM_BATCH)
+        load_generator.start()
+
+
 async def simulate_traffic():
     """Main simulation loop to generate and classify traffic."""
     flow_counter = 0
     while True:
         await asyncio.sleep(random.uniform(2, 5))
 
-        # respect admin toggle
-        if not state.get("admin", {}).get("simulate_enabled", True):
+        # respect admin toggle; in load-generator mode the generator replaces this loop
+        if not state.get("admin", {}).get("simulate_enabled", True) or load_generator is not None:
             await asyncio.sleep(1)
             continue
 
@@ -466,7 +756,7 @@ async def simulate_traffic():
         }
 
         # Save flow and log detection
-        state["active_flows"][flow_id] = flow
+        _put_flow(flow)
         state["classification_log"].insert(0, {"timestamp": "now", "message": f"New flow detected: {source_ip} -> {dest_ip}"})
 
         # Simulate AI classification delay
@@ -485,25 +775,273 @@ async def simulate_traffic():
 
         # Apply the corresponding QoS policy (simulated)
         policy = POLICY_DEFINITIONS[predicted_app]
-        apply_iptables_rule(source_ip, dest_ip, dest_port, policy["dscp_class"])
 
         # Update state with applied policy
         flow["status"] = "Policy Applied"
         flow["app_type"] = predicted_app
         # Mark that this simulated decision came from the fast Sentry path
         flow["engine"] = "Sentry"
-        state["policy_map"][flow_id] = {
+        _put_flow(flow)
+        _put_policy(flow_id, {
             "flow_id": flow_id,
             "app_type": predicted_app,
             "dscp_class": policy["dscp_class"],
             "tc_class": policy["tc_class"],
-        }
+        })
 
         # Simulate traffic metrics
-        metric_key = policy.get("metric_key")
-        if metric_key and metric_key in state["metrics"]:
-            state["metrics"][metric_key]["packets"] += random.randint(50, 200)
-            state["metrics"][metric_key]["bandwidth"] += random.randint(1000, 5000)
+        _record_traffic(predicted_app, random.randint(1000, 5000), random.randint(50, 200))
+
+
+_batch_counter = 0
+LOG_LIMIT = int(os.environ.get("SENTINEL_LOG_LIMIT", "1000"))
+
+
+async def classify_flow_batch(features_list: List[Dict[str, Any]], source: str,
+                              simulate_vanguard: bool = False) -> List[Dict[str, Any]]:
+    """Classify FlowFeatures dicts from a bulk source and record flows, policies and metrics.
+
+    Policy rules are checked first; everything else goes through one
+    batched hybrid classifier call in a worker thread (`simulate_vanguard`
+    is passed on to it). Returns one
+    {flow_id, app_type, confidence, explanation, engine} dict per input.
+    """
+    global _batch_counter
+    _batch_counter += 1
+    prefix = f"{source}_{_batch_counter}"
+    results: List[Optional[Dict[str, Any]]] = [None] * len(features_list)
+    pending: List[int] = []
+    for i, features in enumerate(features_list):
+        rule = policy_matcher.match(features, profile_fingerprint(features)) if len(policy_matcher) else None
+        if rule is not None:
+            results[i] = {"classification": rule["app_type"], "confidence": 1.0, "explanation": f"Matched policy rule {rule['id']}", "engine": "Policy"}
+        else:
+            pending.append(i)
+    if pending:
+        loop = asyncio.get_event_loop()
+        classified = await loop.run_in_executor(None, hybrid_classify_batch, [features_list[i] for i in pending], simulate_vanguard)
+        for i, result in zip(pending, classified):
+            results[i] = result
+
+    out = []
+    engines: Dict[str, int] = {}
+    for i, (features, result) in enumerate(zip(features_list, results)):
+        flow_id = f"{prefix}_{i}"
+        app_type = str(result.get("classification") or "Unknown")
+        engine = str(result.get("engine") or "Vanguard")
+        explanation = result.get("explanation")
+        engines[engine] = engines.get(engine, 0) + 1
+        _count_engine(engine)
+        if engine == "Vanguard":
+            _harvest(features, app_type, result.get("confidence"), bool(result.get("simulated")))
+            state["investigations"].insert(0, {
+                "flow_id": flow_id, "features": features, "sentry_prediction": None, "sentry_confidence": None,
+                "vanguard_prediction": app_type, "vanguard_confidence": result.get("confidence"),
+                "vanguard_explanation": explanation, "timestamp": "now", "shap": None,
+            })
+            _record_suggestion(profile_fingerprint(features), app_type, explanation or "")
+        # flow first, so the policy is indexed and marked once
+        _put_flow({"id": flow_id, "source_ip": features["source_ip"], "dest_ip": features["dest_ip"], "dest_port": features["dest_port"], "status": "Policy Applied", "app_type": app_type, "engine": engine})
+        policy = POLICY_DEFINITIONS.get(app_type)
+        if policy:
+            _put_policy(flow_id, {"flow_id": flow_id, "app_type": app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": explanation})
+        _record_traffic(app_type, features.get("bytes_total", 0), features.get("packet_count", 0))
+        out.append({"flow_id": flow_id, "app_type": app_type, "confidence": float(result.get("confidence") or 0.0), "explanation": explanation, "engine": engine})
+    summary = ", ".join(f"{n} via {e}" for e, n in sorted(engines.items()))
+    state["classification_log"].insert(0, {"timestamp": "now", "message": f"Classified {len(out)} {source} flows ({summary})"})
+    # bulk sources would otherwise grow these lists without bound
+    del state["classification_log"][LOG_LIMIT:]
+    del state["investigations"][LOG_LIMIT:]
+    return out
+
+
+# Optional recording of /classify inputs for replay (see traffic_replay.py). /classify only
+# buffers records; gzip and file writes run on one worker thread, when the buffer fills and
+# every flush_seconds from recording_loop.
+RECORD_DIR = os.environ.get("SENTINEL_RECORD_DIR")
+classify_recorder = SegmentRecorder(RECORD_DIR) if RECORD_DIR else None
+_record_executor = ThreadPoolExecutor(max_workers=1)
+_record_flush: Optional[asyncio.Future] = None
+
+
+def _flush_recording() -> None:
+    """Start a recorder flush on the worker thread unless one is already running."""
+    global _record_flush
+    if _record_flush is None or _record_flush.done():
+        _record_flush = asyncio.get_event_loop().run_in_executor(_record_executor, classify_recorder.flush)
+
+
+async def recording_loop():
+    """Flush buffered /classify records at least every flush_seconds, whether or not requests arrive."""
+    while True:
+        await asyncio.sleep(classify_recorder.flush_seconds)
+        _flush_recording()
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.environ.get(name, "")
+    return float(value) if value else None
+
+
+# Sentry -> Vanguard escalation budget (see escalation_control.py). SENTINEL_ESCALATION_TARGET is the
+# share of flows allowed to escalate, SENTINEL_LLM_BUDGET_CPS a hard cap on Vanguard calls per second;
+# per-class thresholds stay within [SENTINEL_THRESHOLD_MIN, SENTINEL_THRESHOLD_MAX]. With neither
+# set every class uses the fixed SENTRY_CONFIDENCE_THRESHOLD. Adjustable at runtime via POST /admin/escalation.
+escalation_controller = EscalationController(
+    target_rate=_env_float("SENTINEL_ESCALATION_TARGET"), llm_budget_cps=_env_float("SENTINEL_LLM_BUDGET_CPS"),
+    min_threshold=float(os.environ.get("SENTINEL_THRESHOLD_MIN", "0.5")),
+    max_threshold=float(os.environ.get("SENTINEL_THRESHOLD_MAX", "0.9999")),
+    default_threshold=SENTRY_CONFIDENCE_THRESHOLD)
+set_escalation_controller(escalation_controller)
+# Cascade rule tier (see cascade.py): signatures below this confidence are skipped; above 1 disables the tier
+if os.environ.get("SENTINEL_RULE_GATE"):
+    set_rule_gate(float(os.environ["SENTINEL_RULE_GATE"]))
+# Hostname rules of the rule tier (see hostname_enrichment.py): a JSON list of {"domain", "app_type"[, "confidence"]}
+# replacing the model's or the built-in ones
+if os.environ.get("SENTINEL_DOMAIN_RULES"):
+    with open(os.environ["SENTINEL_DOMAIN_RULES"]) as _fh:
+        set_domain_rules(json.load(_fh))
+
+# Cascade destination index (see destination_index.py): dest ip/prefix:port -> app_type learned from confident
+# Sentry/Vanguard answers, saved to SENTINEL_DEST_INDEX_PATH every SENTINEL_DEST_INDEX_SAVE_INTERVAL seconds
+# and cleared when the model changes. SENTINEL_DEST_INDEX=0 disables it.
+destination_index: Optional[DestinationIndex] = None
+DEST_INDEX_SAVE_INTERVAL = float(os.environ.get("SENTINEL_DEST_INDEX_SAVE_INTERVAL", "60"))
+if os.environ.get("SENTINEL_DEST_INDEX", "1") not in ("0", "false", "no"):
+    destination_index = DestinationIndex(
+        os.environ.get("SENTINEL_DEST_INDEX_PATH", os.path.join(STATE_DIR, "destination_index.json")),
+        max_entries=int(os.environ.get("SENTINEL_DEST_INDEX_MAX", "100000")),
+        half_life=float(os.environ.get("SENTINEL_DEST_INDEX_HALF_LIFE", "3600")),
+        min_support=float(os.environ.get("SENTINEL_DEST_INDEX_MIN_SUPPORT", "5")),
+        min_agreement=float(os.environ.get("SENTINEL_DEST_INDEX_MIN_AGREEMENT", "0.95")))
+    set_destination_index(destination_index)
+
+
+def _model_key() -> Optional[str]:
+    """Identity of the serving model (loaded file and its mtime), or None when no model is loaded."""
+    payload = sentry_payload()
+    if payload is None:
+        return None
+    path = payload.get("artifact") or MODEL_PATH
+    try:
+        return f"{os.path.basename(path)}@{os.path.getmtime(path):.3f}"
+    except OSError:
+        return f"generation-{payload.get('generation', 0)}"
+
+
+async def destination_index_loop():
+    """Save the destination index every DEST_INDEX_SAVE_INTERVAL seconds."""
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(DEST_INDEX_SAVE_INTERVAL)
+        try:
+            await loop.run_in_executor(None, destination_index.save)
+        except OSError as e:
+            state["classification_log"].insert(0, {"timestamp": "now", "message": f"Saving destination index failed: {e}"})
+
+
+# Continual retraining of Sentry from confident Vanguard labels (see continual_training.py).
+# Labels are harvested on every escalation; every SENTINEL_RETRAIN_INTERVAL seconds (0 = only on
+# POST /admin/retrain), once SENTINEL_RETRAIN_MIN_ROWS new labels exist, a candidate model is
+# trained on the base CSV plus the harvest and hot-swapped in if it beats the serving model.
+MODEL_PATH = os.environ.get("SENTINEL_MODEL_PATH", "sentry_model.pkl")
+RETRAIN_BASE_CSV = os.environ.get("SENTINEL_RETRAIN_BASE_CSV", "training_data.csv")
+RETRAIN_INTERVAL = float(os.environ.get("SENTINEL_RETRAIN_INTERVAL", "3600"))
+RETRAIN_MIN_ROWS = int(os.environ.get("SENTINEL_RETRAIN_MIN_ROWS", "200"))
+label_harvester = LabelHarvester(os.environ.get("SENTINEL_HARVEST_PATH", os.path.join(STATE_DIR, "vanguard_labels.ndjson")),
+                                 min_confidence=float(os.environ.get("SENTINEL_HARVEST_MIN_CONF", "0.9")))
+# escalations: model generation -> {engine: decisions}, so the escalation rate of each model can be compared
+retraining: Dict[str, Any] = {"generation": 0, "last_seq": 0, "running": False, "reports": [], "escalations": {}}
+
+
+def _count_engine(engine: str):
+    if engine in ("Sentry", "Vanguard"):
+        counts = retraining["escalations"].setdefault(retraining["generation"], {"Sentry": 0, "Vanguard": 0})
+        counts[engine] += 1
+
+
+def _harvest(features: Dict[str, Any], app_type: str, confidence: Optional[float], simulated: bool = False):
+    """Keep a Vanguard label as retraining data; simulated answers are never harvested."""
+    if simulated or app_type == "Unknown":
+        return
+    try:
+        label_harvester.add(features, app_type, float(confidence or 0.0))
+    except OSError as e:
+        state["classification_log"].insert(0, {"timestamp": "now", "message": f"Label harvest failed: {e}"})
+
+
+def _sync_generation():
+    payload = sentry_payload()
+    retraining["generation"] = int((payload or {}).get("generation", 0))
+    # destination index entries are the previous model's decisions
+    if destination_index is not None and destination_index.set_model_key(_model_key()):
+        state["classification_log"].insert(0, {"timestamp": "now", "message": "Destination index cleared: Sentry model changed"})
+
+
+def _retrain_job() -> Dict[str, Any]:
+    """Train, validate and (if better) save and load a candidate Sentry model; runs in a worker thread."""
+    rows = list(label_harvester.rows)
+    current = sentry_payload()
+    if current is not None and current.get("artifact"):
+        # the mapped artifact cannot be boosted further; warm-start from its pickle when that is the same model
+        try:
+            pickled = joblib.load(MODEL_PATH)
+            if (pickled.get("generation") == current.get("generation")
+                    and list(pickled.get("feature_columns") or []) == list(current["feature_columns"])):
+                current = pickled
+        except Exception:
+            pass
+    candidate, report = retrain(RETRAIN_BASE_CSV, rows, current, escalate_below=SENTRY_CONFIDENCE_THRESHOLD)
+    report["harvest_seq"] = rows[-1]["seq"] if rows else 0
+    if candidate is not None:
+        save_payload(candidate, MODEL_PATH, {"metrics": report["candidate"]})
+        init_sentry(MODEL_PATH)
+        report["generation"] = candidate["generation"]
+    return report
+
+
+async def _run_retrain() -> Dict[str, Any]:
+    if retraining["running"]:
+        raise HTTPException(status_code=409, detail="retraining already running")
+    retraining["running"] = True
+    try:
+        report = await asyncio.get_event_loop().run_in_executor(None, _retrain_job)
+    except Exception as e:
+        report = {"error": str(e), "started": time.time()}
+    finally:
+        retraining["running"] = False
+    if "error" in report:
+        message = f"Sentry retraining failed: {report['error']}"
+    else:
+        retraining["last_seq"] = report["harvest_seq"]
+        _sync_generation()
+        verdict = f"deployed generation {report['generation']}" if report["accepted"] else "kept current model"
+        message = (f"Sentry retraining on {report['usable_harvested_rows']} harvested labels: {verdict} "
+                   f"(holdout {report['candidate']} vs {report.get('current')})")
+    retraining["reports"].insert(0, report)
+    del retraining["reports"][20:]
+    state["classification_log"].insert(0, {"timestamp": "now", "message": message})
+    return report
+
+
+async def retrain_loop():
+    while True:
+        await asyncio.sleep(RETRAIN_INTERVAL)
+        if not retraining["running"] and label_harvester.since(retraining["last_seq"]) >= RETRAIN_MIN_ROWS:
+            await _run_retrain()
+
+
+# NetFlow v5/v9/IPFIX listener, enabled by setting SENTINEL_NETFLOW_PORT (e.g. 2055)
+NETFLOW_PORT = os.environ.get("SENTINEL_NETFLOW_PORT")
+NETFLOW_HOST = os.environ.get("SENTINEL_NETFLOW_HOST", "0.0.0.0")
+netflow_collector = None
+
+
+async def _netflow_sink(batch: List[Dict[str, Any]]):
+    try:
+        await classify_flow_batch(batch, "netflow")
+    except Exception as e:
+        state["classification_log"].insert(0, {"timestamp": "now", "message": f"NetFlow batch failed: {e}"})
 
 
 @app.on_event("startup")
@@ -512,34 +1050,209 @@ async def startup_event():
     # initialize Sentry model (non-blocking if model missing)
     loop = asyncio.get_event_loop()
     # run init_sentry in executor to avoid blocking startup if joblib load is slow
-    await loop.run_in_executor(None, init_sentry)
+    await loop.run_in_executor(None, init_sentry, MODEL_PATH)
+    if destination_index is not None:
+        await loop.run_in_executor(None, destination_index.load, _model_key())
+        if DEST_INDEX_SAVE_INTERVAL > 0:
+            asyncio.create_task(destination_index_loop())
+    _sync_generation()
     asyncio.create_task(simulate_traffic())
+    if SIM_RATE > 0 and state["admin"].get("simulate_enabled", True):
+        await _set_load_rate(SIM_RATE)
+    asyncio.create_task(reconcile_loop())
+    asyncio.create_task(tc_loop())
+    if classify_recorder is not None:
+        asyncio.create_task(recording_loop())
+    if RETRAIN_INTERVAL > 0:
+        asyncio.create_task(retrain_loop())
+    if tc_collector is not None:
+        asyncio.create_task(tc_stats_loop())
+    if NETFLOW_PORT:
+        global netflow_collector
+        netflow_collector = await start_netflow_collector(NETFLOW_HOST, int(NETFLOW_PORT), _netflow_sink,
+                                                          batch_size=int(os.environ.get("SENTINEL_NETFLOW_BATCH", "1024")))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if classify_recorder is not None:
+        await asyncio.get_event_loop().run_in_executor(_record_executor, classify_recorder.close)
+    if destination_index is not None:
+        try:
+            destination_index.save()
+        except OSError:
+            pass
 
 
 # --- Admin endpoints (minimal) ---
 @app.post("/admin/simulate")
-async def set_simulation(enabled: bool = Form(...), authorized: bool = Depends(require_admin)):
-    """Enable or disable background traffic simulation."""
+async def set_simulation(enabled: bool = Form(...), rate: Optional[float] = Form(None),
+                         authorized: bool = Depends(require_admin)):
+    """Enable or disable background traffic simulation.
+
+    With `rate` (flows/s) > 0 the simulation runs as a load generator that
+    feeds synthetic flows through the real classification and policy path;
+    `rate=0` returns to the slow demo loop.
+    """
     state.setdefault("admin", {})["simulate_enabled"] = bool(enabled)
-    return {"simulate_enabled": state["admin"]["simulate_enabled"]}
+    if rate is not None:
+        if rate < 0:
+            raise HTTPException(status_code=400, detail="rate must be >= 0")
+        state["admin"]["simulate_rate"] = rate
+    target = state["admin"].get("simulate_rate", SIM_RATE) if enabled else 0.0
+    if load_generator is None or load_generator.rate != target:
+        await _set_load_rate(target)
+    return {"simulate_enabled": state["admin"]["simulate_enabled"],
+            "load_generator": load_generator.snapshot() if load_generator is not None else None}
+
+
+@app.get("/admin/simulate")
+async def simulation_status(authorized: bool = Depends(require_admin)):
+    """Load-generator counters: target and achieved rate, lag behind schedule, dropped flows."""
+    return {"simulate_enabled": state["admin"].get("simulate_enabled", True),
+            "load_generator": load_generator.snapshot() if load_generator is not None else None}
+
+
+# pickle uploads execute code on load; set SENTINEL_ALLOW_PICKLE_UPLOAD=0 to accept only model artifacts
+ALLOW_PICKLE_UPLOAD = os.environ.get("SENTINEL_ALLOW_PICKLE_UPLOAD", "1") not in ("0", "false", "no")
+
+
+def _install_artifact(contents: bytes) -> str:
+    """Validate an uploaded artifact by loading and evaluating it, then move it into place."""
+    out_path = artifact_path(MODEL_PATH)
+    tmp = out_path + ".upload"
+    with open(tmp, "wb") as fh:
+        fh.write(contents)
+    try:
+        model = ArtifactModel.load(tmp)
+        model.predict_proba([[0.0] * len(model.feature_columns)])
+    except Exception:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, out_path)
+    return out_path
 
 
 @app.post("/admin/upload-model")
 async def upload_model(file: UploadFile = File(...), authorized: bool = Depends(require_admin)):
-    """Upload a sentry model payload (joblib/.pkl). Saves to working dir as sentry_model.pkl"""
+    """Upload a Sentry model: a model artifact (.sentry, preferred) or a joblib/.pkl payload.
+
+    Artifacts are saved next to SENTINEL_MODEL_PATH (default sentry_model.pkl)
+    as sentry_model.sentry, pickles to SENTINEL_MODEL_PATH itself; the model
+    is reloaded either way.
+    """
     contents = await file.read()
-    out_path = "sentry_model.pkl"
+    loop = asyncio.get_event_loop()
     try:
-        with open(out_path, "wb") as fh:
-            fh.write(contents)
+        if is_artifact(contents):
+            out_path = await loop.run_in_executor(None, _install_artifact, contents)
+        elif not ALLOW_PICKLE_UPLOAD:
+            raise HTTPException(status_code=400, detail="pickle uploads are disabled; upload a .sentry model artifact")
+        else:
+            out_path = MODEL_PATH
+            with open(out_path, "wb") as fh:
+                fh.write(contents)
+            # the uploaded pickle replaces the model, so an older artifact must not shadow it
+            if os.path.exists(artifact_path(MODEL_PATH)):
+                os.remove(artifact_path(MODEL_PATH))
         # Attempt to re-init sentry in executor
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, init_sentry)
+        loaded = await loop.run_in_executor(None, init_sentry, MODEL_PATH)
+        _sync_generation()
+        if loaded is None or loaded.model is None:
+            return {"saved": out_path, "error": (loaded.error if loaded is not None else None) or "model did not load"}
         return {"saved": out_path}
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/admin/retraining")
+async def retraining_status(authorized: bool = Depends(require_admin)):
+    """Harvested label counts, recent retraining reports and the escalation rate of each model generation."""
+    escalations = {gen: {**c, "escalation_rate": round(c["Vanguard"] / max(1, c["Sentry"] + c["Vanguard"]), 4)}
+                   for gen, c in retraining["escalations"].items()}
+    return {"generation": retraining["generation"], "running": retraining["running"],
+            "harvested": len(label_harvester.rows), "pending": label_harvester.since(retraining["last_seq"]),
+            "harvest_stats": label_harvester.stats, "escalations": escalations, "reports": retraining["reports"]}
+
+
+@app.post("/admin/retrain")
+async def trigger_retrain(authorized: bool = Depends(require_admin)):
+    """Retrain Sentry on the base data plus harvested labels now; deploys the candidate only if it validates better."""
+    return await _run_retrain()
+
+
+@app.get("/admin/cascade")
+async def cascade_stats_endpoint(authorized: bool = Depends(require_admin)):
+    """Per-tier (rules, sentry, vanguard) flows offered and resolved, hit rate and mean latency, plus the tier gates."""
+    return {**cascade_status(), "sentry_gate": {"default": escalation_controller.default_threshold,
+                                                 "per_class": dict(escalation_controller.thresholds)}}
+
+
+@app.post("/admin/cascade")
+async def set_cascade(rule_gate: float = Form(...), authorized: bool = Depends(require_admin)):
+    """Set the rule tier's confidence gate; values above 1 disable the tier."""
+    if rule_gate < 0:
+        raise HTTPException(status_code=400, detail="rule_gate must be >= 0")
+    set_rule_gate(rule_gate)
+    state["classification_log"].insert(0, {"timestamp": "now", "message": f"Cascade rule gate set to {rule_gate}"})
+    return cascade_status()
+
+
+@app.get("/admin/destination-index")
+async def destination_index_status(limit: int = Query(20, ge=0, le=1000), authorized: bool = Depends(require_admin)):
+    """Destination index size, hit rate and thresholds, and its best-supported destinations."""
+    if destination_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **destination_index.snapshot(), "top": destination_index.top(limit)}
+
+
+@app.delete("/admin/destination-index")
+async def clear_destination_index(authorized: bool = Depends(require_admin)):
+    """Forget all learned destinations."""
+    if destination_index is None:
+        raise HTTPException(status_code=404, detail="destination index is disabled")
+    destination_index.invalidate()
+    state["classification_log"].insert(0, {"timestamp": "now", "message": "Destination index cleared by admin"})
+    return destination_index.snapshot()
+
+
+@app.get("/admin/escalation")
+async def escalation_status(authorized: bool = Depends(require_admin)):
+    """Escalation targets, current per-class Sentry thresholds, observed rates and recent threshold changes."""
+    return escalation_controller.snapshot()
+
+
+@app.post("/admin/escalation")
+async def set_escalation(target_rate: Optional[float] = Form(None), llm_budget_cps: Optional[float] = Form(None),
+                         min_threshold: Optional[float] = Form(None), max_threshold: Optional[float] = Form(None),
+                         clear: bool = Form(False), authorized: bool = Depends(require_admin)):
+    """Set the escalation rate target and/or LLM calls/s budget and the threshold bounds.
+
+    Omitted fields keep their value; `clear=true` removes both targets,
+    returning to the fixed threshold, before applying the others.
+    """
+    if target_rate is not None and not 0.0 <= target_rate <= 1.0:
+        raise HTTPException(status_code=400, detail="target_rate must be between 0 and 1")
+    if llm_budget_cps is not None and llm_budget_cps < 0:
+        raise HTTPException(status_code=400, detail="llm_budget_cps must be >= 0")
+    low = escalation_controller.min_threshold if min_threshold is None else min_threshold
+    high = escalation_controller.max_threshold if max_threshold is None else max_threshold
+    if not 0.0 <= low <= high <= 1.0:
+        raise HTTPException(status_code=400, detail="thresholds must satisfy 0 <= min_threshold <= max_threshold <= 1")
+    settings: Dict[str, Any] = {"min_threshold": low, "max_threshold": high}
+    if clear:
+        settings.update(target_rate=None, llm_budget_cps=None)
+    if target_rate is not None:
+        settings["target_rate"] = target_rate
+    if llm_budget_cps is not None:
+        settings["llm_budget_cps"] = llm_budget_cps
+    escalation_controller.configure(**settings)
+    state["classification_log"].insert(0, {"timestamp": "now", "message": f"Escalation settings changed: {settings}"})
+    return escalation_controller.snapshot()
+
+
 @app.get("/admin/llm-health")
 async def llm_health():
     """Lightweight public health endpoint for the local LLM runtime used by Vanguard.
@@ -576,6 +1289,29 @@ async def llm_health():
         return {"ollama_installed": True, "model_present": False, "models": []}
 
 
+@app.get("/admin/enforcement")
+async def enforcement_status(authorized: bool = Depends(require_admin)):
+    """Enforcement batch counters, reconciler state and the current HTB class rates."""
+    return {"mode": "nft" if not enforcer.dry_run else "dry-run", "enforcer": enforcer.stats, "reconciler": reconciler.stats,
+            "tc": {"mode": "tc" if not tc_configurator.dry_run else "dry-run", "rates": tc_configurator.applied, **tc_configurator.stats},
+            "tc_counters": tc_collector.stats if tc_collector is not None else None}
+
+
+@app.get("/admin/enforcement/ruleset", response_class=PlainTextResponse)
+async def enforcement_ruleset(authorized: bool = Depends(require_admin)):
+    """Full nft ruleset for the marks currently applied, as `nft -f` would load it on a cold start."""
+    return enforcer.render_ruleset()
+
+
+@app.get("/admin/netflow")
+async def netflow_status(authorized: bool = Depends(require_admin)):
+    """NetFlow/IPFIX collector counters (decoded records, templates, batches, pauses)."""
+    if netflow_collector is None:
+        return {"enabled": False}
+    return {"enabled": True, "port": int(NETFLOW_PORT), "decoder": netflow_collector.decoder.stats,
+            "queue_depth": netflow_collector.queue.qsize(), **netflow_collector.stats}
+
+
 @app.get("/admin/llm-settings")
 async def get_llm_settings(authorized: bool = Depends(require_admin)):
     admin = state.get("admin", {})
@@ -596,6 +1332,20 @@ async def classify_flow(features: FlowFeatures):
     Returns ClassificationResult with app_type, confidence, explanation and engine.
     """
     flow_id = f"manual_{int(time.time()*1000)}"
+    if classify_recorder is not None and classify_recorder.record(features.dict()):
+        _flush_recording()
+
+    # Approved/operator rules short-circuit both Sentry and Vanguard
+    rule = policy_matcher.match(features.dict(), profile_fingerprint(features.dict())) if len(policy_matcher) else None
+    if rule is not None:
+        explanation = f"Matched policy rule {rule['id']}"
+        policy = POLICY_DEFINITIONS.get(rule["app_type"])
+        if policy:
+            _put_policy(flow_id, {"flow_id": flow_id, "app_type": rule["app_type"], "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": explanation})
+        _put_flow({"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": rule["app_type"], "engine": "Policy"})
+        _record_traffic(rule["app_type"], features.bytes_total, features.packet_count)
+        state["classification_log"].insert(0, {"timestamp": "now", "message": f"Policy rule {rule['id']} classified {flow_id} as {rule['app_type']}"})
+        return ClassificationResult(flow_id=flow_id, app_type=rule["app_type"], confidence=1.0, explanation=explanation, engine="Policy")
 
     # Call the hybrid classifier implemented in sentinel_ai_classifier
     try:
@@ -606,13 +1356,14 @@ async def classify_flow(features: FlowFeatures):
         # As a fallback, run the existing sentry + vanguard flow
         sentry_res = sentry_predict(features)
         shap_map = compute_shap_map(features)
-        if sentry_res.confidence >= 0.95:
+        if escalation_controller.decide(sentry_res.app_type, sentry_res.confidence) != ESCALATE:
             explanation = f"Sentry auto-accepted (conf={sentry_res.confidence:.2f})"
             policy = POLICY_DEFINITIONS.get(sentry_res.app_type, None)
             if policy:
-                state["policy_map"][flow_id] = {"flow_id": flow_id, "app_type": sentry_res.app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": explanation}
-                apply_iptables_rule(features.source_ip, features.dest_ip, features.dest_port, policy["dscp_class"])
-            state["active_flows"][flow_id] = {"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": sentry_res.app_type}
+                _put_policy(flow_id, {"flow_id": flow_id, "app_type": sentry_res.app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": explanation})
+            _put_flow({"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": sentry_res.app_type, "engine": "Sentry"})
+            _record_traffic(sentry_res.app_type, features.bytes_total, features.packet_count)
+            _count_engine("Sentry")
             state["classification_log"].insert(0, {"timestamp": "now", "message": f"Sentry classified {flow_id} as {sentry_res.app_type} ({sentry_res.confidence:.2f})"})
             return ClassificationResult(flow_id=flow_id, app_type=sentry_res.app_type, confidence=sentry_res.confidence, explanation=explanation, engine="Sentry", shap=shap_map)
 
@@ -631,13 +1382,16 @@ async def classify_flow(features: FlowFeatures):
             "shap": shap_map,
         }
         state["investigations"].insert(0, investigation)
-        profile_id = f"profile_{hash(json.dumps(features.dict(), sort_keys=True)) & 0xffffffff}"
+        _count_engine("Vanguard")
+        # vanguard_query_llm marks its simulated fallback with engine=None
+        _harvest(features.dict(), vanguard_res.app_type, vanguard_res.confidence, vanguard_res.engine is None)
+        profile_id = profile_fingerprint(features.dict())
         _record_suggestion(profile_id, vanguard_res.app_type, vanguard_res.explanation or "")
         policy = POLICY_DEFINITIONS.get(vanguard_res.app_type, None)
         if policy:
-            state["policy_map"][flow_id] = {"flow_id": flow_id, "app_type": vanguard_res.app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": vanguard_res.explanation}
-            apply_iptables_rule(features.source_ip, features.dest_ip, features.dest_port, policy["dscp_class"])
-        state["active_flows"][flow_id] = {"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": vanguard_res.app_type}
+            _put_policy(flow_id, {"flow_id": flow_id, "app_type": vanguard_res.app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": vanguard_res.explanation})
+        _put_flow({"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": vanguard_res.app_type, "engine": "Vanguard"})
+        _record_traffic(vanguard_res.app_type, features.bytes_total, features.packet_count)
         state["classification_log"].insert(0, {"timestamp": "now", "message": f"Vanguard classified {flow_id} as {vanguard_res.app_type} ({vanguard_res.confidence:.2f}) - {vanguard_res.explanation}"})
         return ClassificationResult(flow_id=flow_id, app_type=vanguard_res.app_type, confidence=vanguard_res.confidence, explanation=vanguard_res.explanation, engine="Vanguard", shap=shap_map)
 
@@ -670,16 +1424,20 @@ async def classify_flow(features: FlowFeatures):
                 "shap": shap_map,
             }
             state["investigations"].insert(0, investigation)
-            profile_id = f"profile_{hash(json.dumps(features.dict(), sort_keys=True)) & 0xffffffff}"
+            _harvest(features.dict(), str(app_type), confidence, bool(result.get("simulated")))
+            profile_id = profile_fingerprint(features.dict())
             _record_suggestion(profile_id, str(app_type), explanation or "")
 
+        _count_engine(str(engine))
+
         # Apply policy if available
         policy = POLICY_DEFINITIONS.get(str(app_type), None)
         if policy:
-            state["policy_map"][flow_id] = {"flow_id": flow_id, "app_type": app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": explanation}
-            apply_iptables_rule(features.source_ip, features.dest_ip, features.dest_port, policy["dscp_class"])
+            _put_policy(flow_id, {"flow_id": flow_id, "app_type": app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": explanation})
+
+        _put_flow({"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": str(app_type), "engine": str(engine)})
 
-        state["active_flows"][flow_id] = {"id": flow_id, "source_ip": features.source_ip, "dest_ip": features.dest_ip, "dest_port": features.dest_port, "status": "Policy Applied", "app_type": str(app_type)}
+        _record_traffic(str(app_type), features.bytes_total, features.packet_count)
         state["classification_log"].insert(0, {"timestamp": "now", "message": f"Hybrid classified {flow_id} as {app_type} ({confidence:.2f}) via {engine}"})
         # Include shap mapping in the response when available
         return ClassificationResult(flow_id=flow_id, app_type=str(app_type), confidence=confidence, explanation=explanation, engine=str(engine), shap=shap_map)
@@ -697,6 +1455,192 @@ async def get_status():
     }
 
 
+@app.get("/metrics/timeseries")
+async def metrics_timeseries(series: List[str] = Query(default=[]), window: int = Query(300, ge=1, le=30 * 86400),
+                             points: int = Query(60, ge=1, le=2000), metric: str = "bytes"):
+    """Windowed rates (per second) for QoS-class and app series, downsampled server-side.
+
+    `series` may be repeated (e.g. series=class:high_prio&series=app:Gaming); when
+    omitted all QoS-class series are returned.
+    """
+    if metric not in METRIC_NAMES:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {list(METRIC_NAMES)}")
+    names = series or [f"class:{k}" for k in state["metrics"]]
+    unknown = [n for n in names if n not in METRIC_SERIES]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"unknown series: {unknown}")
+    return {name: metrics_engine.timeseries(name, window_s=window, points=points, metric=metric) for name in names}
+
+
+def _query_store(store: IndexedStore, filters: Dict[str, Any], cursor: Optional[str], limit: int):
+    try:
+        items, next_cursor = store.query(filters, cursor=cursor, limit=limit)
+    except ValueError as e:
+        # malformed CIDR or cursor
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor, "count": len(items)}
+
+
+@app.get("/flows")
+async def list_flows(app_type: Optional[str] = None, engine: Optional[str] = None, source_ip: Optional[str] = None,
+                     dest_port: Optional[int] = None, status: Optional[str] = None, cursor: Optional[str] = None,
+                     limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)):
+    """Filtered, cursor-paginated view of active flows.
+
+    `source_ip` accepts an address or a CIDR (e.g. 192.168.1.0/24). Pass the
+    returned `next_cursor` back as `cursor` to fetch the next page.
+    """
+    filters = {"app_type": app_type, "engine": engine, "source_ip": source_ip, "dest_port": dest_port, "status": status}
+    return _query_store(flow_store, filters, cursor, limit)
+
+
+@app.get("/policies")
+async def list_policies(app_type: Optional[str] = None, engine: Optional[str] = None, source_ip: Optional[str] = None,
+                        dest_port: Optional[int] = None, status: Optional[str] = None, dscp_class: Optional[str] = None,
+                        tc_class: Optional[str] = None, cursor: Optional[str] = None,
+                        limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)):
+    """Filtered, cursor-paginated view of active policies.
+
+    Flow-level filters (engine, source_ip, dest_port, status) match against the
+    flow each policy was created for.
+    """
+    filters = {"app_type": app_type, "engine": engine, "source_ip": source_ip, "dest_port": dest_port,
+               "status": status, "dscp_class": dscp_class, "tc_class": tc_class}
+    return _query_store(policy_store, filters, cursor, limit)
+
+
+_online_rng = np.random.default_rng()
+
+
+def _online_predict(rows: List[Dict[str, Any]]):
+    """Sentry model predictions, or the heuristic Sentry rules applied to columns when no model is loaded."""
+    predictions = sentry_predict_batch(rows)
+    if predictions is not None:
+        return predictions
+    cols = {c: np.array([row[c] for row in rows], dtype=np.float64)
+            for c in ("packet_count", "avg_pkt_len", "bytes_total", "dest_port")}
+    names, codes, confidences = heuristic_predict(cols, _online_rng, TRAFFIC_TYPES)
+    return [(names[code], confidence) for code, confidence in zip(codes.tolist(), confidences.tolist())]
+
+
+def _online_flow_id(key) -> str:
+    return "online_" + "_".join(str(part) for part in key)
+
+
+# Early, provisional decisions from packet observations (see online_flows)
+online_table = OnlineFlowTable(_online_predict, first_decision_packets=int(os.environ.get("SENTINEL_EARLY_PACKETS", "8")),
+                               final_confidence=SENTRY_CONFIDENCE_THRESHOLD)
+_online_next_sweep = 0.0
+
+
+class PacketRecord(BaseModel):
+    source_ip: str
+    dest_ip: str
+    dest_port: int
+    protocol: Optional[str] = None
+    length: int
+    packets: int = 1
+    ts: Optional[float] = None
+
+
+@app.post("/flows/packets")
+async def observe_packets(records: List[PacketRecord]):
+    """Feed packet (or small flow record) observations into the online flow table.
+
+    Each flow gets a provisional Sentry decision, and a policy, after its
+    first SENTINEL_EARLY_PACKETS packets; the decision is refined as more
+    packets arrive and only switches once a new label wins consistently.
+    `ts` is epoch seconds and defaults to the arrival time. Flows idle for
+    the table's idle timeout are dropped with their policies. Returns the
+    decisions made by this call.
+    """
+    global _online_next_sweep
+    now = time.time()
+    for r in records:
+        online_table.update((r.source_ip, r.dest_ip, r.dest_port, r.protocol), r.ts or now, r.length, r.packets)
+    decisions = []
+    if online_table.due_since is not None:
+        keys, rows = online_table.collect_due()
+        loop = asyncio.get_event_loop()
+        predictions = await loop.run_in_executor(None, _online_predict, rows)
+        for event in online_table.resolve(keys, rows, predictions):
+            features, app_type = event["features"], event["app_type"]
+            flow_id = _online_flow_id(event["key"])
+            status_text = "Provisional" if event["provisional"] else "Policy Applied"
+            _put_flow({"id": flow_id, "source_ip": features["source_ip"], "dest_ip": features["dest_ip"], "dest_port": features["dest_port"], "status": status_text, "app_type": app_type, "engine": "Sentry"})
+            policy = POLICY_DEFINITIONS.get(app_type)
+            if policy:
+                _put_policy(flow_id, {"flow_id": flow_id, "app_type": app_type, "dscp_class": policy["dscp_class"], "tc_class": policy["tc_class"], "explanation": f"{status_text} Sentry decision after {event['packets']} packets"})
+            decisions.append({"flow_id": flow_id, "app_type": app_type, "confidence": event["confidence"], "provisional": event["provisional"],
+                              "packets": event["packets"], "decision_latency": event["decision_latency"]})
+        if decisions:
+            state["classification_log"].insert(0, {"timestamp": "now", "message": f"Early decisions for {len(decisions)} flows"})
+    if now >= _online_next_sweep:
+        # idle flows are over: drop their flow, policy and DSCP mark, provisional or not
+        expired = [key for key, flow in online_table.expire(now) if flow.label is not None]
+        for key in expired:
+            _remove_flow(_online_flow_id(key))
+        if expired:
+            state["classification_log"].insert(0, {"timestamp": "now", "message": f"Expired {len(expired)} idle online flows"})
+        _online_next_sweep = now + 1.0
+    return {"accepted": len(records), "tracked": len(online_table), "decisions": decisions, "stats": online_table.stats}
+
+
+class _UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse that can stream while the request body is still being read.
+
+    Starlette's StreamingResponse polls `receive()` for a disconnect while it
+    streams, which would swallow request body chunks the endpoint has not read
+    yet. The body iterator itself notices a disconnect (request.stream() raises
+    ClientDisconnect), so the listener only has to wait.
+    """
+
+    async def listen_for_disconnect(self, receive) -> None:
+        await asyncio.Event().wait()
+
+
+@app.post("/flows/ingest")
+async def ingest_flows(request: Request, chunk_rows: int = Query(1000, ge=1, le=10000)):
+    """Bulk-classify a streamed NDJSON (default) or Arrow IPC stream body of FlowFeatures rows.
+
+    The body is parsed and validated `chunk_rows` rows at a time and each
+    chunk is classified with one batched call, so memory does not grow with
+    the upload. The response is NDJSON: one {"row", flow_id, app_type, ...}
+    or {"row", "error"} line per input row, then a {"summary": {...}} line.
+    Send `Content-Type: application/vnd.apache.arrow.stream` for Arrow.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "arrow" in content_type:
+        if not HAS_PYARROW:
+            raise HTTPException(status_code=415, detail="Arrow ingest needs pyarrow installed")
+        chunks = arrow_chunks(request.stream(), chunk_rows)
+    else:
+        chunks = ndjson_chunks(request.stream(), chunk_rows)
+
+    async def results():
+        summary = {"rows": 0, "classified": 0, "rejected": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        try:
+            async for first_row, columns, n, parse_errors in chunks:
+                rows, errors = validate_columns(columns, n, parse_errors)
+                classified = await classify_flow_batch([features for _, features in rows], "ingest") if rows else []
+                out = [{"row": first_row + i, **result} for (i, _), result in zip(rows, classified)]
+                out += [{"row": first_row + i, "error": msg} for i, msg in errors.items()]
+                out.sort(key=lambda r: r["row"])
+                summary["rows"] += n
+                summary["classified"] += len(classified)
+                summary["rejected"] += len(errors)
+                yield "".join(json.dumps(r) + "\n" for r in out)
+        except ValueError as e:
+            # malformed stream (oversized line, broken Arrow message): stop here, keep what was classified
+            summary["error"] = str(e)
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        state["classification_log"].insert(0, {"timestamp": "now", "message": f"Bulk ingest: {summary['classified']} classified, {summary['rejected']} rejected"})
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return _UploadStreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @app.get("/", include_in_schema=False)
 async def root():
     """Simple root endpoint to make visiting http://host:8000/ friendly.
@@ -768,101 +1712,73 @@ from pydantic import BaseModel
 # --- Simulation API for interactive what-if scenarios ---
 class SimulationParams(BaseModel):
     video_percentage: float = 50.0
-    total_volume_gb: int = 1
+    total_volume_gb: float = 1
+    ue_count: int = 100
+    flows_per_ue: int = 100
+    seed: Optional[int] = None
 
 
-@app.post("/simulate")
-async def run_simulation(params: SimulationParams):
-    """Generate synthetic traffic according to params and return aggregated classification counts.
+class SimulationGrid(BaseModel):
+    video_percentage: List[float] = [50.0]
+    total_volume_gb: List[float] = [1.0]
+    ue_count: List[int] = [100]
+    flows_per_ue: int = 100
+    seed: Optional[int] = None
 
-    The implementation is intentionally conservative in sample count to remain responsive
-    in demo environments. It uses `sentry_predict` (fast heuristic / model) when possible
-    and falls back to the hybrid classifier for variety.
-    """
-    try:
-        import numpy as _np  # type: ignore
-    except Exception:
-        _np = None
-
-    # Decide number of synthetic flows to generate (bounded)
-    requested = max(10, int(params.total_volume_gb * 100))
-    num_samples = min(2000, requested)
-
-    video_share = float(max(0.0, min(100.0, params.video_percentage))) / 100.0
-    video_samples = int(round(num_samples * video_share))
-    other_samples = num_samples - video_samples
-
-    samples = []
-
-    def make_video_feature(i):
-        # Video tends to have large avg packet length and sustained bytes
-        return FlowFeatures(
-            source_ip=f"192.168.100.{(i % 240) + 10}",
-            dest_ip=f"10.1.0.{(i % 240) + 1}",
-            dest_port=int(8000 + (i % 1000)),
-            packet_count=int(100 + (i % 500)),
-            avg_pkt_len=float(800 + (i % 400)),
-            duration_seconds= max(1.0, float((i % 60) + 5)),
-            bytes_total=int((800 + (i % 400)) * (100 + (i % 500))),
-        )
 
-    def make_other_feature(i):
-        # Browsing / mixed traffic
-        return FlowFeatures(
-            source_ip=f"192.168.200.{(i % 240) + 10}",
-            dest_ip=f"10.2.0.{(i % 240) + 1}",
-            dest_port=int(80 + (i % 6000)),
-            packet_count=int(10 + (i % 300)),
-            avg_pkt_len=float(200 + (i % 300)),
-            duration_seconds= max(0.2, float((i % 30) + 1)),
-            bytes_total=int((200 + (i % 300)) * (10 + (i % 300))),
-        )
+MAX_SIM_SCENARIOS = 256
+# /simulate and /simulate/grid are unauthenticated; cap the flows one request may generate in total
+MAX_SIM_ROWS = int(os.environ.get("SENTINEL_SIM_MAX_ROWS", "200000"))
+# scenarios are NumPy/model bound and release the GIL for most of their run
+_sim_executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
 
-    for i in range(video_samples):
-        samples.append(make_video_feature(i))
-    for i in range(other_samples):
-        samples.append(make_other_feature(i + video_samples))
 
-    # Run classifier for each sample (use sentry_predict for speed when possible)
-    counts: Dict[str, int] = {}
-    loop = asyncio.get_event_loop()
+def _check_sim_rows(rows: int):
+    if rows > MAX_SIM_ROWS:
+        raise HTTPException(status_code=400, detail=f"request would simulate {rows} flows; the limit is {MAX_SIM_ROWS}")
 
-    def classify_sample(feature: FlowFeatures):
-        try:
-            # Prefer sentry_predict fast path
-            res = sentry_predict(feature)
-            label = res.app_type if res and res.app_type else 'Unknown'
-        except Exception:
-            try:
-                # Fallback to hybrid classifier module (may call LLM but kept minimal)
-                r = hybrid_classify(feature.dict())
-                if isinstance(r, dict):
-                    label = r.get('classification') or r.get('app_type') or 'Unknown'
-                else:
-                    label = getattr(r, 'app_type', 'Unknown')
-            except Exception:
-                label = 'Unknown'
-        return label
 
-    # Run classification in a threadpool for responsiveness
-    try:
-        from concurrent.futures import ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers=8) as exc:
-            futs = [loop.run_in_executor(exc, classify_sample, s) for s in samples]
-            for f in asyncio.as_completed(futs):
-                try:
-                    lbl = await f
-                except Exception:
-                    lbl = 'Unknown'
-                counts[lbl] = counts.get(lbl, 0) + 1
-    except Exception:
-        # Synchronous fallback if executor fails
-        for s in samples:
-            lbl = classify_sample(s)
-            counts[lbl] = counts.get(lbl, 0) + 1
+def _scenario_job(video_percentage: float, total_volume_gb: float, ue_count: int, flows_per_ue: int, seed: Optional[int]):
+    if ue_count < 1 or flows_per_ue < 1 or total_volume_gb < 0:
+        raise HTTPException(status_code=400, detail="ue_count and flows_per_ue must be >= 1, total_volume_gb >= 0")
+    return functools.partial(run_scenario, video_percentage, total_volume_gb, ue_count, flows_per_ue, labels=TRAFFIC_TYPES,
+                             predict=sentry_predict_columns, confidence_threshold=SENTRY_CONFIDENCE_THRESHOLD, seed=seed)
+
+
+@app.post("/simulate")
+async def run_simulation(params: SimulationParams):
+    """Classify a synthetic traffic mix and return the label distribution.
+
+    The scenario has `ue_count * flows_per_ue` flows (up to
+    MAX_SIM_ROWS) carrying `total_volume_gb` in total, with
+    `video_percentage` of them video. Flows are generated and classified as
+    NumPy columns with one Sentry model call per chunk (or the heuristic
+    rules when no model is loaded).
+    """
+    job = _scenario_job(params.video_percentage, params.total_volume_gb, params.ue_count, params.flows_per_ue, params.seed)
+    _check_sim_rows(scenario_rows(params.ue_count, params.flows_per_ue))
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_sim_executor, job)
 
-    return {"simulation_results": counts, "num_samples": num_samples}
 
+@app.post("/simulate/grid")
+async def run_simulation_grid(grid: SimulationGrid):
+    """Evaluate every combination of video share x volume x UE count in parallel.
+
+    Returns one /simulate-shaped result per scenario, in grid order (video
+    share varying slowest). With `seed`, scenario i uses seed + i, so a sweep
+    is reproducible. All scenarios together may have at most MAX_SIM_ROWS flows.
+    """
+    combos = scenario_grid(grid.video_percentage, grid.total_volume_gb, grid.ue_count)
+    if not combos or len(combos) > MAX_SIM_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"grid must have between 1 and {MAX_SIM_SCENARIOS} scenarios")
+    _check_sim_rows(sum(scenario_rows(u, grid.flows_per_ue) for _, _, u in combos))
+    jobs = [_scenario_job(v, g, u, grid.flows_per_ue, None if grid.seed is None else grid.seed + i)
+            for i, (v, g, u) in enumerate(combos)]
+    loop = asyncio.get_event_loop()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(loop.run_in_executor(_sim_executor, job) for job in jobs))
+    return {"scenarios": results, "elapsed_ms": round((time.perf_counter() - start) * 1000.0, 1)}
 
 
 @app.get("/status-lite", include_in_schema=False)
@@ -874,7 +1790,7 @@ async def service_status():
     """
     model_present = False
     try:
-        model_present = any(os.path.exists(p) for p in ["data/archive/sentry_model.pkl", "sentry_model.pkl", "sentry_model.joblib"])
+        model_present = any(os.path.exists(p) for p in ["data/archive/sentry_model.pkl", "sentry_model.pkl", "sentry_model.joblib", artifact_path(MODEL_PATH)])
     except Exception:
         model_present = False
 
@@ -0,0 +1,224 @@
+"""Incremental NDJSON / Arrow IPC parsing and columnar validation for bulk flow ingest.
+
+Both parsers consume an async iterator of body chunks (e.g. Starlette's
+`request.stream()`) and yield fixed-size row chunks, so memory is bounded by
+one chunk plus one partial line or Arrow message no matter how large the
+upload is. Rows are validated per column with NumPy instead of building a
+pydantic model per row; only rows that pass become FlowFeatures dicts.
+"""
+
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa  # type: ignore
+    HAS_PYARROW = True
+except Exception:  # pragma: no cover - optional runtime
+    pa = None
+    HAS_PYARROW = False
+
+# FlowFeatures fields: name -> (kind, required)
+FLOW_FIELDS: Dict[str, Tuple[str, bool]] = {
+    "source_ip": ("str", True),
+    "dest_ip": ("str", True),
+    "dest_port": ("port", True),
+    "packet_count": ("count", True),
+    "avg_pkt_len": ("float", True),
+    "duration_seconds": ("float", True),
+    "bytes_total": ("count", True),
+    "protocol": ("str", False),
+    "hostname": ("str", False),
+}
+
+MAX_LINE_BYTES = 1 << 20
+
+# (index of the first row in the chunk, columns, row count, per-row parse errors)
+Chunk = Tuple[int, Dict[str, Sequence[Any]], int, Dict[int, str]]
+
+
+def _as_float(values: Sequence[Any], n: int) -> np.ndarray:
+    """float64 column with NaN for missing or non-numeric values."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in "iuf":
+        return values.astype(np.float64, copy=False)
+    try:
+        arr = np.array(values, dtype=np.float64)
+        if arr.shape == (n,):
+            return arr
+    except (TypeError, ValueError):
+        pass
+    arr = np.full(n, np.nan)
+    for i, v in enumerate(values):
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            arr[i] = v
+    return arr
+
+
+def validate_columns(columns: Dict[str, Sequence[Any]], n: int,
+                     errors: Optional[Dict[int, str]] = None) -> Tuple[List[Tuple[int, Dict[str, Any]]], Dict[int, str]]:
+    """Validate a chunk column by column.
+
+    Returns ([(row, features dict)] for valid rows, {row: error message} for
+    the rest). Rows already in `errors` (e.g. unparsable lines) stay rejected.
+    """
+    errors = dict(errors or {})
+    bad_any = np.zeros(n, dtype=bool)
+    if errors:
+        bad_any[list(errors)] = True
+    bad_fields: Dict[str, np.ndarray] = {}
+    out_cols: Dict[str, List[Any]] = {}
+    for name, (kind, required) in FLOW_FIELDS.items():
+        values = columns.get(name)
+        if values is None:
+            values = [None] * n
+        if kind == "str":
+            out_cols[name] = list(values)
+            bad = np.fromiter((not (isinstance(v, str) and v) if required else not (v is None or isinstance(v, str))
+                               for v in out_cols[name]), dtype=bool, count=n)
+        else:
+            arr = _as_float(values, n)
+            with np.errstate(invalid="ignore"):
+                bad = ~np.isfinite(arr)
+                if kind != "float":
+                    bad |= (arr < 0) | (arr != np.floor(arr))
+                if kind == "port":
+                    bad |= arr > 65535
+            arr = np.where(bad, 0, arr)
+            out_cols[name] = (arr.astype(np.int64) if kind != "float" else arr).tolist()
+        if bad.any():
+            bad_fields[name] = bad
+            bad_any |= bad
+
+    for i in np.flatnonzero(bad_any).tolist():
+        if i not in errors:
+            errors[i] = "invalid " + ", ".join(f for f, bad in bad_fields.items() if bad[i])
+    names = list(FLOW_FIELDS)
+    rows = [(i, dict(zip(names, vals))) for i, vals in enumerate(zip(*(out_cols[f] for f in names))) if not bad_any[i]]
+    return rows, errors
+
+
+def _rows_to_chunk(start: int, lines: List[bytes]) -> Chunk:
+    # one json.loads for the whole chunk; fall back to per-line parsing to pin down bad lines
+    errors: Dict[int, str] = {}
+    try:
+        rows = json.loads(b"[" + b",".join(lines) + b"]")
+        if not all(isinstance(r, dict) for r in rows):
+            raise ValueError
+    except ValueError:
+        rows = []
+        for i, line in enumerate(lines):
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row, errors[i] = {}, f"invalid JSON: {e}"
+            if not isinstance(row, dict):
+                row, errors[i] = {}, "row is not a JSON object"
+            rows.append(row)
+    columns = {f: [r.get(f) for r in rows] for f in FLOW_FIELDS}
+    return start, columns, len(rows), errors
+
+
+async def ndjson_chunks(body: AsyncIterator[bytes], chunk_rows: int = 1000,
+                        max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Chunk]:
+    """Split a streamed NDJSON body into column chunks of at most `chunk_rows` rows. Blank lines are skipped."""
+    buf = bytearray()
+    lines: List[bytes] = []
+    start = 0
+    async for data in body:
+        buf += data
+        pos = 0
+        while True:
+            nl = buf.find(b"\n", pos)
+            if nl < 0:
+                break
+            line = bytes(buf[pos:nl]).strip()
+            pos = nl + 1
+            if line:
+                lines.append(line)
+                if len(lines) >= chunk_rows:
+                    yield _rows_to_chunk(start, lines)
+                    start += len(lines)
+                    lines = []
+        del buf[:pos]
+        if len(buf) > max_line_bytes:
+            raise ValueError(f"line {start + len(lines)} exceeds {max_line_bytes} bytes")
+    tail = bytes(buf).strip()
+    if tail:
+        lines.append(tail)
+    if lines:
+        yield _rows_to_chunk(start, lines)
+
+
+def _batch_columns(batch) -> Dict[str, Sequence[Any]]:
+    columns: Dict[str, Sequence[Any]] = {}
+    for name, (kind, _) in FLOW_FIELDS.items():
+        idx = batch.schema.get_field_index(name)
+        if idx < 0:
+            continue
+        col = batch.column(idx)
+        if kind != "str" and (pa.types.is_integer(col.type) or pa.types.is_floating(col.type)):
+            # nulls become NaN, which validation rejects
+            columns[name] = col.to_numpy(zero_copy_only=False)
+        else:
+            columns[name] = col.to_pylist()
+    return columns
+
+
+async def arrow_chunks(body: AsyncIterator[bytes], chunk_rows: int = 1000) -> AsyncIterator[Chunk]:
+    """Decode a streamed Arrow IPC stream message by message into column chunks.
+
+    Only complete messages are decoded; a partial message stays buffered
+    until the rest of it arrives. Dictionary-encoded streams are not
+    supported.
+    """
+    if not HAS_PYARROW:
+        raise RuntimeError("pyarrow is not installed")
+    buf = bytearray()
+    schema = None
+    start = 0
+    ended = False
+    # after an incomplete read, wait until the buffer has doubled before re-parsing,
+    # so a large message arriving in small pieces is not re-read once per piece
+    retry_at = 0
+
+    def decode_available() -> List[Any]:
+        nonlocal schema, ended, retry_at
+        batches = []
+        while buf and not ended:
+            reader = pa.BufferReader(bytes(buf))
+            try:
+                message = pa.ipc.read_message(reader)
+            except EOFError:
+                ended = True  # end-of-stream marker
+                break
+            except (pa.ArrowInvalid, OSError):
+                # incomplete metadata or body: wait for more bytes
+                retry_at = 2 * len(buf)
+                break
+            del buf[:reader.tell()]
+            retry_at = 0
+            if schema is None:
+                schema = pa.ipc.read_schema(message)
+            elif message.type == "record batch":
+                batches.append(pa.ipc.read_record_batch(message, schema))
+            else:
+                raise ValueError(f"unsupported Arrow message: {message.type}")
+        return batches
+
+    async for data in body:
+        buf += data
+        if len(buf) < retry_at:
+            continue
+        for batch in decode_available():
+            for offset in range(0, batch.num_rows, chunk_rows):
+                part = batch.slice(offset, chunk_rows)
+                yield start, _batch_columns(part), part.num_rows, {}
+                start += part.num_rows
+    for batch in decode_available():
+        for offset in range(0, batch.num_rows, chunk_rows):
+            part = batch.slice(offset, chunk_rows)
+            yield start, _batch_columns(part), part.num_rows, {}
+            start += part.num_rows
+    if buf and not ended:
+        raise ValueError("truncated Arrow stream")
@@ -0,0 +1,168 @@
+"""Tiered classification cascade: signature rules -> destination index -> Sentry model -> Vanguard LLM.
+
+The first tier is a compiled table of traffic signatures. A signature is a
+plain dict:
+
+    {"id": "rtmp", "app_type": "Video Upload", "confidence": 0.99,
+     "ports": [1935], "protocol": "tcp", "dst_cidr": "203.0.113.0/24",
+     "above": {"avg_pkt_len": 900}, "below": {"duration_seconds": 5}}
+
+Every field except `id`, `app_type` and `confidence` is optional. `above`
+and `below` are strict bounds on numeric flow fields. Signatures are tried
+in list order and the first match wins. Only signatures whose confidence
+passes the tier's gate are compiled. They go into a table keyed by
+destination port, so a lookup is one dict access plus a few comparisons,
+and no feature pipeline or model call is needed.
+
+A signature's confidence should be its measured precision.
+`calibrate_signatures` replaces the prior confidences with the precision on
+labelled training data (train_sentry.py stores the result in the model
+payload). A plausible-looking heuristic that is wrong two times out of
+three then never passes the gate.
+
+`CascadeStats` counts, per tier, the flows offered, the flows resolved and
+the time spent. It gives the hit rate and mean per-flow latency of each
+tier, so the share of traffic that reaches the model and the LLM is
+visible.
+"""
+
+import ipaddress
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+TIERS = ("rules", "index", "sentry", "vanguard")  # index: destination_index.py
+# signatures below this confidence are not used by the rule tier
+DEFAULT_RULE_GATE = 0.99
+# a calibrated signature must have matched at least this many training rows; otherwise it is disabled
+MIN_SUPPORT = 20
+
+# Port and size signatures of the classes Sentry knows. The size ones are
+# the heuristics of the orchestrator's no-model fallback; their priors are
+# deliberately below the default gate until calibration shows them precise.
+DEFAULT_SIGNATURES: List[Dict[str, Any]] = [
+    {"id": "stun_rtp", "app_type": "Audio/Video Call", "confidence": 0.99, "ports": [3478, 5004, 5005, 19302]},
+    {"id": "game_ports", "app_type": "Gaming", "confidence": 0.99, "ports": [3074, 27015]},
+    {"id": "rtmp", "app_type": "Video Upload", "confidence": 0.99, "ports": [1935]},
+    {"id": "large_packets", "app_type": "Video Streaming", "confidence": 0.9, "above": {"avg_pkt_len": 900, "packet_count": 50}},
+    {"id": "bulk_packets", "app_type": "File Download", "confidence": 0.9, "above": {"packet_count": 2000}},
+    {"id": "bulk_bytes", "app_type": "File Download", "confidence": 0.9, "above": {"bytes_total": 10_000_000}},
+]
+
+
+def _fields(signature: Mapping[str, Any]) -> List[str]:
+    return list(signature.get("above", {})) + list(signature.get("below", {}))
+
+
+class _Compiled:
+    __slots__ = ("signature", "protocol", "network", "above", "below")
+
+    def __init__(self, signature: Dict[str, Any]):
+        self.signature = signature
+        self.protocol = str(signature["protocol"]).lower() if signature.get("protocol") else None
+        self.network = ipaddress.ip_network(signature["dst_cidr"], strict=False) if signature.get("dst_cidr") else None
+        self.above = tuple((k, float(v)) for k, v in signature.get("above", {}).items())
+        self.below = tuple((k, float(v)) for k, v in signature.get("below", {}).items())
+
+    def accepts(self, features: Mapping[str, Any]) -> bool:
+        for field, bound in self.above:
+            if not float(features.get(field) or 0) > bound:
+                return False
+        for field, bound in self.below:
+            if not float(features.get(field) or 0) < bound:
+                return False
+        if self.protocol is not None and str(features.get("protocol") or "").lower() != self.protocol:
+            return False
+        if self.network is not None:
+            try:
+                dst = ipaddress.ip_address(str(features.get("dest_ip")))
+            except ValueError:
+                return False
+            return dst.version == self.network.version and dst in self.network
+        return True
+
+
+class SignatureTier:
+    """Compiled signature table; `match` returns the first matching signature that passes the gate, or None."""
+
+    def __init__(self, signatures: Sequence[Mapping[str, Any]], gate: float = DEFAULT_RULE_GATE):
+        self.signatures = [dict(s) for s in signatures]
+        self.gate = gate
+        compiled = [_Compiled(s) for s in self.signatures if float(s.get("confidence", 0.0)) >= gate]
+        self._portless = [c for c in compiled if not c.signature.get("ports")]
+        # per port: the signatures for that port and the portless ones, in list order
+        self._by_port: Dict[int, List[_Compiled]] = {}
+        for port in {int(p) for c in compiled for p in c.signature.get("ports") or ()}:
+            self._by_port[port] = [c for c in compiled if not c.signature.get("ports") or port in c.signature["ports"]]
+        self.active = len(compiled)
+
+    def match(self, features: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            port = int(features.get("dest_port") or 0)
+        except (TypeError, ValueError):
+            port = 0
+        for c in self._by_port.get(port, self._portless):
+            if c.accepts(features):
+                return c.signature
+        return None
+
+
+def calibrate_signatures(signatures: Sequence[Mapping[str, Any]], columns: Mapping[str, Any], labels,
+                         min_support: int = MIN_SUPPORT) -> List[Dict[str, Any]]:
+    """Signatures with `confidence` set to their precision on labelled raw columns.
+
+    Each signature is measured on its own, on the rows it matches. The
+    precision is smoothed as (correct + 1) / (matched + 2), so a handful of
+    lucky matches does not look perfect. Signatures matching fewer than
+    `min_support` rows get confidence 0. Signatures that need fields the
+    columns lack (destination, protocol) keep their prior and are marked
+    calibrated=False.
+    """
+    labels = np.asarray(labels).astype(str)
+    n = len(labels)
+    out = []
+    for s in signatures:
+        s = dict(s)
+        needs = _fields(s) + (["dest_port"] if s.get("ports") else [])
+        if s.get("dst_cidr") or s.get("protocol") or any(f not in columns for f in needs):
+            s["calibrated"] = False
+            out.append(s)
+            continue
+        mask = np.ones(n, dtype=bool)
+        if s.get("ports"):
+            mask &= np.isin(np.asarray(columns["dest_port"], dtype=np.float64), np.asarray(s["ports"], dtype=np.float64))
+        for field, bound in s.get("above", {}).items():
+            mask &= np.asarray(columns[field], dtype=np.float64) > float(bound)
+        for field, bound in s.get("below", {}).items():
+            mask &= np.asarray(columns[field], dtype=np.float64) < float(bound)
+        matched = int(mask.sum())
+        correct = int((labels[mask] == str(s["app_type"])).sum())
+        s.update(support=matched, calibrated=True,
+                 confidence=round((correct + 1) / (matched + 2), 4) if matched >= min_support else 0.0)
+        out.append(s)
+    return out
+
+
+class CascadeStats:
+    """Thread-safe per-tier counters: flows offered to and resolved by each tier, and time spent in it."""
+
+    def __init__(self, tiers: Sequence[str] = TIERS):
+        self._lock = threading.Lock()
+        self.tiers = {t: {"offered": 0, "resolved": 0, "seconds": 0.0} for t in tiers}
+
+    def record(self, tier: str, offered: int, resolved: int, seconds: float) -> None:
+        with self._lock:
+            c = self.tiers[tier]
+            c["offered"] += offered
+            c["resolved"] += resolved
+            c["seconds"] += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            total = max(1, next(iter(self.tiers.values()))["offered"])
+            return {t: {"offered": c["offered"], "resolved": c["resolved"],
+                        "hit_rate": round(c["resolved"] / max(1, c["offered"]), 4),
+                        "share_of_flows": round(c["resolved"] / total, 4),
+                        "mean_latency_us": round(c["seconds"] / max(1, c["offered"]) * 1e6, 3)}
+                    for t, c in self.tiers.items()}
@@ -0,0 +1,234 @@
+"""Continual Sentry retraining from Vanguard labels.
+
+Every escalation ends with a Vanguard label. `LabelHarvester` keeps the
+confident ones (with their flow features) in an append-only NDJSON file so
+they survive restarts. `retrain` periodically fits a candidate Sentry model
+on the base training CSV plus the harvested rows and compares it with the
+serving model on a fixed holdout. The holdout is train_sentry's test split
+of the base data (training_data.test_rows) plus a deterministic slice of
+the harvested rows, so neither model has trained on it. The candidate
+wins if it is more accurate, or about as accurate while escalating fewer of
+the harvested holdout flows (confidence below the Sentry threshold). The
+orchestrator then writes the payload atomically and reloads Sentry from it.
+
+When the label set is unchanged the candidate warm-starts from the serving
+LightGBM booster and only adds trees; otherwise, or once the model has grown
+to MAX_WARM_ROUNDS rounds, it is trained from scratch with train_sentry's
+parameters. The OOD scorer (ood_detector.py), if the serving model has one,
+is refitted on the same training rows, and its cascade signatures
+(cascade.py) are recalibrated on them.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from feature_pipeline import FeaturePipeline, payload_pipeline
+from ood_detector import OODScorer
+from cascade import calibrate_signatures
+from sentry_artifact import artifact_path, write_artifact
+from training_data import SENTRY_LGBM_PARAMS, load_training_data, test_rows
+
+try:
+    from lightgbm import LGBMClassifier  # type: ignore
+    HAS_LIGHTGBM = True
+except Exception:  # pragma: no cover - optional runtime
+    LGBMClassifier = None
+    HAS_LIGHTGBM = False
+
+try:
+    import joblib  # type: ignore
+    from sklearn.preprocessing import LabelEncoder  # type: ignore
+    HAS_SKLEARN = True
+except Exception:  # pragma: no cover - optional runtime
+    joblib = None
+    LabelEncoder = None
+    HAS_SKLEARN = False
+
+HOLDOUT_FRACTION = 0.2
+# a candidate may lose this much holdout accuracy if it escalates less
+ACCURACY_TOLERANCE = 0.005
+# Trees added per warm start. The serving model is very confident on its own training data, so its
+# hessians p(1-p) are tiny and unconstrained leaves explode; a minimum hessian per leaf keeps them sane.
+WARM_START_PARAMS = {"n_estimators": 50, "min_child_weight": 1.0}
+# boosting rounds after which the next retrain starts from scratch instead of growing the model further
+MAX_WARM_ROUNDS = 400
+
+
+class LabelHarvester:
+    """Append-only store of confident Vanguard labels, bounded to the newest `max_rows`.
+
+    Each row gets a sequence number; rows whose number is divisible by
+    1/HOLDOUT_FRACTION form the harvested holdout.
+    """
+
+    def __init__(self, path: str, min_confidence: float = 0.9, max_rows: int = 100_000):
+        self.path = path
+        self.min_confidence = min_confidence
+        self.max_rows = max_rows
+        self.rows: List[Dict[str, Any]] = []
+        self.seq = 0
+        self.stats = {"harvested": 0, "skipped": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            with open(path) as fh:
+                for line in fh:
+                    try:
+                        self.rows.append(json.loads(line))
+                    except ValueError:
+                        continue
+            self.rows = self.rows[-max_rows:]
+            self.seq = max((r.get("seq", 0) for r in self.rows), default=0)
+
+    def add(self, features: Dict[str, Any], label: str, confidence: float) -> bool:
+        """Keep a Vanguard label if it is confident enough; True when stored."""
+        if not label or confidence < self.min_confidence:
+            self.stats["skipped"] += 1
+            return False
+        self.seq += 1
+        row = {"seq": self.seq, "ts": time.time(), "label": label, "confidence": round(float(confidence), 4),
+               "features": features}
+        self.rows.append(row)
+        with open(self.path, "a") as fh:
+            fh.write(json.dumps(row) + "\n")
+        if len(self.rows) > 2 * self.max_rows:
+            self.compact()
+        self.stats["harvested"] += 1
+        return True
+
+    def compact(self) -> None:
+        """Drop all but the newest `max_rows` rows, in memory and on disk."""
+        self.rows = self.rows[-self.max_rows:]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            for row in self.rows:
+                fh.write(json.dumps(row) + "\n")
+        os.replace(tmp, self.path)
+
+    def since(self, seq: int) -> int:
+        """Number of rows harvested after sequence number `seq`."""
+        return sum(1 for r in self.rows if r["seq"] > seq)
+
+
+def _is_holdout_seq(seq: int) -> bool:
+    return seq % int(round(1 / HOLDOUT_FRACTION)) == 0
+
+
+def evaluate(payload: Dict[str, Any], X: np.ndarray, labels: np.ndarray, escalate_below: float,
+             escalation_rows: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """Holdout accuracy, and the share of `escalation_rows` below `escalate_below` confidence."""
+    model, le = payload["model"], payload.get("label_encoder")
+    probs = np.asarray(model.predict_proba(X))
+    best = probs.argmax(axis=1)
+    classes = np.asarray(getattr(model, "classes_", np.arange(probs.shape[1])))
+    names = le.inverse_transform(classes.astype(int)) if le is not None else classes
+    predicted = np.asarray(names).astype(str)[best]
+    conf = probs[np.arange(len(best)), best]
+    rows = escalation_rows if escalation_rows is not None else np.ones(len(best), dtype=bool)
+    return {
+        "accuracy": round(float((predicted == labels).mean()) if len(labels) else 0.0, 6),
+        "escalation_rate": round(float((conf[rows] < escalate_below).mean()) if rows.any() else 0.0, 6),
+    }
+
+
+def retrain(base_csv: Optional[str], harvested: List[Dict[str, Any]], current: Optional[Dict[str, Any]],
+            escalate_below: float = 0.95) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """Train a candidate on base + harvested data and compare it with `current` on the holdout.
+
+    Returns (candidate payload if it should replace `current`, else None;
+    report with both models' holdout metrics and the decision).
+    """
+    if not (HAS_LIGHTGBM and HAS_SKLEARN):
+        raise RuntimeError("retraining needs lightgbm and scikit-learn")
+    report: Dict[str, Any] = {"started": time.time(), "harvested_rows": len(harvested)}
+    if base_csv and os.path.exists(base_csv):
+        base_cols, base_codes, base_names = load_training_data(base_csv)
+        base_labels = np.asarray(base_names, dtype=object)[np.asarray(base_codes)].astype(str)
+        n_base = len(base_labels)
+        base_holdout = test_rows(base_codes)
+    else:
+        base_cols, base_labels, n_base = {}, np.array([], dtype=str), 0
+        base_holdout = np.zeros(0, dtype=bool)
+    # the serving model's pipeline, so candidate and current see identical inputs
+    pipeline = payload_pipeline(current) if current else FeaturePipeline.for_columns(list(base_cols))
+    if not pipeline.output_columns:
+        raise ValueError("no feature columns: need a serving model or base training data")
+    if pipeline.foreign_inputs():
+        raise ValueError(f"base data columns {', '.join(pipeline.foreign_inputs())} are not FlowFeatures fields")
+    usable = [r for r in harvested if any(c in r["features"] for c in pipeline.inputs)]
+    report["usable_harvested_rows"] = len(usable)
+
+    raw = {c: np.concatenate([np.asarray(base_cols[c], dtype=np.float64) if c in base_cols else np.zeros(n_base),
+                              np.array([r["features"].get(c) for r in usable], dtype=np.float64)])
+           for c in pipeline.inputs}
+    X = pipeline.transform_columns(raw, n_base + len(usable))
+    labels = np.concatenate([base_labels, np.array([r["label"] for r in usable], dtype=str)])
+    # fixed holdout: train_sentry's test rows of the base data plus every k-th harvested row
+    harv_holdout = np.array([_is_holdout_seq(r["seq"]) for r in usable], dtype=bool)
+    holdout = np.concatenate([base_holdout, harv_holdout])
+    from_harvest = np.concatenate([np.zeros(n_base, dtype=bool), np.ones(len(usable), dtype=bool)])
+    if holdout.all() or not holdout.any():
+        raise ValueError("not enough rows for a train/holdout split")
+
+    names = sorted(set(labels.tolist()))
+    le = LabelEncoder().fit(names)
+    y = le.transform(labels)
+    train = ~holdout
+    warm = (current is not None and isinstance(current["model"], LGBMClassifier)
+            and current.get("label_encoder") is not None and list(current["label_encoder"].classes_) == names
+            and set(y[train].tolist()) == set(range(len(names)))
+            and current["model"].booster_.current_iteration() < MAX_WARM_ROUNDS)
+    if warm:
+        params = {**current["model"].get_params(), **WARM_START_PARAMS}
+        clf = LGBMClassifier(**params)
+        clf.fit(X[train], y[train], init_model=current["model"].booster_)
+    else:
+        clf = LGBMClassifier(**SENTRY_LGBM_PARAMS)
+        clf.fit(X[train], y[train])
+    candidate = {"model": clf, "label_encoder": le, "feature_columns": pipeline.output_columns,
+                 "feature_pipeline": pipeline.to_dict(),
+                 "generation": (current or {}).get("generation", 0) + 1, "trained_at": time.time()}
+    if current is None or current.get("ood"):
+        # refit the serving model's novelty scorer on the new training rows
+        candidate["ood"] = OODScorer.fit(X[train], labels[train], X_calibration=X[holdout]).to_dict()
+    if current is not None and current.get("signatures"):
+        candidate["signatures"] = calibrate_signatures(current["signatures"], {c: v[train] for c, v in raw.items()}, labels[train])
+    report["warm_start"] = warm
+
+    esc_rows = from_harvest[holdout]
+    report["candidate"] = evaluate(candidate, X[holdout], labels[holdout], escalate_below, esc_rows)
+    if current is not None:
+        try:
+            report["current"] = evaluate(current, X[holdout], labels[holdout], escalate_below, esc_rows)
+        except Exception as e:
+            report["current"] = {"error": str(e)}
+    cur = report.get("current", {})
+    cand = report["candidate"]
+    if current is None or "accuracy" not in cur:
+        accept = True
+    else:
+        accept = (cand["accuracy"] > cur["accuracy"]
+                  or (cand["accuracy"] >= cur["accuracy"] - ACCURACY_TOLERANCE
+                      and cand["escalation_rate"] < cur["escalation_rate"]))
+    report["accepted"] = accept
+    report["seconds"] = round(time.time() - report["started"], 3)
+    return (candidate if accept else None), report
+
+
+def save_payload(payload: Dict[str, Any], path: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+    """Write a model payload and its mappable artifact atomically, so a concurrent loader never sees a partial file.
+
+    If the model cannot be exported, a stale artifact is removed so the new pickle is the one loaded.
+    """
+    tmp = path + ".tmp"
+    joblib.dump(payload, tmp)
+    os.replace(tmp, path)
+    try:
+        write_artifact(payload, artifact_path(path), metadata)
+    except ValueError:
+        if os.path.exists(artifact_path(path)):
+            os.remove(artifact_path(path))
@@ -0,0 +1,189 @@
+"""Learned destination/service index: dest_ip:dest_port -> app_type from past decisions.
+
+The same CDN and conferencing endpoints are reached by many clients, and
+every flow to them used to be classified from scratch. `DestinationIndex`
+remembers confident Sentry and Vanguard decisions per destination, at two
+granularities:
+
+- the exact destination, "203.0.113.7:443";
+- its prefix, "203.0.113.0/24:443" (/64 for IPv6), which covers CDN
+  address pools.
+
+Each entry holds a decayed weight per app_type (half-life `half_life`
+seconds, decayed lazily on access). `lookup` answers from the exact entry,
+else the prefix entry, when its support (decayed weight) is at least
+`min_support` and its agreement (top app's share) at least `min_agreement`.
+The cascade then labels the flow with one dict lookup, before any model call.
+
+Flows answered by the index are not fed back to it. Evidence for a
+destination therefore decays until the destination drops below
+`min_support`, and the next flows to it are classified by the model again
+and refresh it. The index holds at most `max_entries` keys, evicting the
+least recently updated. It is saved to and loaded from a JSON file. It is
+cleared when the serving model changes (`set_model_key`), since its labels
+are the old model's decisions.
+"""
+
+import collections
+import ipaddress
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+INDEX_VERSION = 1
+V6_PREFIX = 64
+# engines whose decisions are evidence; Rules/Index/Policy answers would only echo themselves
+EVIDENCE_ENGINES = ("Sentry", "Vanguard")
+
+
+def _prefix(ip: str) -> Optional[str]:
+    """The /24 (IPv4) or /64 (IPv6) network of `ip`, or None if it is not an address."""
+    if ":" not in ip:
+        parts = ip.split(".")
+        return ".".join(parts[:3]) + ".0/24" if len(parts) == 4 else None
+    try:
+        return str(ipaddress.ip_network(f"{ip}/{V6_PREFIX}", strict=False))
+    except ValueError:
+        return None
+
+
+class DestinationIndex:
+    """Bounded, decaying, persisted map from destination (exact or prefix) and port to app_type evidence."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100_000, half_life: float = 3600.0,
+                 min_support: float = 5.0, min_agreement: float = 0.95, min_confidence: float = 0.95):
+        self.path = path
+        self.max_entries = max_entries
+        self.half_life = half_life
+        self.min_support = min_support
+        self.min_agreement = min_agreement
+        self.min_confidence = min_confidence
+        self.model_key: Optional[str] = None
+        self._lock = threading.Lock()
+        # key -> [{app_type: weight}, last update (wall clock)]; ordered by last update
+        self._entries: "collections.OrderedDict[str, list]" = collections.OrderedDict()
+        self.stats = {"observed": 0, "hits_exact": 0, "hits_prefix": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _keys(self, features: Mapping[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        ip = str(features.get("dest_ip") or "")
+        if not ip:
+            return None, None
+        port = features.get("dest_port") or 0
+        prefix = _prefix(ip)
+        return f"{ip}:{port}", (f"{prefix}:{port}" if prefix else None)
+
+    def _decay(self, entry: list, now: float) -> float:
+        return 0.5 ** (max(0.0, now - entry[1]) / self.half_life)
+
+    def observe(self, features: Mapping[str, Any], app_type: str, confidence: float, engine: str) -> bool:
+        """Add one decision as evidence; returns False if it is not confident or not from an evidence engine."""
+        if engine not in EVIDENCE_ENGINES or confidence < self.min_confidence or not app_type or app_type == "Unknown":
+            return False
+        now = time.time()
+        with self._lock:
+            for key in self._keys(features):
+                if key is None:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = [{}, now]
+                else:
+                    factor = self._decay(entry, now)
+                    entry[0] = {app: w * factor for app, w in entry[0].items() if w * factor >= 0.01}
+                    entry[1] = now
+                    self._entries.move_to_end(key)
+                entry[0][app_type] = entry[0].get(app_type, 0.0) + 1.0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self.stats["observed"] += 1
+        return True
+
+    def _evidence(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or not entry[0]:
+            return None
+        total = sum(entry[0].values())
+        app, weight = max(entry[0].items(), key=lambda kv: kv[1])
+        return {"key": key, "app_type": app, "support": round(total * self._decay(entry, now), 3),
+                "agreement": round(weight / total, 4)}
+
+    def lookup(self, features: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+        """{key, app_type, support, agreement} of the first strong entry (exact, then prefix), or None."""
+        now = time.time()
+        with self._lock:
+            if not self._entries:
+                self.stats["misses"] += 1
+                return None
+            for key, stat in zip(self._keys(features), ("hits_exact", "hits_prefix")):
+                ev = self._evidence(key, now) if key is not None else None
+                if ev is not None and ev["support"] >= self.min_support and ev["agreement"] >= self.min_agreement:
+                    self.stats[stat] += 1
+                    return ev
+            self.stats["misses"] += 1
+            return None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def set_model_key(self, model_key: Optional[str]) -> bool:
+        """Record the serving model's identity; clears the index if it changed. Returns True if cleared."""
+        if model_key == self.model_key:
+            return False
+        cleared = self.model_key is not None and bool(self._entries)
+        if cleared:
+            self.invalidate()
+        self.model_key = model_key
+        return cleared
+
+    def top(self, limit: int = 20) -> list:
+        """The `limit` destinations with the most decayed support."""
+        now = time.time()
+        with self._lock:
+            evidence = [self._evidence(k, now) for k in self._entries]
+        return sorted((e for e in evidence if e), key=lambda e: -e["support"])[:limit]
+
+    def save(self) -> None:
+        """Write the index atomically to `path` (no-op without a path)."""
+        if not self.path:
+            return
+        with self._lock:
+            data = {"version": INDEX_VERSION, "model_key": self.model_key,
+                    "entries": [[k, e[0], e[1]] for k, e in self._entries.items()]}
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, self.path)
+
+    def load(self, model_key: Optional[str]) -> int:
+        """Load `path` if it was saved for `model_key`; returns the number of entries loaded."""
+        self.model_key = model_key
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return 0
+        if data.get("version") != INDEX_VERSION or data.get("model_key") != model_key:
+            return 0
+        with self._lock:
+            self._entries.clear()
+            for key, counts, ts in data.get("entries", [])[-self.max_entries:]:
+                self._entries[key] = [{str(a): float(w) for a, w in counts.items()}, float(ts)]
+        return len(self._entries)
+
+    def snapshot(self) -> Dict[str, Any]:
+        hits = self.stats["hits_exact"] + self.stats["hits_prefix"]
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "model_key": self.model_key,
+                "min_support": self.min_support, "min_agreement": self.min_agreement, "half_life": self.half_life,
+                "hit_rate": round(hits / max(1, hits + self.stats["misses"]), 4), "stats": dict(self.stats)}
@@ -0,0 +1,194 @@
+"""Escalation-budget controller for the Sentry -> Vanguard hand-off.
+
+A fixed confidence threshold makes the Vanguard (LLM) load a side effect of
+the traffic mix. When traffic shifts towards flows the model is unsure
+about, LLM calls jump with it. `EscalationController` turns LLM capacity
+into a budget instead:
+
+- Every Sentry decision feeds the confidence into a decayed histogram for
+  its predicted class. The bins are on a -log10(1 - confidence) scale, so
+  the 0.99 .. 0.9999 range the model lives in is resolved finely. These
+  histograms are the streaming quantile estimates.
+- Every `update_interval` seconds the allowed escalation rate is recomputed
+  as the configured `target_rate`, capped by `llm_budget_cps` divided by the
+  observed flow rate. Each class's threshold becomes the quantile of its
+  recent confidences at that rate, clamped to the operator's
+  [min_threshold, max_threshold]. Classes with too few samples use the
+  pooled histogram.
+- A token bucket refilled at `llm_budget_cps` is the hard guarantee. An
+  escalation without a token is answered by Sentry instead and counted as
+  `budget_denied`, so LLM calls never exceed the budget even before the
+  thresholds have caught up with a traffic shift.
+
+With neither a target nor a budget, every class uses `default_threshold`
+(the old fixed behaviour); the controller then only observes. When the
+model has an OOD scorer, `decide` also takes the flow's novelty. Flows
+below their threshold that are still in-distribution then keep the Sentry
+answer and are counted as `familiar`.
+"""
+
+import collections
+import math
+import threading
+import time
+from typing import Any, Deque, Dict, Optional
+
+import numpy as np
+
+from ood_detector import needs_vanguard
+
+BINS = 600
+MAX_DECADES = 6.0  # confidences above 1 - 1e-6 share the top bin
+
+# decide() outcomes
+SENTRY = "sentry"
+ESCALATE = "escalate"
+BUDGET_DENIED = "budget_denied"
+FAMILIAR = "familiar"  # below threshold but in-distribution (see ood_detector.needs_vanguard)
+
+
+def _bin(confidence: float) -> int:
+    x = -math.log10(max(1.0 - min(max(confidence, 0.0), 1.0), 10 ** -MAX_DECADES))
+    return min(BINS - 1, int(x / MAX_DECADES * BINS))
+
+
+def _bin_floor(i: int) -> float:
+    """Smallest confidence that falls in bin i."""
+    return 1.0 - 10 ** -(i * MAX_DECADES / BINS)
+
+
+class EscalationController:
+    """Per-class Sentry confidence thresholds steered towards an escalation rate or LLM calls/s budget."""
+
+    def __init__(self, target_rate: Optional[float] = None, llm_budget_cps: Optional[float] = None,
+                 min_threshold: float = 0.5, max_threshold: float = 0.9999, default_threshold: float = 0.95,
+                 half_life: float = 60.0, update_interval: float = 1.0, min_samples: int = 200,
+                 burst_seconds: float = 2.0, history: int = 100):
+        self.target_rate = target_rate
+        self.llm_budget_cps = llm_budget_cps
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.default_threshold = default_threshold
+        self.half_life = half_life
+        self.update_interval = update_interval
+        self.min_samples = min_samples
+        self.burst_seconds = burst_seconds
+        self._lock = threading.Lock()
+        self._hist: Dict[str, np.ndarray] = {}
+        self._pooled = np.zeros(BINS)
+        self.thresholds: Dict[str, float] = {}
+        self.allowed_rate: Optional[float] = None
+        self.flow_rate = 0.0
+        self._window_flows = 0
+        self._last_update = time.monotonic()
+        self._tokens = self._capacity()
+        self._last_refill = self._last_update
+        self.stats = {"decisions": 0, SENTRY: 0, FAMILIAR: 0, ESCALATE: 0, BUDGET_DENIED: 0, "updates": 0}
+        self.per_class: Dict[str, Dict[str, int]] = {}
+        self.history: Deque[Dict[str, Any]] = collections.deque(maxlen=history)
+
+    @property
+    def active(self) -> bool:
+        return self.target_rate is not None or self.llm_budget_cps is not None
+
+    def _capacity(self) -> float:
+        # a zero budget allows no calls at all; otherwise at least one call can always burst
+        return max(1.0, self.llm_budget_cps * self.burst_seconds) if self.llm_budget_cps else 0.0
+
+    def configure(self, **settings: Any) -> None:
+        """Change target_rate, llm_budget_cps, min/max/default_threshold at runtime (None clears a target)."""
+        with self._lock:
+            for key, value in settings.items():
+                if key not in ("target_rate", "llm_budget_cps", "min_threshold", "max_threshold", "default_threshold"):
+                    raise KeyError(key)
+                setattr(self, key, value)
+            self._tokens = min(self._tokens, self._capacity())
+            self._recompute(time.monotonic(), reason="configured")
+
+    def threshold(self, label: str) -> float:
+        return self.thresholds.get(label, self.default_threshold) if self.active else self.default_threshold
+
+    def decide(self, label: str, confidence: float, novelty: Optional[float] = None) -> str:
+        """Record one Sentry decision and return SENTRY, FAMILIAR, ESCALATE or BUDGET_DENIED."""
+        with self._lock:
+            now = time.monotonic()
+            hist = self._hist.get(label)
+            if hist is None:
+                hist = self._hist[label] = np.zeros(BINS)
+            b = _bin(confidence)
+            hist[b] += 1.0
+            self._pooled[b] += 1.0
+            self._window_flows += 1
+            if now - self._last_update >= self.update_interval:
+                self._recompute(now)
+            if not needs_vanguard(confidence, self.threshold(label), novelty):
+                outcome = SENTRY if novelty is None or confidence >= self.threshold(label) else FAMILIAR
+            elif self.llm_budget_cps is None:
+                outcome = ESCALATE
+            else:
+                self._tokens = min(self._capacity(), self._tokens + (now - self._last_refill) * self.llm_budget_cps)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    outcome = ESCALATE
+                else:
+                    outcome = BUDGET_DENIED
+            self.stats["decisions"] += 1
+            self.stats[outcome] += 1
+            counts = self.per_class.setdefault(label, {SENTRY: 0, FAMILIAR: 0, ESCALATE: 0, BUDGET_DENIED: 0})
+            counts[outcome] += 1
+            return outcome
+
+    def _quantile(self, hist: np.ndarray, rate: float) -> float:
+        cum = np.cumsum(hist)
+        i = int(np.searchsorted(cum, rate * cum[-1], side="left"))
+        return _bin_floor(min(i, BINS - 1))
+
+    def _recompute(self, now: float, reason: str = "interval") -> None:
+        dt = max(now - self._last_update, 1e-9)
+        decay = 0.5 ** (dt / self.half_life)
+        alpha = 1.0 - decay
+        self.flow_rate = alpha * (self._window_flows / dt) + decay * self.flow_rate if self.stats["updates"] else self._window_flows / dt
+        self._window_flows = 0
+        self._last_update = now
+        self.stats["updates"] += 1
+        for hist in self._hist.values():
+            hist *= decay
+        self._pooled *= decay
+        if not self.active:
+            self.allowed_rate = None
+            self.thresholds = {}
+            return
+        rate = 1.0 if self.target_rate is None else self.target_rate
+        if self.llm_budget_cps is not None and self.flow_rate > 0:
+            rate = min(rate, self.llm_budget_cps / self.flow_rate)
+        self.allowed_rate = rate
+        pooled_ok = self._pooled.sum() >= self.min_samples
+        thresholds = {}
+        for label, hist in self._hist.items():
+            if hist.sum() >= self.min_samples:
+                t = self._quantile(hist, rate)
+            elif pooled_ok:
+                t = self._quantile(self._pooled, rate)
+            else:
+                t = self.default_threshold
+            thresholds[label] = round(min(self.max_threshold, max(self.min_threshold, t)), 6)
+        changed = thresholds != self.thresholds
+        self.thresholds = thresholds
+        if changed or reason != "interval":
+            self.history.append({"ts": time.time(), "reason": reason, "allowed_rate": round(rate, 6),
+                                 "flow_rate": round(self.flow_rate, 3), "thresholds": dict(thresholds)})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Settings, current thresholds, observed rates and decision counters."""
+        with self._lock:
+            decisions = max(1, self.stats["decisions"])
+            return {
+                "active": self.active, "target_rate": self.target_rate, "llm_budget_cps": self.llm_budget_cps,
+                "min_threshold": self.min_threshold, "max_threshold": self.max_threshold,
+                "default_threshold": self.default_threshold, "allowed_rate": self.allowed_rate,
+                "flow_rate": round(self.flow_rate, 3), "tokens": round(self._tokens, 3) if self.llm_budget_cps else None,
+                "thresholds": dict(self.thresholds), "escalation_rate": round(self.stats[ESCALATE] / decisions, 6),
+                "stats": dict(self.stats), "per_class": {k: dict(v) for k, v in self.per_class.items()},
+                "history": list(self.history)[-20:],
+            }
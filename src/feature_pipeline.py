@@ -0,0 +1,152 @@
+"""Declarative Sentry feature pipeline, shared by training and serving.
+
+A pipeline is a JSON-serializable list of steps, each producing one model
+input column from raw flow columns:
+
+    {"name": "bytes_per_sec", "op": "ratio", "num": "bytes_total", "den": "duration_seconds"}
+
+Ops:
+  input  - the raw column itself                      {"input": col}
+  ratio  - num / max(den, eps)                        {"num": col, "den": col, "eps": 1e-3}
+  log1p  - log(1 + max(x, 0))                         {"input": col}
+  bucket - index of the bucket x falls in             {"input": col, "edges": [e1, e2, ...]}
+  isin   - 1.0 if x is one of the values, else 0.0    {"input": col, "values": [...]}
+
+train_sentry.py stores the spec in the model payload (and so in the model
+artifact) next to `feature_columns`, which must equal the step names.
+SentryWrapper rebuilds the same pipeline from the payload, so the features
+the model sees at serving time are computed by the same code from the same
+spec as at training time. The spec is compiled once into a list of
+vectorized column functions. Rows are turned into columns first, so a
+batch of flows costs one NumPy operation per step, not one Python lookup
+per feature per flow. Missing raw values become 0, as SentryWrapper's
+`features.get(c, 0)` did; a pipeline reading columns that are not FlowFeatures
+fields (e.g. the bundled CSV's feature1..3) would see only zeros at serving
+time, so SentryWrapper refuses to serve it (see `foreign_inputs`).
+"""
+
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+PIPELINE_VERSION = 1
+
+# numeric FlowFeatures fields the default pipeline reads
+FLOW_INPUTS = ("packet_count", "avg_pkt_len", "duration_seconds", "bytes_total", "dest_port")
+# well-known (<1024), registered (<49152) and dynamic ports
+PORT_EDGES = [1024, 49152]
+REALTIME_PORTS = [3478, 5004, 5005, 19302, 3074, 27015]
+
+DEFAULT_STEPS: List[Dict[str, Any]] = [
+    *({"name": c, "op": "input", "input": c} for c in FLOW_INPUTS),
+    {"name": "bytes_per_sec", "op": "ratio", "num": "bytes_total", "den": "duration_seconds"},
+    {"name": "packets_per_sec", "op": "ratio", "num": "packet_count", "den": "duration_seconds"},
+    {"name": "log_bytes_total", "op": "log1p", "input": "bytes_total"},
+    {"name": "log_packet_count", "op": "log1p", "input": "packet_count"},
+    {"name": "log_duration", "op": "log1p", "input": "duration_seconds"},
+    {"name": "port_bucket", "op": "bucket", "input": "dest_port", "edges": PORT_EDGES},
+    {"name": "realtime_port", "op": "isin", "input": "dest_port", "values": REALTIME_PORTS},
+]
+
+
+def _compile_step(step: Mapping[str, Any]) -> Callable[[Dict[str, np.ndarray]], np.ndarray]:
+    op = step.get("op")
+    if op == "input":
+        src = step["input"]
+        return lambda cols: cols[src]
+    if op == "ratio":
+        num, den, eps = step["num"], step["den"], float(step.get("eps", 1e-3))
+        return lambda cols: cols[num] / np.maximum(cols[den], eps)
+    if op == "log1p":
+        src = step["input"]
+        return lambda cols: np.log1p(np.maximum(cols[src], 0.0))
+    if op == "bucket":
+        src, edges = step["input"], np.asarray(step["edges"], dtype=np.float64)
+        return lambda cols: np.searchsorted(edges, cols[src], side="right").astype(np.float64)
+    if op == "isin":
+        src, values = step["input"], np.asarray(step["values"], dtype=np.float64)
+        return lambda cols: np.isin(cols[src], values).astype(np.float64)
+    raise ValueError(f"unknown feature op {op!r} in step {step.get('name')!r}")
+
+
+def _step_inputs(step: Mapping[str, Any]) -> List[str]:
+    return [step[k] for k in ("input", "num", "den") if k in step]
+
+
+class FeaturePipeline:
+    """Compiled pipeline: raw flow rows or columns -> float64 model matrix in `output_columns` order."""
+
+    def __init__(self, steps: Sequence[Mapping[str, Any]]):
+        self.steps = [dict(s) for s in steps]
+        self.output_columns: List[str] = [s["name"] for s in self.steps]
+        if len(set(self.output_columns)) != len(self.output_columns):
+            raise ValueError("feature pipeline step names must be unique")
+        self.inputs: List[str] = list(dict.fromkeys(c for s in self.steps for c in _step_inputs(s)))
+        self._fns = [_compile_step(s) for s in self.steps]
+
+    @classmethod
+    def default(cls) -> "FeaturePipeline":
+        return cls(DEFAULT_STEPS)
+
+    @classmethod
+    def passthrough(cls, columns: Sequence[str]) -> "FeaturePipeline":
+        """Raw columns as they are: the implicit pipeline of payloads saved before pipelines existed."""
+        return cls([{"name": c, "op": "input", "input": c} for c in columns])
+
+    @classmethod
+    def for_columns(cls, columns: Sequence[str]) -> "FeaturePipeline":
+        """The default pipeline when all of its inputs are available, otherwise the columns passed through."""
+        if set(FLOW_INPUTS) <= set(columns):
+            return cls.default()
+        return cls.passthrough(columns)
+
+    @classmethod
+    def from_dict(cls, spec: Mapping[str, Any]) -> "FeaturePipeline":
+        if spec.get("version") != PIPELINE_VERSION:
+            raise ValueError(f"unsupported feature pipeline version {spec.get('version')}")
+        return cls(spec["steps"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": PIPELINE_VERSION, "steps": self.steps}
+
+    def foreign_inputs(self) -> List[str]:
+        """Raw inputs that are not FlowFeatures fields: always zero when serving flows."""
+        return [c for c in self.inputs if c not in FLOW_INPUTS]
+
+    def select(self, columns: Sequence[str]) -> "FeaturePipeline":
+        """The pipeline restricted to the steps producing `columns`, in that order."""
+        by_name = {s["name"]: s for s in self.steps}
+        return FeaturePipeline([by_name[c] for c in columns])
+
+    def transform_columns(self, columns: Mapping[str, Any], n: Optional[int] = None) -> np.ndarray:
+        """Model matrix from a dict of equal-length raw columns; absent inputs are zeros."""
+        if n is None:
+            n = len(next(iter(columns.values()))) if columns else 0
+        cols = {}
+        for c in self.inputs:
+            if c in columns:
+                cols[c] = np.nan_to_num(np.asarray(columns[c], dtype=np.float64), nan=0.0)
+            else:
+                cols[c] = np.zeros(n)
+        out = np.empty((n, len(self._fns)), dtype=np.float64)
+        for j, fn in enumerate(self._fns):
+            out[:, j] = fn(cols)
+        return out
+
+    def transform_rows(self, rows: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """Model matrix from raw feature dicts (e.g. FlowFeatures.dict())."""
+        columns = {c: np.array([r.get(c) for r in rows], dtype=np.float64) for c in self.inputs}
+        return self.transform_columns(columns, len(rows))
+
+
+def payload_pipeline(payload: Mapping[str, Any]) -> FeaturePipeline:
+    """The pipeline a model payload was trained with (passthrough for payloads without one).
+
+    Raises ValueError if the pipeline does not produce the payload's feature columns.
+    """
+    spec = payload.get("feature_pipeline")
+    columns = list(payload.get("feature_columns") or [])
+    pipeline = FeaturePipeline.from_dict(spec) if spec else FeaturePipeline.passthrough(columns)
+    if columns and pipeline.output_columns != columns:
+        raise ValueError("feature pipeline does not match the model's feature columns")
+    return pipeline
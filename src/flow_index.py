@@ -0,0 +1,259 @@
+"""Indexed in-memory record store backing the /flows and /policies query API.
+
+Records (flows or policies) are kept in insertion order and every record gets a
+monotonically increasing sequence number. Secondary indexes map a field value
+to a sorted list of sequence numbers, so a filtered query only walks the
+smallest matching bucket instead of every record. Pagination uses the sequence
+number as an opaque cursor, which stays valid while records are added, updated
+or evicted. Removal leaves the sequence number in the list of all records as a
+tombstone (queries skip sequence numbers with no record); the list is compacted
+once tombstones outnumber live records, and eviction finds the oldest record
+by advancing a head position past tombstones, so both are amortized O(1).
+"""
+
+import bisect
+import heapq
+import ipaddress
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Prefix length used to bucket IP fields for CIDR queries
+IPV4_BUCKET_PREFIX = 24
+IPV6_BUCKET_PREFIX = 64
+
+MAX_PAGE_SIZE = 500
+
+
+def _ip_bucket(value: Any) -> Optional[str]:
+    try:
+        ip = ipaddress.ip_address(str(value))
+    except ValueError:
+        return None
+    prefix = IPV4_BUCKET_PREFIX if ip.version == 4 else IPV6_BUCKET_PREFIX
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+def _from_position(seqs: List[int], start: int) -> Iterator[int]:
+    """Iterate the sorted `seqs` from the first value >= start without copying the tail."""
+    return map(seqs.__getitem__, range(bisect.bisect_left(seqs, start), len(seqs)))
+
+
+class IndexedStore:
+    """Bounded record store with secondary indexes and cursor pagination.
+
+    `fields` are indexed by exact value; `cidr_fields` are additionally bucketed
+    by /24 (IPv4) or /64 (IPv6) network so `source_ip=10.0.0.0/8` style filters
+    only visit the buckets inside the requested network. When `capacity` is
+    reached the oldest record is evicted and `on_evict(key, record)` is called.
+    """
+
+    def __init__(self, fields: Iterable[str], cidr_fields: Iterable[str] = (), capacity: Optional[int] = None,
+                 on_evict: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.cidr_fields = tuple(cidr_fields)
+        self.fields = tuple(fields) + tuple(f for f in self.cidr_fields if f not in fields)
+        self.capacity = capacity
+        self.on_evict = on_evict
+        # key -> record, in insertion order
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._seq_of: Dict[str, int] = {}
+        self._key_of: Dict[int, str] = {}
+        self._attrs: Dict[str, Dict[str, Any]] = {}
+        self._index: Dict[str, Dict[Any, List[int]]] = {f: {} for f in self.fields}
+        self._net_index: Dict[str, Dict[str, List[int]]] = {f: {} for f in self.cidr_fields}
+        # every live sequence number in order, plus tombstones of removed ones
+        self._all: List[int] = []
+        # position in _all before which there are only tombstones
+        self._head = 0
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.records
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.records.get(key, default)
+
+    def values(self):
+        return self.records.values()
+
+    # --- index maintenance ---
+    @staticmethod
+    def _bucket_add(index: Dict[Any, List[int]], value: Any, seq: int) -> None:
+        bucket = index.setdefault(value, [])
+        if not bucket or bucket[-1] < seq:
+            bucket.append(seq)
+        else:
+            bisect.insort(bucket, seq)
+
+    @staticmethod
+    def _bucket_remove(index: Dict[Any, List[int]], value: Any, seq: int) -> None:
+        bucket = index.get(value)
+        if not bucket:
+            return
+        pos = bisect.bisect_left(bucket, seq)
+        if pos < len(bucket) and bucket[pos] == seq:
+            del bucket[pos]
+        if not bucket:
+            del index[value]
+
+    def _index_attrs(self, seq: int, attrs: Dict[str, Any]) -> None:
+        for f in self.fields:
+            value = attrs.get(f)
+            if value is not None:
+                self._bucket_add(self._index[f], value, seq)
+        for f in self.cidr_fields:
+            net = _ip_bucket(attrs.get(f)) if attrs.get(f) is not None else None
+            if net is not None:
+                self._bucket_add(self._net_index[f], net, seq)
+
+    def _unindex_attrs(self, seq: int, attrs: Dict[str, Any]) -> None:
+        for f in self.fields:
+            value = attrs.get(f)
+            if value is not None:
+                self._bucket_remove(self._index[f], value, seq)
+        for f in self.cidr_fields:
+            net = _ip_bucket(attrs.get(f)) if attrs.get(f) is not None else None
+            if net is not None:
+                self._bucket_remove(self._net_index[f], net, seq)
+
+    def _extract(self, record: Dict[str, Any], extra: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        attrs = {f: record.get(f) for f in self.fields}
+        if extra:
+            attrs.update({k: v for k, v in extra.items() if k in attrs})
+        return attrs
+
+    def upsert(self, key: str, record: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Insert or update a record and refresh its index entries.
+
+        `extra` supplies indexed values that are not stored on the record itself
+        (e.g. the source_ip of the flow a policy belongs to). Updates keep the
+        record's original sequence number so cursors stay stable.
+        """
+        attrs = self._extract(record, extra)
+        seq = self._seq_of.get(key)
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._seq_of[key] = seq
+            self._key_of[seq] = key
+            self.records[key] = record
+            self._attrs[key] = attrs
+            self._all.append(seq)
+            self._index_attrs(seq, attrs)
+            self._enforce_capacity()
+            return record
+
+        old = self._attrs[key]
+        if old != attrs:
+            changed = {f for f in self.fields if old.get(f) != attrs.get(f)}
+            self._unindex_attrs(seq, {f: old.get(f) for f in changed})
+            self._index_attrs(seq, {f: attrs.get(f) for f in changed})
+            self._attrs[key] = attrs
+        self.records[key] = record
+        return record
+
+    def touch(self, key: str, extra: Optional[Dict[str, Any]] = None) -> None:
+        """Re-index a record after it was mutated in place."""
+        record = self.records.get(key)
+        if record is not None:
+            self.upsert(key, record, extra)
+
+    def remove(self, key: str) -> Optional[Dict[str, Any]]:
+        seq = self._seq_of.pop(key, None)
+        if seq is None:
+            return None
+        del self._key_of[seq]
+        if len(self._all) > 2 * len(self._key_of) + 64:
+            self._all = [s for s in self._all[self._head:] if s in self._key_of]
+            self._head = 0
+        self._unindex_attrs(seq, self._attrs.pop(key))
+        return self.records.pop(key, None)
+
+    def _enforce_capacity(self) -> None:
+        if not self.capacity:
+            return
+        while len(self.records) > self.capacity:
+            while self._all[self._head] not in self._key_of:
+                self._head += 1
+            oldest = self._key_of[self._all[self._head]]
+            record = self.remove(oldest)
+            if self.on_evict is not None and record is not None:
+                self.on_evict(oldest, record)
+
+    # --- querying ---
+    def _cidr_candidates(self, field: str, value: str) -> List[List[int]]:
+        net = ipaddress.ip_network(value, strict=False)
+        bucket_prefix = IPV4_BUCKET_PREFIX if net.version == 4 else IPV6_BUCKET_PREFIX
+        buckets = self._net_index[field]
+        if net.prefixlen >= bucket_prefix:
+            key = str(net.supernet(new_prefix=bucket_prefix)) if net.prefixlen > bucket_prefix else str(net)
+            bucket = buckets.get(key)
+            return [bucket] if bucket else []
+        # Wide network: visit only the populated buckets that fall inside it
+        return [b for k, b in buckets.items() if ipaddress.ip_network(k).subnet_of(net)]
+
+    def _matches(self, key: str, exact: Dict[str, Any], networks: Dict[str, Any]) -> bool:
+        attrs = self._attrs[key]
+        for f, v in exact.items():
+            if attrs.get(f) != v:
+                return False
+        for f, net in networks.items():
+            try:
+                if ipaddress.ip_address(str(attrs.get(f))) not in net:
+                    return False
+            except ValueError:
+                return False
+        return True
+
+    def query(self, filters: Optional[Dict[str, Any]] = None, cursor: Optional[str] = None,
+              limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return up to `limit` records matching all filters, oldest first.
+
+        Filters on `cidr_fields` accept either an exact address or a CIDR
+        network. The smallest candidate bucket drives the walk; remaining
+        filters are checked against the cached index attributes. The walk
+        starts at the cursor by bisection, so a page costs O(log n) plus the
+        records it visits, however deep the cursor is. Returns
+        `(items, next_cursor)`; `next_cursor` is None on the last page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        start = int(cursor) if cursor else 0
+        exact: Dict[str, Any] = {}
+        networks: Dict[str, Any] = {}
+        for f, v in (filters or {}).items():
+            if v is None:
+                continue
+            if f not in self._index:
+                raise KeyError(f"field '{f}' is not indexed")
+            if f in self.cidr_fields and "/" in str(v):
+                networks[f] = ipaddress.ip_network(str(v), strict=False)
+            else:
+                exact[f] = v
+
+        # Pick the smallest exact bucket (or the CIDR bucket union) as the driver
+        driver: Optional[Iterator[int]] = None
+        driver_size = None
+        for f, v in exact.items():
+            bucket = self._index[f].get(v, [])
+            if driver_size is None or len(bucket) < driver_size:
+                driver_size = len(bucket)
+                driver = _from_position(bucket, start)
+        for f, net in networks.items():
+            buckets = self._cidr_candidates(f, str(net))
+            size = sum(len(b) for b in buckets)
+            if driver_size is None or size < driver_size:
+                driver_size = size
+                driver = heapq.merge(*(_from_position(b, start) for b in buckets))
+        if driver is None:
+            driver = _from_position(self._all, start)
+
+        items: List[Dict[str, Any]] = []
+        for seq in driver:
+            key = self._key_of.get(seq)
+            if key is None or not self._matches(key, exact, networks):
+                continue
+            if len(items) == limit:
+                return items, str(seq)
+            items.append(self.records[key])
+        return items, None
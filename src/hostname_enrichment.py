@@ -0,0 +1,284 @@
+"""Hostname enrichment for flows: TLS SNI, DNS answers and domain rules.
+
+Three pieces:
+
+- `parse_sni` and `parse_dns_answers` read a TLS ClientHello or a DNS
+  response directly from a packet buffer (the pcap mapping) by offset. No
+  packet bytes are copied except the hostname itself.
+- `HostnameCache` maps server IPs to hostnames. It learns from DNS answers,
+  kept for the record's TTL clamped to [min_ttl, max_ttl], and from SNI,
+  kept for SNI_TTL. It holds at most `max_entries` addresses and evicts the
+  oldest. Times are capture times, so replays age entries like live traffic.
+- `DomainMatcher` is a suffix trie over domain labels from rules such as
+  {"domain": "nflxvideo.net", "app_type": "Video Streaming"}. A rule covers
+  the domain and every subdomain, and the longest matching suffix wins, so a
+  lookup costs one dict step per label.
+
+`HostnameEnricher.scan` is called by pcap_ingest once per decoded chunk. A
+NumPy prefilter over the chunk finds the few packets that can carry a
+ClientHello (TCP payload starting with a handshake record) or a DNS
+response (UDP from port 53). Only those are parsed in Python, so packets
+that carry neither cost nothing. A flow's hostname is its own SNI, else
+the cache entry for its destination when its first packet was seen. The cascade's rule tier maps it
+through `DomainMatcher` before signatures or the model are consulted.
+"""
+
+import collections
+import ipaddress
+import struct
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+SNI_TTL = 3600.0
+DNS_PORT = 53
+_TLS_HANDSHAKE = 0x16
+_CLIENT_HELLO = 0x01
+_EXT_SERVER_NAME = 0
+_DNS_A, _DNS_AAAA, _DNS_IN = 1, 28, 1
+_U16 = struct.Struct("!H")
+_DNS_RR = struct.Struct("!HHIH")  # type, class, ttl, rdlength
+
+DEFAULT_DOMAIN_RULES: List[Dict[str, Any]] = [
+    *({"domain": d, "app_type": "Video Streaming"} for d in (
+        "netflix.com", "nflxvideo.net", "youtube.com", "googlevideo.com", "ytimg.com", "twitch.tv", "ttvnw.net",
+        "primevideo.com", "aiv-cdn.net", "disneyplus.com", "dssott.com", "hulu.com", "hbomax.com", "max.com")),
+    *({"domain": d, "app_type": "Audio/Video Call"} for d in (
+        "zoom.us", "zoom.com", "teams.microsoft.com", "skype.com", "meet.google.com", "webex.com", "discord.media",
+        "whatsapp.net", "facetime.apple.com")),
+    *({"domain": d, "app_type": "Gaming"} for d in (
+        "xboxlive.com", "playstation.net", "riotgames.com", "epicgames.dev", "battle.net", "steamserver.net",
+        "ea.com")),
+    *({"domain": d, "app_type": "File Download"} for d in (
+        "steamcontent.com", "download.windowsupdate.com", "dl.delivery.mp.microsoft.com", "swcdn.apple.com",
+        "dl.google.com", "releases.ubuntu.com")),
+    *({"domain": d, "app_type": "Video Upload"} for d in ("upload.youtube.com", "live-video.net", "rtmp.youtube.com")),
+]
+
+
+def _normalize(hostname: str) -> List[str]:
+    return [label for label in hostname.lower().rstrip(".").split(".") if label]
+
+
+class DomainMatcher:
+    """Suffix trie from domain rules to app_type; `match` returns the longest matching rule or None."""
+
+    def __init__(self, rules: Sequence[Mapping[str, Any]] = ()):
+        # node = {label: child node}; the rule sits under the "" key
+        self.root: Dict[str, Any] = {}
+        self.rules: List[Dict[str, Any]] = []
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def add(self, rule: Mapping[str, Any]) -> None:
+        labels = _normalize(str(rule["domain"]).lstrip("*."))
+        if not labels:
+            raise ValueError(f"empty domain in rule {rule!r}")
+        rule = {"confidence": 0.99, **rule}
+        node = self.root
+        for label in reversed(labels):
+            node = node.setdefault(label, {})
+        node[""] = rule
+        self.rules.append(rule)
+
+    def match(self, hostname: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not hostname:
+            return None
+        node, best = self.root, None
+        for label in reversed(_normalize(hostname)):
+            node = node.get(label)
+            if node is None:
+                break
+            best = node.get("", best)
+        return best
+
+
+class HostnameCache:
+    """Bounded IP -> hostname cache with per-entry expiry in capture time.
+
+    Entries also remember when they were learned: a lookup at a capture time
+    before that misses, so a flow does not take a name from a DNS answer that
+    came after its first packet (a pcap chunk is scanned before its flows are
+    counted).
+    """
+
+    def __init__(self, max_entries: int = 100_000, min_ttl: float = 30.0, max_ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        # ip -> (hostname, expires, learned)
+        self._entries: "collections.OrderedDict[str, Tuple[str, float, float]]" = collections.OrderedDict()
+        self.stats = {"stored": 0, "hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, ip: str, hostname: str, now: float, ttl: float) -> None:
+        self._entries.pop(ip, None)
+        self._entries[ip] = (hostname, now + min(max(ttl, self.min_ttl), self.max_ttl), now)
+        self.stats["stored"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, ip: str, now: float) -> Optional[str]:
+        entry = self._entries.get(ip)
+        if entry is None or entry[2] > now:
+            self.stats["misses"] += 1
+            return None
+        if entry[1] < now:
+            del self._entries[ip]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry[0]
+
+
+def parse_sni(buf, off: int, end: int) -> Optional[str]:
+    """server_name of a TLS ClientHello whose record starts at `off`, or None.
+
+    Only a ClientHello that fits in this segment is read; a hello split
+    across TCP segments yields None.
+    """
+    try:
+        if buf[off] != _TLS_HANDSHAKE or buf[off + 5] != _CLIENT_HELLO:
+            return None
+        end = min(end, off + 5 + _U16.unpack_from(buf, off + 3)[0])
+        p = off + 5 + 4 + 2 + 32  # record header, handshake header, client version, random
+        p += 1 + buf[p]  # session id
+        p += 2 + _U16.unpack_from(buf, p)[0]  # cipher suites
+        p += 1 + buf[p]  # compression methods
+        ext_end = min(end, p + 2 + _U16.unpack_from(buf, p)[0])
+        p += 2
+        while p + 4 <= ext_end:
+            ext_type, ext_len = _U16.unpack_from(buf, p)[0], _U16.unpack_from(buf, p + 2)[0]
+            p += 4
+            if ext_type == _EXT_SERVER_NAME:
+                # server_name_list length, then name_type (0 = host_name), name length, name
+                if p + 5 <= ext_end and buf[p + 2] == 0:
+                    n = _U16.unpack_from(buf, p + 3)[0]
+                    if p + 5 + n <= ext_end:
+                        return bytes(buf[p + 5:p + 5 + n]).decode("ascii", "ignore").lower() or None
+                return None
+            p += ext_len
+    except (IndexError, struct.error):
+        pass
+    return None
+
+
+def _skip_name(buf, p: int, end: int) -> int:
+    """Offset just past a (possibly compressed) DNS name at p."""
+    while p < end:
+        n = buf[p]
+        if n == 0:
+            return p + 1
+        if n & 0xC0 == 0xC0:
+            return p + 2
+        p += 1 + n
+    raise IndexError("DNS name runs past the packet")
+
+
+def _read_name(buf, p: int, base: int, end: int) -> str:
+    labels: List[str] = []
+    for _ in range(64):  # bounds compression-pointer loops
+        n = buf[p]
+        if n == 0:
+            break
+        if n & 0xC0 == 0xC0:
+            p = base + (((n & 0x3F) << 8) | buf[p + 1])
+            continue
+        if p + 1 + n > end:
+            raise IndexError("DNS label runs past the packet")
+        labels.append(bytes(buf[p + 1:p + 1 + n]).decode("ascii", "ignore"))
+        p += 1 + n
+    return ".".join(labels).lower()
+
+
+def parse_dns_answers(buf, off: int, end: int) -> List[Tuple[str, str, int]]:
+    """(address, queried name, ttl) for each A/AAAA answer of a DNS response at `off`.
+
+    Answers are attributed to the question name, so an address reached
+    through a CNAME chain (www.example.com -> cdn.example.net -> A) is
+    labelled with the name the client asked for.
+    """
+    out: List[Tuple[str, str, int]] = []
+    try:
+        if end - off < 12 or not buf[off + 2] & 0x80 or buf[off + 3] & 0x0F:
+            return out  # not a response, or an error response
+        qdcount, ancount = _U16.unpack_from(buf, off + 4)[0], _U16.unpack_from(buf, off + 6)[0]
+        if qdcount < 1 or ancount < 1:
+            return out
+        p = off + 12
+        qname = _read_name(buf, p, off, end)
+        for _ in range(qdcount):
+            p = _skip_name(buf, p, end) + 4
+        for _ in range(ancount):
+            p = _skip_name(buf, p, end)
+            rtype, rclass, ttl, rdlen = _DNS_RR.unpack_from(buf, p)
+            p += 10
+            if p + rdlen > end:
+                break
+            if rclass == _DNS_IN and ((rtype == _DNS_A and rdlen == 4) or (rtype == _DNS_AAAA and rdlen == 16)):
+                out.append((str(ipaddress.ip_address(bytes(buf[p:p + rdlen]))), qname, ttl))
+            p += rdlen
+    except (IndexError, struct.error, ValueError):
+        pass
+    return out
+
+
+def _address(ver: int, hi: int, lo: int) -> str:
+    return str(ipaddress.IPv4Address(lo) if ver == 4 else ipaddress.IPv6Address(hi << 64 | lo))
+
+
+class HostnameEnricher:
+    """Finds SNI and DNS answers in decoded pcap chunks and fills the hostname cache."""
+
+    def __init__(self, cache: Optional[HostnameCache] = None):
+        self.cache = cache or HostnameCache()
+        self.stats = {"client_hellos": 0, "sni": 0, "dns_responses": 0, "dns_answers": 0}
+
+    def scan(self, buf, buf8: np.ndarray, cols: Dict[str, np.ndarray]) -> Optional[Tuple[np.ndarray, List[str]]]:
+        """Learn from one decoded chunk (see pcap_ingest.decode_chunk).
+
+        Returns (packet indices, SNI hostnames) of the chunk's ClientHellos,
+        or None when there are none.
+        """
+        l4, end, proto = cols["l4"], cols["end"], cols["proto"]
+        has_l4 = l4 >= 0
+        last = len(buf8) - 1
+        tcp = np.flatnonzero(has_l4 & (proto == 6))
+        hellos: List[int] = []
+        payloads: List[int] = []
+        if len(tcp):
+            pay = l4[tcp] + (buf8[np.minimum(l4[tcp] + 12, last)] >> 4).astype(np.int64) * 4
+            ok = pay + 43 < end[tcp]
+            ok &= buf8[np.minimum(pay, last)] == _TLS_HANDSHAKE
+            ok &= buf8[np.minimum(pay + 5, last)] == _CLIENT_HELLO
+            hellos = tcp[ok].tolist()
+            payloads = pay[ok].tolist()
+        sni_idx, names = [], []
+        for i, p in zip(hellos, payloads):
+            self.stats["client_hellos"] += 1
+            name = parse_sni(buf, p, int(end[i]))
+            if name is None:
+                continue
+            self.stats["sni"] += 1
+            sni_idx.append(i)
+            names.append(name)
+            self.cache.put(_address(int(cols["ver"][i]), int(cols["b_hi"][i]), int(cols["b_lo"][i])), name,
+                           float(cols["ts"][i]), SNI_TTL)
+        for i in np.flatnonzero(has_l4 & (proto == 17) & (cols["sport"] == DNS_PORT)).tolist():
+            self.stats["dns_responses"] += 1
+            now = float(cols["ts"][i])
+            for ip, name, ttl in parse_dns_answers(buf, int(l4[i]) + 8, int(end[i])):
+                self.stats["dns_answers"] += 1
+                self.cache.put(ip, name, now, ttl)
+        return (np.asarray(sni_idx, dtype=np.int64), names) if sni_idx else None
+
+    def destination(self, ver: int, hi: int, lo: int, ts: float) -> Optional[str]:
+        """Cached hostname of a destination address (high/low 64-bit halves) at capture time `ts`."""
+        return self.cache.get(_address(ver, hi, lo), ts)
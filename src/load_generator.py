@@ -0,0 +1,188 @@
+"""Synthetic high-rate flow generator for capacity testing.
+
+`generate_columns` draws a batch of synthetic flows as NumPy columns and
+`generate_flows` turns them into FlowFeatures dicts: the traffic type of
+each row is drawn from a mix, then every column is sampled per type
+from that type's profile (packet size, packet rate, duration, ports,
+transport). `LoadGenerator` paces batches at a target rate and hands them to
+an async sink (the orchestrator's real classification and policy path).
+
+Pacing is schedule-based: the number of flows due is `rate * elapsed`, so a
+slow sink shows up as lag (seconds behind schedule). At most `max_inflight`
+batches wait on the sink at once; while they do, flows stay due and the
+next batch is larger. Flows more than `max_lag` seconds behind schedule are
+dropped and counted instead of queued, so an overloaded orchestrator shows
+as `achieved_rate < target_rate` with a growing `dropped` counter rather
+than unbounded memory.
+"""
+
+import asyncio
+import collections
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Per traffic type: transport, (ports, weights), packet length mean/std (bytes),
+# packet rate range (packets/s) and log-normal duration (median seconds, sigma)
+TRAFFIC_PROFILES: Dict[str, Dict[str, Any]] = {
+    "Audio/Video Call": {"protocol": "udp", "ports": ([3478, 5004, 5005, 19302], [0.4, 0.2, 0.2, 0.2]),
+                         "pkt_len": (180.0, 40.0), "pps": (40.0, 60.0), "duration": (120.0, 0.8)},
+    "Gaming": {"protocol": "udp", "ports": ([3074, 27015, 9000, 5000], [0.3, 0.3, 0.2, 0.2]),
+               "pkt_len": (120.0, 30.0), "pps": (20.0, 64.0), "duration": (600.0, 0.7)},
+    "Video Streaming": {"protocol": "tcp", "ports": ([443, 80, 8080], [0.85, 0.1, 0.05]),
+                        "pkt_len": (1300.0, 150.0), "pps": (200.0, 600.0), "duration": (300.0, 1.0)},
+    "Browsing": {"protocol": "tcp", "ports": ([443, 80, 8080], [0.8, 0.15, 0.05]),
+                 "pkt_len": (600.0, 300.0), "pps": (5.0, 50.0), "duration": (4.0, 1.2)},
+    "File Download": {"protocol": "tcp", "ports": ([443, 80, 21], [0.7, 0.25, 0.05]),
+                      "pkt_len": (1450.0, 50.0), "pps": (500.0, 2000.0), "duration": (60.0, 1.0)},
+    "Video Upload": {"protocol": "tcp", "ports": ([443, 1935], [0.8, 0.2]),
+                     "pkt_len": (1100.0, 200.0), "pps": (100.0, 400.0), "duration": (90.0, 0.9)},
+}
+
+# address pools: rows index into these instead of formatting a string per row
+_SOURCE_IPS = [f"192.168.{i >> 8}.{i & 255}" for i in range(1, 4096)]
+_DEST_IPS = [f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}" for i in range(1, 65536, 7)]
+
+
+def generate_columns(n: int, rng: np.random.Generator,
+                     mix: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, np.ndarray], np.ndarray, List[str]]:
+    """Feature columns of `n` synthetic flows, plus each row's traffic-type index into the returned type list.
+
+    `mix` weights traffic types (default: uniform over TRAFFIC_PROFILES).
+    Columns: packet_count, avg_pkt_len, duration_seconds, bytes_total,
+    dest_port, protocol.
+    """
+    apps = list(mix or TRAFFIC_PROFILES)
+    weights = np.array([float((mix or {}).get(a, 1.0)) for a in apps])
+    kind = rng.choice(len(apps), size=n, p=weights / weights.sum())
+    packets = np.empty(n, dtype=np.int64)
+    avg_len = np.empty(n)
+    duration = np.empty(n)
+    port = np.empty(n, dtype=np.int64)
+    protocol = np.empty(n, dtype=object)
+    for k, app in enumerate(apps):
+        rows = np.flatnonzero(kind == k)
+        m = len(rows)
+        if not m:
+            continue
+        prof = TRAFFIC_PROFILES[app]
+        dur = rng.lognormal(np.log(prof["duration"][0]), prof["duration"][1], m)
+        pps = rng.uniform(*prof["pps"], m)
+        packets[rows] = np.maximum(1, (dur * pps).astype(np.int64))
+        avg_len[rows] = np.clip(rng.normal(*prof["pkt_len"], m), 40.0, 1500.0)
+        duration[rows] = dur
+        ports, port_weights = prof["ports"]
+        port[rows] = rng.choice(ports, size=m, p=port_weights)
+        protocol[rows] = prof["protocol"]
+    columns = {"packet_count": packets, "avg_pkt_len": avg_len, "duration_seconds": duration,
+               "bytes_total": (packets * avg_len).astype(np.int64), "dest_port": port, "protocol": protocol}
+    return columns, kind, apps
+
+
+def generate_flows(n: int, rng: np.random.Generator,
+                   mix: Optional[Dict[str, float]] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """`n` synthetic FlowFeatures dicts and their ground-truth traffic types."""
+    cols, kind, apps = generate_columns(n, rng, mix)
+    src = rng.integers(0, len(_SOURCE_IPS), n)
+    dst = rng.integers(0, len(_DEST_IPS), n)
+    features = [
+        {"source_ip": _SOURCE_IPS[s], "dest_ip": _DEST_IPS[d], "dest_port": p, "packet_count": c,
+         "avg_pkt_len": a, "duration_seconds": t, "bytes_total": b, "protocol": pr}
+        for s, d, p, c, a, t, b, pr in zip(src.tolist(), dst.tolist(), cols["dest_port"].tolist(),
+                                           cols["packet_count"].tolist(), cols["avg_pkt_len"].round(1).tolist(),
+                                           cols["duration_seconds"].round(3).tolist(), cols["bytes_total"].tolist(),
+                                           cols["protocol"].tolist())
+    ]
+    return features, [apps[k] for k in kind.tolist()]
+
+
+class LoadGenerator:
+    """Feeds synthetic flows to `sink` at `rate` flows/s in batches of at most `batch_size`."""
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], Awaitable[Any]], rate: float,
+                 batch_size: int = 1000, max_inflight: int = 4, mix: Optional[Dict[str, float]] = None,
+                 seed: Optional[int] = None, window: float = 5.0, max_lag: float = 1.0):
+        self.sink = sink
+        self.rate = float(rate)
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight
+        self.mix = mix
+        self.rng = np.random.default_rng(seed)
+        self.window = window
+        self.max_lag = max_lag
+        self._inflight: set = set()
+        self._completed: collections.deque = collections.deque()  # (monotonic time, flows) per finished batch
+        self._task: Optional[asyncio.Task] = None
+        self._started = 0.0
+        self.stats = {"scheduled": 0, "generated": 0, "completed": 0, "dropped": 0, "errors": 0,
+                      "lag_ms": 0.0, "last_batch_ms": 0.0}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus target and achieved rate (flows/s over the last `window` seconds)."""
+        now = time.monotonic()
+        while self._completed and now - self._completed[0][0] > self.window:
+            self._completed.popleft()
+        span = min(self.window, now - self._started) if self._started else 0.0
+        achieved = sum(n for _, n in self._completed) / span if span > 0 else 0.0
+        return {"running": self.running, "target_rate": self.rate, "achieved_rate": round(achieved, 1),
+                "inflight": len(self._inflight), **self.stats}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for task in list(self._inflight):
+            task.cancel()
+
+    async def _deliver(self, batch: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            await self.sink(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            return
+        self.stats["completed"] += len(batch)
+        self.stats["last_batch_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+        now = time.monotonic()
+        self._completed.append((now, len(batch)))
+        while now - self._completed[0][0] > self.window:
+            self._completed.popleft()
+
+    async def _run(self) -> None:
+        self._started = time.monotonic()
+        tick = min(0.05, self.batch_size / self.rate)
+        backlog = max(1, int(self.max_lag * self.rate))
+        while True:
+            due = int((time.monotonic() - self._started) * self.rate) - self.stats["scheduled"]
+            if due > backlog:
+                # too far behind schedule: shed the excess instead of queueing it
+                self.stats["scheduled"] += due - backlog
+                self.stats["dropped"] += due - backlog
+                due = backlog
+            self.stats["lag_ms"] = round(max(due, 0) / self.rate * 1000.0, 3)
+            if due <= 0 or len(self._inflight) >= self.max_inflight:
+                await asyncio.sleep(tick)
+                continue
+            n = min(due, self.batch_size)
+            self.stats["scheduled"] += n
+            batch, _ = generate_flows(n, self.rng, self.mix)
+            self.stats["generated"] += n
+            task = asyncio.ensure_future(self._deliver(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            # let the sink and the rest of the app run between batches
+            await asyncio.sleep(0)
@@ -0,0 +1,139 @@
+"""Fixed-memory time-series metrics for per-QoS-class and per-app traffic.
+
+Each tier is a NumPy ring of shape (series, slots) for bytes and packets plus a
+per-slot epoch array used to detect stale slots lazily, so nothing has to be
+cleared on a timer. Writes go to the 1 s tier and are rolled up into the 1 min
+and 1 h tiers at the same time, which keeps rollups incremental (O(1) per
+record) and lets a query read the coarsest tier that still satisfies the
+requested resolution. A late record whose slot has already moved on to a newer
+bucket is dropped by that tier (it is older than the tier's window) rather
+than wiping the newer data; coarser tiers that still cover it keep it.
+"""
+
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# (resolution seconds, number of slots): 1 h of 1 s, 24 h of 1 min, 30 d of 1 h
+DEFAULT_TIERS: Tuple[Tuple[int, int], ...] = ((1, 3600), (60, 1440), (3600, 720))
+METRIC_NAMES = ("bytes", "packets")
+
+
+class _Tier:
+    def __init__(self, resolution: int, slots: int, n_series: int):
+        self.resolution = resolution
+        self.slots = slots
+        self.values = np.zeros((len(METRIC_NAMES), n_series, slots), dtype=np.float64)
+        # bucket number (ts // resolution) currently held by each slot; -1 = empty
+        self.epochs = np.full(slots, -1, dtype=np.int64)
+
+    def add(self, series_idx: int, bucket: int, amounts: Tuple[float, float]) -> bool:
+        """Add to `bucket`; False (nothing written) if its slot already holds a newer bucket."""
+        slot = bucket % self.slots
+        held = self.epochs[slot]
+        if held != bucket:
+            if held > bucket:
+                return False
+            self.values[:, :, slot] = 0.0
+            self.epochs[slot] = bucket
+        self.values[0, series_idx, slot] += amounts[0]
+        self.values[1, series_idx, slot] += amounts[1]
+        return True
+
+    def window(self, metric_idx: int, series_idx: int, first_bucket: int, count: int) -> np.ndarray:
+        """Return `count` consecutive buckets starting at `first_bucket`; stale slots read as 0."""
+        buckets = np.arange(first_bucket, first_bucket + count, dtype=np.int64)
+        slots = buckets % self.slots
+        vals = self.values[metric_idx, series_idx, slots]
+        return np.where(self.epochs[slots] == buckets, vals, 0.0)
+
+
+class MetricsEngine:
+    """Per-series traffic counters at 1 s resolution with 1 min / 1 h rollups.
+
+    Memory is fixed at construction: (2 metrics x series x slots) floats per
+    tier. Queries return rates (units per second) from a single tier and read
+    at most `window_s / resolution + points` of its slots (never more than
+    the tier holds), so a point never needs more than one read per slot.
+    """
+
+    def __init__(self, series: Iterable[str], tiers: Tuple[Tuple[int, int], ...] = DEFAULT_TIERS):
+        self.series: List[str] = list(series)
+        self._series_idx: Dict[str, int] = {name: i for i, name in enumerate(self.series)}
+        self.tiers = [_Tier(res, slots, len(self.series)) for res, slots in sorted(tiers)]
+        self.totals = np.zeros((len(METRIC_NAMES), len(self.series)), dtype=np.float64)
+        # records that fell outside a tier's window, per tier resolution
+        self.stats = {"late_dropped": {tier.resolution: 0 for tier in self.tiers}}
+
+    def record(self, series: str, nbytes: float, packets: float = 0, ts: Optional[float] = None) -> None:
+        idx = self._series_idx.get(series)
+        if idx is None:
+            return
+        now = int(ts if ts is not None else time.time())
+        amounts = (float(nbytes), float(packets))
+        for tier in self.tiers:
+            if not tier.add(idx, now // tier.resolution, amounts):
+                self.stats["late_dropped"][tier.resolution] += 1
+        self.totals[0, idx] += amounts[0]
+        self.totals[1, idx] += amounts[1]
+
+    def total(self, series: str, metric: str = "bytes") -> float:
+        return float(self.totals[METRIC_NAMES.index(metric), self._series_idx[series]])
+
+    def _pick_tier(self, step: float, window_s: int) -> _Tier:
+        # Coarsest tier whose resolution still fits inside one output step,
+        # moving to a coarser one if the chosen tier cannot cover the window
+        chosen = 0
+        for i, tier in enumerate(self.tiers):
+            if tier.resolution <= step:
+                chosen = i
+        while chosen < len(self.tiers) - 1 and self.tiers[chosen].resolution * self.tiers[chosen].slots < window_s:
+            chosen += 1
+        return self.tiers[chosen]
+
+    def timeseries(self, series: str, window_s: int = 300, points: int = 60, metric: str = "bytes",
+                   now: Optional[float] = None) -> Dict[str, object]:
+        """Downsample `window_s` seconds ending now into at most `points` rate samples.
+
+        Returns {"step", "resolution", "points": [[ts, rate], ...], "p50", "p95", "p99"}
+        where percentiles are taken over the underlying tier samples in the window.
+        """
+        if series not in self._series_idx:
+            raise KeyError(series)
+        metric_idx = METRIC_NAMES.index(metric)
+        points = max(1, int(points))
+        window_s = max(1, int(window_s))
+        tier = self._pick_tier(window_s / points, window_s)
+        # no more points than tier slots in the window, or a short window would stretch to `points` slots
+        points = min(points, math.ceil(window_s / tier.resolution))
+        per_point = max(1, math.ceil(window_s / points / tier.resolution))
+        points = min(points, max(1, tier.slots // per_point))
+        count = points * per_point
+        step = per_point * tier.resolution
+
+        end_bucket = int(now if now is not None else time.time()) // tier.resolution
+        first_bucket = end_bucket - count + 1
+        raw = tier.window(metric_idx, self._series_idx[series], first_bucket, count)
+        rates = raw.reshape(points, per_point).sum(axis=1) / step
+        stamps = (first_bucket + np.arange(points) * per_point) * tier.resolution
+
+        per_slot = raw / tier.resolution
+        p50, p95, p99 = np.percentile(per_slot, [50, 95, 99]) if per_slot.size else (0.0, 0.0, 0.0)
+        return {
+            "step": step,
+            "resolution": tier.resolution,
+            "points": [[int(t), float(v)] for t, v in zip(stamps, rates)],
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
+
+    def rate(self, series: str, window_s: int = 60, metric: str = "bytes", now: Optional[float] = None) -> float:
+        """Average rate (units per second) over the trailing window."""
+        tier = self._pick_tier(1, window_s)
+        count = min(tier.slots, max(1, math.ceil(window_s / tier.resolution)))
+        end_bucket = int(now if now is not None else time.time()) // tier.resolution
+        raw = tier.window(METRIC_NAMES.index(metric), self._series_idx[series], end_bucket - count + 1, count)
+        return float(raw.sum() / (count * tier.resolution))
@@ -0,0 +1,172 @@
+"""Latency-aware hyperparameter search for the Sentry model (used by train_sentry.py --search).
+
+Candidates vary tree count, depth, leaves and feature subset. They are
+trained in a process pool, one LightGBM thread each, with early stopping on
+a validation split, so `n_estimators` is only a cap. Each fitted model is
+then exported to a `.sentry` artifact and timed through `ArtifactModel` in
+the parent process, one model at a time so the timings are not skewed by
+concurrent training. That is the path serving uses; LightGBM's own
+predict_proba adds a per-call overhead that is the same for every candidate
+and would drown the differences. Two timings are taken: single-row
+predict_proba (what /classify pays per flow) and per-flow cost of a batch
+call (what bulk ingest pays).
+
+Candidates are ranked by accuracy on the validation split. Those not beaten
+on accuracy and both latencies by another candidate form the Pareto front.
+`select` returns the most accurate candidate whose single-row latency fits
+the per-flow budget. The test split is only used to report the accuracy of
+the selected model, so that figure is not biased by the selection.
+"""
+
+import itertools
+import math
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from lightgbm import LGBMClassifier, early_stopping
+
+from sentry_artifact import ArtifactModel, write_artifact
+
+SEARCH_SPACE: Dict[str, Sequence[Any]] = {
+    "n_estimators": (50, 100, 200, 400),
+    "max_depth": (4, 6, 8, -1),
+    "num_leaves": (15, 31, 63),
+    # share of features kept, most important first
+    "feature_fraction": (1.0, 0.75, 0.5),
+}
+EARLY_STOPPING_ROUNDS = 20
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 1024
+
+# training data of a pool worker, set once per process by _init_worker
+_data: Dict[str, Any] = {}
+
+
+def _init_worker(X_train, y_train, X_val, y_val):
+    _data.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val)
+
+
+def _fit_candidate(params: Dict[str, Any], columns: List[str]) -> Tuple[Dict[str, Any], List[str], Any, float]:
+    """Fit one candidate in a worker; returns (params, columns, model, fit seconds)."""
+    start = time.perf_counter()
+    clf = LGBMClassifier(**params, learning_rate=0.1, n_jobs=1, verbose=-1)
+    clf.fit(_data["X_train"][columns], _data["y_train"], eval_set=[(_data["X_val"][columns], _data["y_val"])],
+            callbacks=[early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+    return params, columns, clf, time.perf_counter() - start
+
+
+def feature_ranking(X_train, y_train) -> List[str]:
+    """Feature columns by split importance of a small reference model, most important first."""
+    ref = LGBMClassifier(n_estimators=50, max_depth=6, verbose=-1).fit(X_train, y_train)
+    order = np.argsort(-np.asarray(ref.feature_importances_), kind="stable")
+    return [list(X_train.columns)[i] for i in order]
+
+
+def candidates(ranking: List[str], max_candidates: int, seed: int = 42) -> List[Tuple[Dict[str, Any], List[str]]]:
+    """Up to `max_candidates` (params, feature columns) drawn from SEARCH_SPACE without repeats."""
+    grid = list(itertools.product(*SEARCH_SPACE.values()))
+    random.Random(seed).shuffle(grid)
+    out, seen = [], set()
+    for n_estimators, max_depth, num_leaves, fraction in grid:
+        if max_depth > 0 and num_leaves > 2 ** max_depth:
+            num_leaves = 2 ** max_depth  # extra leaves are unreachable at this depth
+        columns = ranking[:max(1, math.ceil(fraction * len(ranking)))]
+        key = (n_estimators, max_depth, num_leaves, len(columns))
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(({"n_estimators": n_estimators, "max_depth": max_depth, "num_leaves": num_leaves}, columns))
+        if len(out) >= max_candidates:
+            break
+    return out
+
+
+def serving_model(clf, columns: List[str]) -> ArtifactModel:
+    """The ArtifactModel serving would load for a fitted candidate."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "candidate.sentry")
+        write_artifact({"model": clf, "label_encoder": None, "feature_columns": columns}, path)
+        return ArtifactModel.from_buffer(np.fromfile(path, dtype=np.uint8))
+
+
+def measure_latency(model, X) -> Dict[str, float]:
+    """Median single-row predict_proba latency and per-flow latency of one BATCH_ROWS call, in microseconds."""
+    rows = np.asarray(X, dtype=np.float64)
+    single = []
+    for i in range(SINGLE_ROW_REPEATS):
+        row = [rows[i % len(rows)].tolist()]  # a plain list, as SentryWrapper passes it
+        start = time.perf_counter()
+        model.predict_proba(row)
+        single.append(time.perf_counter() - start)
+    batch = rows[np.arange(BATCH_ROWS) % len(rows)]
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        model.predict_proba(batch)
+        timings.append(time.perf_counter() - start)
+    return {"single_row_us": round(float(np.median(single)) * 1e6, 2),
+            "batch_per_flow_us": round(min(timings) / BATCH_ROWS * 1e6, 3)}
+
+
+def pareto_front(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Results no other result beats on accuracy, single-row and batch latency at once, by latency."""
+    def dominates(a, b):
+        return (a["accuracy"] >= b["accuracy"] and a["single_row_us"] <= b["single_row_us"]
+                and a["batch_per_flow_us"] <= b["batch_per_flow_us"]
+                and (a["accuracy"], -a["single_row_us"], -a["batch_per_flow_us"])
+                != (b["accuracy"], -b["single_row_us"], -b["batch_per_flow_us"]))
+    front = [r for r in results if not any(dominates(o, r) for o in results)]
+    return sorted(front, key=lambda r: r["single_row_us"])
+
+
+def select(results: List[Dict[str, Any]], latency_budget_us: Optional[float]) -> Dict[str, Any]:
+    """Most accurate result within the single-row latency budget (faster wins ties); the fastest if none fits."""
+    fitting = [r for r in results if latency_budget_us is None or r["single_row_us"] <= latency_budget_us]
+    if not fitting:
+        return min(results, key=lambda r: r["single_row_us"])
+    return max(fitting, key=lambda r: (r["accuracy"], -r["single_row_us"]))
+
+
+def search(X_train, y_train, X_test, y_test, latency_budget_us: Optional[float] = None, max_candidates: int = 24,
+           workers: Optional[int] = None, val_fraction: float = 0.2, seed: int = 42) -> Dict[str, Any]:
+    """Run the search on DataFrame splits; returns {selected, model, pareto, results, within_budget}.
+
+    A `val_fraction` slice of the training split drives early stopping and
+    is the `accuracy` candidates are ranked and selected on. Only the
+    selected model is scored on the test split (`test_accuracy`).
+    """
+    rng = np.random.default_rng(seed)
+    val = rng.random(len(X_train)) < val_fraction
+    X_fit, y_fit, X_val, y_val = X_train[~val], y_train[~val], X_train[val], y_train[val]
+    ranking = feature_ranking(X_fit, y_fit)
+    specs = candidates(ranking, max_candidates, seed)
+    workers = workers or min(len(specs), os.cpu_count() or 1)
+
+    fitted = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X_fit, y_fit, X_val, y_val)) as pool:
+        futures = [pool.submit(_fit_candidate, params, columns) for params, columns in specs]
+        for fut in futures:
+            fitted.append(fut.result())
+
+    results = []
+    for i, (params, columns, clf, fit_s) in enumerate(fitted):
+        accuracy = float((np.asarray(clf.predict(X_val[columns])) == np.asarray(y_val)).mean())
+        results.append({"id": i, **params, "best_iteration": int(clf.best_iteration_ or params["n_estimators"]),
+                        "features": columns, "accuracy": round(accuracy, 5), "fit_s": round(fit_s, 3),
+                        **measure_latency(serving_model(clf, columns), X_val[columns])})
+    best = select(results, latency_budget_us)
+    clf, columns = fitted[best["id"]][2], best["features"]
+    best["test_accuracy"] = round(float((np.asarray(clf.predict(X_test[columns])) == np.asarray(y_test)).mean()), 5)
+    return {
+        "selected": best,
+        "model": fitted[best["id"]][2],
+        "within_budget": latency_budget_us is None or best["single_row_us"] <= latency_budget_us,
+        "pareto": pareto_front(results),
+        "results": results,
+    }
@@ -0,0 +1,226 @@
+"""Per-flow online feature aggregation with early, refinable classification.
+
+FlowFeatures is a summary of a finished flow, so a flow can normally only be
+classified once it has been observed for a while. `OnlineFlowTable` keeps
+running statistics per flow instead, updated in O(1) per packet (or per flow
+record): counts, bytes, Welford mean/variance of packet length and of
+inter-arrival time. After the first `first_decision_packets` packets the
+flow is due for a provisional decision. It is re-evaluated at 2K, 4K, ...
+packets, and a decision only changes when a different label wins with a
+clear margin on consecutive evaluations (hysteresis), so a policy is not
+flipped back and forth while the statistics settle.
+
+Due flows are collected and classified together by `decide()`, so callers
+make one model call per packet batch rather than one per flow; `due_since`
+lets a packet loop bound how long a due flow waits for that call.
+"""
+
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# (label, confidence) per FlowFeatures dict, or None when no model is available
+PredictFn = Callable[[List[Dict[str, Any]]], Optional[Sequence[Tuple[str, float]]]]
+
+
+class OnlineFlow:
+    """Running statistics and decision state of one flow."""
+
+    __slots__ = ("meta", "first_ts", "last_ts", "packets", "bytes", "len_mean", "len_m2", "iat_n", "iat_mean", "iat_m2",
+                 "next_eval", "evaluations", "label", "confidence", "challenger", "streak", "final", "due")
+
+    def __init__(self, meta: Dict[str, Any], ts: float, first_eval: int):
+        self.meta = meta
+        self.first_ts = ts
+        self.last_ts = ts
+        self.packets = 0
+        self.bytes = 0
+        self.len_mean = 0.0
+        self.len_m2 = 0.0
+        self.iat_n = 0
+        self.iat_mean = 0.0
+        self.iat_m2 = 0.0
+        self.next_eval = first_eval
+        self.evaluations = 0
+        self.label: Optional[str] = None
+        self.confidence = 0.0
+        self.challenger: Optional[str] = None
+        self.streak = 0
+        self.final = False
+        self.due = False
+
+    def add(self, ts: float, length: int, packets: int = 1) -> None:
+        """Fold in one packet, or a record of `packets` packets totalling `length` bytes.
+
+        A record counts as one inter-arrival sample (its gap spread evenly over
+        its packets), so dispersion from records is an approximation.
+        """
+        if self.packets:
+            iat = max(0.0, ts - self.last_ts) / packets
+            self.iat_n += 1
+            d = iat - self.iat_mean
+            self.iat_mean += d / self.iat_n
+            self.iat_m2 += d * (iat - self.iat_mean)
+        self.last_ts = max(self.last_ts, ts)
+        self.packets += packets
+        self.bytes += length
+        x = length / packets
+        d = x - self.len_mean
+        self.len_mean += d * packets / self.packets
+        self.len_m2 += d * (x - self.len_mean) * packets
+
+    def features(self) -> Dict[str, Any]:
+        """FlowFeatures dict of the flow so far, plus the running dispersion statistics."""
+        return {
+            **self.meta,
+            "packet_count": self.packets,
+            "avg_pkt_len": self.len_mean,
+            "duration_seconds": self.last_ts - self.first_ts,
+            "bytes_total": self.bytes,
+            "pkt_len_std": (self.len_m2 / self.packets) ** 0.5 if self.packets else 0.0,
+            "iat_mean": self.iat_mean,
+            "iat_std": (self.iat_m2 / self.iat_n) ** 0.5 if self.iat_n else 0.0,
+        }
+
+
+def _describe(key: Hashable) -> Dict[str, Any]:
+    source_ip, dest_ip, dest_port, protocol = key  # type: ignore[misc]
+    return {"source_ip": source_ip, "dest_ip": dest_ip, "dest_port": dest_port, "protocol": protocol}
+
+
+class OnlineFlowTable:
+    """Flow key -> OnlineFlow, with scheduled provisional decisions.
+
+    `describe(key)` turns a flow key into the FlowFeatures identity fields
+    (source_ip, dest_ip, dest_port, protocol); it runs once per new flow, so
+    keys can stay cheap tuples of integers. The default expects keys of
+    exactly that 4-tuple.
+
+    Hysteresis: the first evaluation that reaches `min_confidence` sets the
+    label. Later evaluations that agree just refresh the confidence. A
+    different label must beat the current confidence by `switch_margin` on
+    `confirmations` consecutive evaluations before it replaces it. A decision
+    is final once its confidence reaches `final_confidence` or the flow has
+    used `max_evaluations`; final flows are no longer re-evaluated.
+    """
+
+    def __init__(self, predict: PredictFn, describe: Callable[[Hashable], Dict[str, Any]] = _describe,
+                 first_decision_packets: int = 8, max_evaluations: int = 6, min_confidence: float = 0.5,
+                 switch_margin: float = 0.05, confirmations: int = 2, final_confidence: float = 0.95,
+                 idle_timeout: float = 15.0):
+        self.predict = predict
+        self.describe = describe
+        self.first_decision_packets = first_decision_packets
+        self.max_evaluations = max_evaluations
+        self.min_confidence = min_confidence
+        self.switch_margin = switch_margin
+        self.confirmations = confirmations
+        self.final_confidence = final_confidence
+        self.idle_timeout = idle_timeout
+        self.flows: Dict[Hashable, OnlineFlow] = {}
+        self._due: List[Hashable] = []
+        # timestamp of the packet that made the oldest pending flow due, None when nothing is due
+        self.due_since: Optional[float] = None
+        self.stats = {"packets": 0, "flows": 0, "evaluations": 0, "decisions": 0, "switches": 0,
+                      "suppressed": 0, "expired": 0, "last_decide_ms": 0.0}
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def update(self, key: Hashable, ts: float, length: int, packets: int = 1, ident: Any = None) -> OnlineFlow:
+        """Account one packet (or a `packets`-packet record) to its flow in O(1).
+
+        A new flow is described from `ident` when given (e.g. the oriented
+        tuple of its first packet, when `key` is direction-independent),
+        otherwise from `key`.
+        """
+        flow = self.flows.get(key)
+        if flow is None:
+            meta = self.describe(key if ident is None else ident)
+            flow = self.flows[key] = OnlineFlow(meta, ts, self.first_decision_packets)
+            self.stats["flows"] += 1
+        flow.add(ts, length, packets)
+        self.stats["packets"] += packets
+        if flow.packets >= flow.next_eval and not flow.final and not flow.due:
+            flow.due = True
+            if not self._due:
+                self.due_since = ts
+            self._due.append(key)
+        return flow
+
+    def _apply(self, flow: OnlineFlow, label: str, confidence: float) -> bool:
+        """Run one evaluation through the hysteresis; True when the decision changed."""
+        flow.evaluations += 1
+        changed = False
+        if flow.label is None:
+            if confidence >= self.min_confidence:
+                flow.label, flow.confidence, changed = label, confidence, True
+        elif label == flow.label:
+            flow.confidence = confidence
+            flow.challenger, flow.streak = None, 0
+        elif confidence >= flow.confidence + self.switch_margin:
+            flow.streak = flow.streak + 1 if label == flow.challenger else 1
+            flow.challenger = label
+            if flow.streak >= self.confirmations:
+                flow.label, flow.confidence, changed = label, confidence, True
+                flow.challenger, flow.streak = None, 0
+                self.stats["switches"] += 1
+            else:
+                self.stats["suppressed"] += 1
+        else:
+            flow.challenger, flow.streak = None, 0
+            self.stats["suppressed"] += 1
+        flow.final = flow.label is not None and (flow.confidence >= self.final_confidence
+                                                 or flow.evaluations >= self.max_evaluations)
+        return changed
+
+    def collect_due(self) -> Tuple[List[Hashable], List[Dict[str, Any]]]:
+        """Take the due flows: (keys, feature rows) to pass through predict and then `resolve`."""
+        keys = [k for k in self._due if k in self.flows]
+        self._due = []
+        self.due_since = None
+        for k in keys:
+            flow = self.flows[k]
+            flow.due = False
+            flow.next_eval = flow.packets * 2
+        return keys, [self.flows[k].features() for k in keys]
+
+    def resolve(self, keys: List[Hashable], rows: List[Dict[str, Any]],
+                predictions: Optional[Sequence[Tuple[str, float]]]) -> List[Dict[str, Any]]:
+        """Apply predictions for collected flows; return decisions that changed or became final.
+
+        Each event: {key, features, app_type, confidence, provisional,
+        packets, decision_latency} where decision_latency is the time from the
+        flow's first packet to this decision, in the packets' clock.
+        """
+        events = []
+        for key, row, prediction in zip(keys, rows, predictions or [None] * len(rows)):
+            flow = self.flows.get(key)
+            if flow is None:
+                continue  # expired while being classified
+            if prediction is None:
+                continue  # no model: try again at the next scheduled evaluation
+            self.stats["evaluations"] += 1
+            was_final = flow.final
+            if self._apply(flow, str(prediction[0]), float(prediction[1])) or (flow.final and not was_final):
+                self.stats["decisions"] += 1
+                events.append({"key": key, "features": row, "app_type": flow.label, "confidence": flow.confidence,
+                               "provisional": not flow.final, "packets": row["packet_count"],
+                               "decision_latency": row["duration_seconds"]})
+        return events
+
+    def decide(self) -> List[Dict[str, Any]]:
+        """Classify every due flow with one predict call and `resolve` the result."""
+        if not self._due:
+            return []
+        start = time.perf_counter()
+        keys, rows = self.collect_due()
+        events = self.resolve(keys, rows, self.predict(rows) if rows else [])
+        self.stats["last_decide_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+        return events
+
+    def expire(self, now: float) -> List[Tuple[Hashable, OnlineFlow]]:
+        """Remove and return flows idle for `idle_timeout` (in the packets' clock)."""
+        idle = [k for k, f in self.flows.items() if now - f.last_ts >= self.idle_timeout]
+        out = [(k, self.flows.pop(k)) for k in idle]
+        self.stats["expired"] += len(out)
+        return out
@@ -0,0 +1,123 @@
+"""Out-of-distribution scorer for Sentry inputs.
+
+Top-class probability is a poor escalation signal on its own: LightGBM can
+be confidently wrong on traffic unlike anything it was trained on, and
+unsure about familiar traffic that sits between two classes, where Vanguard
+is no better. `OODScorer` measures how novel a flow is instead. It uses the
+distance from the flow's model features to the nearest class in the
+training data:
+
+- features are standardized with the training mean and std;
+- every class keeps its mean and a shrunk covariance, stored as the
+  whitening matrix W with W W^T = inverse covariance, so the squared
+  Mahalanobis distance to class k is |(x - mean_k) W_k|^2;
+- a flow's distance is the minimum over classes, and `novelty` divides it
+  by the `calibration_quantile` of held-out in-distribution distances.
+  Novelty 1.0 is the edge of the training distribution: about 1% of
+  familiar flows score higher.
+
+A batch is scored with one matrix product per class, so this costs about as
+much as a few more trees. train_sentry.py fits the scorer on the model
+features and stores it as plain lists under the payload's "ood" key, which
+also puts it in the artifact header. `needs_vanguard` combines novelty with
+confidence: only novel flows escalate.
+"""
+
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+OOD_VERSION = 1
+CALIBRATION_QUANTILE = 0.99
+# covariance shrinkage towards a scaled identity; keeps tiny or degenerate classes invertible
+SHRINKAGE = 0.1
+# novel flows this far past the edge escalate even when Sentry is confident
+NOVELTY_OVERRIDE = 3.0
+
+
+class OODScorer:
+    """Per-class Mahalanobis novelty over standardized Sentry model features."""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, centroids: np.ndarray, whiten: np.ndarray,
+                 radius: float, classes: Sequence[str]):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)  # (classes, features)
+        self.whiten = np.asarray(whiten, dtype=np.float64)  # (classes, features, features)
+        self.radius = float(radius)
+        self.classes = [str(c) for c in classes]
+
+    @classmethod
+    def fit(cls, X, labels, X_calibration=None, quantile: float = CALIBRATION_QUANTILE) -> "OODScorer":
+        """Fit on training features and labels; calibrate on `X_calibration` (held-out rows), else on X."""
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.asarray(labels)
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale < 1e-12] = 1.0
+        Z = (X - mean) / scale
+        d = Z.shape[1]
+        classes = np.unique(labels)
+        centroids = np.empty((len(classes), d))
+        whiten = np.empty((len(classes), d, d))
+        for k, c in enumerate(classes):
+            Zk = Z[labels == c]
+            centroids[k] = Zk.mean(axis=0)
+            cov = np.cov(Zk, rowvar=False).reshape(d, d) if len(Zk) > 1 else np.eye(d)
+            cov = (1 - SHRINKAGE) * cov + SHRINKAGE * (np.trace(cov) / d + 1e-6) * np.eye(d)
+            whiten[k] = np.linalg.cholesky(np.linalg.inv(cov))
+        scorer = cls(mean, scale, centroids, whiten, 1.0, classes)
+        calib = X if X_calibration is None else np.asarray(X_calibration, dtype=np.float64)
+        scorer.radius = max(float(np.quantile(scorer.distance(calib), quantile)), 1e-9)
+        return scorer
+
+    def distance(self, X) -> np.ndarray:
+        """Mahalanobis distance of each row to its nearest class."""
+        Z = (np.atleast_2d(np.asarray(X, dtype=np.float64)) - self.mean) / self.scale
+        best = np.full(len(Z), np.inf)
+        for centroid, w in zip(self.centroids, self.whiten):
+            D = (Z - centroid) @ w
+            best = np.minimum(best, np.einsum("ij,ij->i", D, D))
+        return np.sqrt(best)
+
+    def novelty(self, X) -> np.ndarray:
+        """Distance relative to the calibration radius: above 1.0 is outside the training distribution."""
+        return self.distance(X) / self.radius
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": OOD_VERSION, "mean": self.mean.tolist(), "scale": self.scale.tolist(),
+                "centroids": self.centroids.tolist(), "whiten": self.whiten.tolist(),
+                "radius": self.radius, "classes": self.classes}
+
+    @classmethod
+    def from_dict(cls, spec: Mapping[str, Any]) -> "OODScorer":
+        if spec.get("version") != OOD_VERSION:
+            raise ValueError(f"unsupported OOD scorer version {spec.get('version')}")
+        return cls(spec["mean"], spec["scale"], spec["centroids"], spec["whiten"], spec["radius"], spec["classes"])
+
+
+def payload_scorer(payload: Mapping[str, Any]) -> Optional[OODScorer]:
+    """The payload's OOD scorer, or None when it has none or it does not fit the feature columns."""
+    spec = payload.get("ood")
+    if not spec:
+        return None
+    try:
+        scorer = OODScorer.from_dict(spec)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if len(scorer.mean) != len(payload.get("feature_columns") or []):
+        return None
+    return scorer
+
+
+def needs_vanguard(confidence: float, threshold: float, novelty: Optional[float]) -> bool:
+    """Escalation decision from Sentry confidence and, when the model has a scorer, novelty.
+
+    Without novelty, low confidence escalates. With it, low-confidence
+    flows escalate only when they are novel (the LLM has nothing to add
+    on familiar-but-ambiguous traffic), and flows far outside the training
+    distribution escalate even when Sentry is confident.
+    """
+    if novelty is None:
+        return confidence < threshold
+    return novelty >= NOVELTY_OVERRIDE or (confidence < threshold and novelty >= 1.0)
@@ -0,0 +1,634 @@
+"""Stream pcap/pcapng captures into FlowFeatures dicts.
+
+Usage:
+  python pcap_ingest.py capture.pcapng [--idle-timeout 15] [--active-timeout 120] [--classify]
+
+The capture is memory-mapped and read through a NumPy view of the mapping,
+so packet data is never copied. Packets are processed in chunks. Python only
+walks the record headers to find each frame's offset. The link, IP and
+TCP/UDP headers of a whole chunk are then decoded with vectorized gathers,
+packets are grouped by flow with one sort, and the flow table is updated
+once per flow per chunk rather than once per packet. Frames the vectorized
+decoder does not handle (IPv6 extension headers, truncated headers) go
+through the scalar `parse_headers`.
+
+Flows are keyed by bidirectional 5-tuple; the side that sent the first
+packet is the flow's source. A flow is emitted once it has been idle for
+`idle_timeout` seconds (capture time) or, checked once per chunk, active
+for `active_timeout` seconds. Everything left is emitted at end of file.
+Emitted flows are grouped into batches for `classify_batch`, so each batch
+costs one model call.
+
+Hostnames are attached as they are found (see hostname_enrichment.py). A
+flow gets the SNI of its TLS ClientHello or, failing that, the name a DNS
+response in the capture gave its destination address, as cached when the
+flow's first packet was seen. --no-hostnames skips this.
+
+Without --classify each flow is printed as one JSON line; with it, the
+classification result is merged into the line. With --early, packets are fed
+one by one through an `online_flows.OnlineFlowTable` instead and the
+provisional Sentry decisions are printed as they are made, with the capture
+time from each flow's first packet to its decision.
+"""
+
+import argparse
+import ipaddress
+import json
+import mmap
+import struct
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+PROTO_NAMES = {IPPROTO_TCP: "tcp", IPPROTO_UDP: "udp"}
+
+# link-layer header types (https://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+_PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+_IPV6_EXT_HEADERS = (0, 43, 60)  # hop-by-hop, routing, destination options
+_IPV6_FRAGMENT = 44
+
+_U16 = struct.Struct("!H")
+_PORTS = struct.Struct("!HH")
+
+# One packet: (timestamp, offset of the frame in the mapping, captured length, link type)
+Packet = Tuple[float, int, int, int]
+# (protocol, src addr bytes, dst addr bytes, src port, dst port, IP length)
+Header = Tuple[int, bytes, bytes, int, int, int]
+
+
+def _pcap_packets(buf, endian: str, ts_unit: float) -> Iterator[Packet]:
+    linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    off, end = 24, len(buf)
+    while off + 16 <= end:
+        sec, frac, caplen, _ = record.unpack_from(buf, off)
+        off += 16
+        if off + caplen > end:
+            break  # truncated capture
+        yield sec + frac * ts_unit, off, caplen, linktype
+        off += caplen
+
+
+def _if_tsresol(buf, endian: str, off: int, end: int) -> float:
+    """Timestamp unit from an interface description block's options (default 1 µs)."""
+    opt = struct.Struct(endian + "HH")
+    while off + 4 <= end:
+        code, length = opt.unpack_from(buf, off)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            v = buf[off + 4]
+            return 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+        off += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def _pcapng_packets(buf) -> Iterator[Packet]:
+    off, end = 0, len(buf)
+    endian = "<"
+    interfaces: List[Tuple[int, float]] = []
+    while off + 12 <= end:
+        if buf[off:off + 4] == _PCAPNG_SHB:
+            endian = "<" if buf[off + 8:off + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []  # interface ids are per section
+        btype, blen = struct.unpack_from(endian + "II", buf, off)
+        if blen < 12 or off + blen > end:
+            break
+        if btype == 1:  # interface description
+            linktype = struct.unpack_from(endian + "H", buf, off + 8)[0]
+            interfaces.append((linktype, _if_tsresol(buf, endian, off + 16, off + blen - 4)))
+        elif btype in (6, 2):  # enhanced packet / obsolete packet
+            if btype == 6:
+                iface, hi, lo, caplen = struct.unpack_from(endian + "IIII", buf, off + 8)
+            else:
+                iface, _, hi, lo, caplen = struct.unpack_from(endian + "HHIII", buf, off + 8)
+            if iface < len(interfaces):
+                linktype, unit = interfaces[iface]
+                yield ((hi << 32) | lo) * unit, off + 28, min(caplen, blen - 32), linktype
+        elif btype == 3 and interfaces:  # simple packet, always interface 0
+            origlen = struct.unpack_from(endian + "I", buf, off + 8)[0]
+            yield 0.0, off + 12, min(origlen, blen - 16), interfaces[0][0]
+        off += blen
+
+
+def iter_packets(buf) -> Iterator[Packet]:
+    """Packets of a pcap or pcapng capture held in `buf` (bytes, mmap or memoryview)."""
+    magic = bytes(buf[:4])
+    if magic in _PCAP_MAGIC:
+        return _pcap_packets(buf, *_PCAP_MAGIC[magic])
+    if magic == _PCAPNG_SHB:
+        return _pcapng_packets(buf)
+    raise ValueError("not a pcap or pcapng capture")
+
+
+def _l3_offset(buf, off: int, caplen: int, linktype: int) -> int:
+    """Offset of the IP header, or -1 when the frame does not carry IP."""
+    if linktype == LINKTYPE_ETHERNET:
+        l3 = off + 14
+        ethertype = _U16.unpack_from(buf, off + 12)[0]
+        while ethertype in (0x8100, 0x88A8) and l3 + 4 <= off + caplen:  # VLAN / QinQ tags
+            ethertype = _U16.unpack_from(buf, l3 + 2)[0]
+            l3 += 4
+        return l3 if ethertype in (0x0800, 0x86DD) else -1
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return off
+    if linktype == LINKTYPE_LINUX_SLL:
+        return off + 16 if _U16.unpack_from(buf, off + 14)[0] in (0x0800, 0x86DD) else -1
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return off + 20 if _U16.unpack_from(buf, off)[0] in (0x0800, 0x86DD) else -1
+    if linktype == LINKTYPE_NULL:
+        return off + 4
+    return -1
+
+
+def parse_headers(buf, off: int, caplen: int, linktype: int) -> Optional[Header]:
+    """Decode the IP and TCP/UDP headers of one frame in place.
+
+    Returns None for anything that is not TCP/UDP over IP, for truncated
+    headers and for non-first fragments (which carry no ports).
+    """
+    try:
+        return _parse_headers(buf, off, caplen, linktype)
+    except (struct.error, IndexError):
+        return None  # link-layer header cut short by the snap length
+
+
+def _parse_headers(buf, off: int, caplen: int, linktype: int) -> Optional[Header]:
+    l3 = _l3_offset(buf, off, caplen, linktype)
+    end = off + caplen
+    if l3 < 0 or l3 >= end:
+        return None
+    version = buf[l3] >> 4
+    if version == 4:
+        ihl = (buf[l3] & 0x0F) * 4
+        l4 = l3 + ihl
+        if ihl < 20 or l4 + 4 > end or _U16.unpack_from(buf, l3 + 6)[0] & 0x1FFF:
+            return None
+        proto = buf[l3 + 9]
+        if proto != IPPROTO_TCP and proto != IPPROTO_UDP:
+            return None
+        sport, dport = _PORTS.unpack_from(buf, l4)
+        # total length is 0 in captures of TSO/GSO super-frames
+        length = _U16.unpack_from(buf, l3 + 2)[0] or end - l3
+        return proto, buf[l3 + 12:l3 + 16], buf[l3 + 16:l3 + 20], sport, dport, length
+    if version == 6:
+        if l3 + 40 > end:
+            return None
+        proto = buf[l3 + 6]
+        l4 = l3 + 40
+        while proto in _IPV6_EXT_HEADERS or proto == _IPV6_FRAGMENT:
+            if l4 + 8 > end:
+                return None
+            if proto == _IPV6_FRAGMENT:
+                if _U16.unpack_from(buf, l4 + 2)[0] & 0xFFF8:
+                    return None
+                length = 8
+            else:
+                length = (buf[l4 + 1] + 1) * 8
+            proto = buf[l4]
+            l4 += length
+        if (proto != IPPROTO_TCP and proto != IPPROTO_UDP) or l4 + 4 > end:
+            return None
+        sport, dport = _PORTS.unpack_from(buf, l4)
+        return proto, buf[l3 + 8:l3 + 24], buf[l3 + 24:l3 + 40], sport, dport, 40 + _U16.unpack_from(buf, l3 + 4)[0]
+    return None
+
+
+# Decoded packet columns, one array per field (see decode_chunk)
+Columns = Dict[str, np.ndarray]
+
+CHUNK_BYTES = 8 << 20
+_COLUMN_NAMES = ("ver", "proto", "a_hi", "a_lo", "b_hi", "b_lo", "sport", "dport", "length", "ts", "l4", "end")
+
+
+def _frame_chunks(buf, buf8: np.ndarray, chunk_bytes: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """(timestamp, frame offset, captured length, link type) arrays for about `chunk_bytes` of capture at a time."""
+    magic = bytes(buf[:4])
+    if magic not in _PCAP_MAGIC:
+        # pcapng: blocks are irregular, walk them with the scalar reader
+        packets = iter_packets(buf)
+        chunk = max(1, chunk_bytes // 128)
+        while True:
+            rows = [p for _, p in zip(range(chunk), packets)]
+            if not rows:
+                return
+            cols = np.array(rows, dtype=np.float64)
+            yield cols[:, 0], cols[:, 1].astype(np.int64), cols[:, 2].astype(np.int64), cols[:, 3].astype(np.int64)
+    endian, ts_unit = _PCAP_MAGIC[magic]
+    linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0FFFFFFF
+    caplen_at = struct.Struct(endian + "I").unpack_from
+    record = np.dtype([("sec", endian + "u4"), ("frac", endian + "u4"), ("caplen", endian + "u4"), ("len", endian + "u4")])
+    off, end = 24, len(buf)
+    while off + 16 <= end:
+        # the only per-packet Python work: hop from record header to record header
+        offsets: List[int] = []
+        append = offsets.append
+        stop = min(off + chunk_bytes, end - 16)
+        while off <= stop:
+            append(off)
+            off += 16 + caplen_at(buf, off + 8)[0]
+        rec_off = np.array(offsets, dtype=np.int64)
+        headers = buf8[rec_off[:, None] + np.arange(16)].view(record).ravel()
+        caplen = headers["caplen"].astype(np.int64)
+        complete = rec_off + 16 + caplen <= end
+        if not complete[-1]:  # truncated capture: the last record runs past the end
+            keep = int(np.argmin(complete))
+            rec_off, headers, caplen = rec_off[:keep], headers[:keep], caplen[:keep]
+            off = end
+        ts = headers["sec"] + headers["frac"] * ts_unit
+        yield ts, rec_off + 16, caplen, np.full(len(rec_off), linktype, dtype=np.int64)
+
+
+def _gather(buf8: np.ndarray, idx: np.ndarray, width: int, dtype: str) -> np.ndarray:
+    """Big-endian integers of `width` bytes at each offset (offsets are clamped to the buffer)."""
+    idx = np.clip(idx, 0, len(buf8) - width)
+    if width == 1:
+        return buf8[idx]
+    if width == 2:
+        return (buf8[idx].astype(np.uint16) << 8) | buf8[idx + 1]
+    return buf8[idx[:, None] + np.arange(width)].view(dtype).ravel()
+
+
+def _l3_offsets(buf8: np.ndarray, off: np.ndarray, lt: np.ndarray) -> np.ndarray:
+    """Vectorized _l3_offset: IP header offset per frame, -1 when the frame does not carry IP."""
+    l3 = np.full(len(off), -1, dtype=np.int64)
+    eth = lt == LINKTYPE_ETHERNET
+    if eth.any():
+        ethertype = _gather(buf8, off + 12, 2, ">u2")
+        l3e = off + 14
+        for _ in range(2):  # VLAN / QinQ tags
+            tagged = eth & ((ethertype == 0x8100) | (ethertype == 0x88A8))
+            if not tagged.any():
+                break
+            ethertype = np.where(tagged, _gather(buf8, l3e + 2, 2, ">u2"), ethertype)
+            l3e = np.where(tagged, l3e + 4, l3e)
+        sel = eth & ((ethertype == 0x0800) | (ethertype == 0x86DD))
+        l3[sel] = l3e[sel]
+    sel = (lt == LINKTYPE_RAW) | (lt == LINKTYPE_IPV4) | (lt == LINKTYPE_IPV6)
+    l3[sel] = off[sel]
+    for linktype, proto_at, header_len in ((LINKTYPE_LINUX_SLL, 14, 16), (LINKTYPE_LINUX_SLL2, 0, 20)):
+        sel = lt == linktype
+        if sel.any():
+            proto = _gather(buf8, off + proto_at, 2, ">u2")
+            sel &= (proto == 0x0800) | (proto == 0x86DD)
+            l3[sel] = off[sel] + header_len
+    sel = lt == LINKTYPE_NULL
+    l3[sel] = off[sel] + 4
+    return l3
+
+
+def decode_chunk(buf, buf8: np.ndarray, ts: np.ndarray, off: np.ndarray, caplen: np.ndarray,
+                 lt: np.ndarray) -> Tuple[Columns, int]:
+    """Decode the IP and TCP/UDP headers of a chunk of frames.
+
+    Returns the columns of the TCP/UDP packets (addresses as high/low 64-bit
+    halves, IPv4 in the low half; `l4` and `end` are the offsets of the
+    TCP/UDP header and of the frame end, -1 for frames decoded by the scalar
+    parser) in capture order, and the number of frames skipped.
+    """
+    end = off + caplen
+    l3 = _l3_offsets(buf8, off, lt)
+    valid = (l3 >= 0) & (l3 < end)
+    b0 = _gather(buf8, l3, 1, "u1")
+    ver = b0 >> 4
+    is4 = ver == 4
+    ihl = (b0 & 0x0F).astype(np.int64) * 4
+    l4 = l3 + np.where(is4, ihl, 40)
+    proto = _gather(buf8, l3 + np.where(is4, 9, 6), 1, "u1")
+    tcp_udp = (proto == IPPROTO_TCP) | (proto == IPPROTO_UDP)
+    frag = _gather(buf8, l3 + 6, 2, ">u2") & 0x1FFF
+    v4 = valid & is4 & (ihl >= 20) & (frag == 0)
+    v6 = valid & (ver == 6) & (l3 + 40 <= end)
+    fast = np.flatnonzero((v4 | v6) & tcp_udp & (l4 + 4 <= end))
+    slow = np.flatnonzero(v6 & np.isin(proto, _IPV6_EXT_HEADERS + (_IPV6_FRAGMENT,)))
+
+    l3f, f4 = l3[fast], is4[fast]
+    l4f = l4[fast]
+    n = len(fast)
+    cols = {
+        "ver": ver[fast],
+        "proto": proto[fast],
+        "a_hi": np.zeros(n, dtype=np.uint64),
+        "a_lo": np.zeros(n, dtype=np.uint64),
+        "b_hi": np.zeros(n, dtype=np.uint64),
+        "b_lo": np.zeros(n, dtype=np.uint64),
+        "sport": _gather(buf8, l4f, 2, ">u2").astype(np.int64),
+        "dport": _gather(buf8, l4f + 2, 2, ">u2").astype(np.int64),
+        "length": np.zeros(n, dtype=np.int64),
+        "ts": ts[fast],
+        "l4": l4f,
+        "end": end[fast],
+    }
+    i4 = np.flatnonzero(f4)
+    if len(i4):
+        at = l3f[i4]
+        cols["a_lo"][i4] = _gather(buf8, at + 12, 4, ">u4")
+        cols["b_lo"][i4] = _gather(buf8, at + 16, 4, ">u4")
+        # IPv4 total length is 0 in captures of TSO/GSO super-frames
+        length = _gather(buf8, at + 2, 2, ">u2").astype(np.int64)
+        cols["length"][i4] = np.where(length > 0, length, end[fast][i4] - at)
+    i6 = np.flatnonzero(~f4)
+    if len(i6):
+        at = l3f[i6]
+        for name, rel in (("a_hi", 8), ("a_lo", 16), ("b_hi", 24), ("b_lo", 32)):
+            cols[name][i6] = _gather(buf8, at + rel, 8, ">u8")
+        cols["length"][i6] = 40 + _gather(buf8, at + 4, 2, ">u2").astype(np.int64)
+
+    if len(slow):
+        # IPv6 extension headers: walk them with the scalar parser
+        rows, kept = [], []
+        for i in slow.tolist():
+            header = parse_headers(buf, int(off[i]), int(caplen[i]), int(lt[i]))
+            if header is None:
+                continue
+            p, src, dst, sport, dport, length = header
+            rows.append((6, p, int.from_bytes(src[:8], "big"), int.from_bytes(src[8:], "big"),
+                         int.from_bytes(dst[:8], "big"), int.from_bytes(dst[8:], "big"), sport, dport, length, float(ts[i]), -1, -1))
+            kept.append(i)
+        if rows:
+            extra = list(zip(*rows))
+            order = np.argsort(np.concatenate([fast, kept]), kind="stable")
+            for name, values in zip(_COLUMN_NAMES, extra):
+                cols[name] = np.concatenate([cols[name], np.array(values, dtype=cols[name].dtype)])[order]
+    return cols, len(off) - len(cols["ts"])
+
+
+def _mix(h: np.ndarray, col: np.ndarray) -> np.ndarray:
+    h = (h ^ col.astype(np.uint64)) * np.uint64(0x9E3779B97F4A7C15)
+    return h ^ (h >> np.uint64(29))
+
+
+class FlowAggregator:
+    """Per-5-tuple counters with idle and active timeouts in capture time.
+
+    Flows are bidirectional: both directions map to one canonical key and the
+    orientation of the first packet seen decides source and destination.
+    Within a chunk, packets are grouped by a 64-bit hash of the canonical key,
+    and a group is split wherever it goes quiet for `idle_timeout`. The flow
+    table is then updated once per group. Idle flows outside the chunk are
+    found by sweeping the table once per `sweep_interval` seconds of capture
+    time.
+    """
+
+    def __init__(self, idle_timeout: float = 15.0, active_timeout: float = 120.0, sweep_interval: float = 1.0):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.sweep_interval = sweep_interval
+        # canonical key -> [first_ts, last_ts, packets, bytes, ver, proto, src_hi, src_lo, dst_hi, dst_lo, dest_port, hostname]
+        self.flows: Dict[Tuple[int, ...], List[Any]] = {}
+        self._next_sweep: Optional[float] = None
+        self.stats = {"packets": 0, "skipped": 0, "flows_emitted": 0, "idle_expired": 0, "active_expired": 0}
+
+    @staticmethod
+    def to_features(entry: List[Any]) -> Dict[str, Any]:
+        first, last, packets, nbytes, ver, proto, src_hi, src_lo, dst_hi, dst_lo, dport, hostname = entry
+        if ver == 4:
+            src, dst = ipaddress.IPv4Address(src_lo), ipaddress.IPv4Address(dst_lo)
+        else:
+            src, dst = ipaddress.IPv6Address(src_hi << 64 | src_lo), ipaddress.IPv6Address(dst_hi << 64 | dst_lo)
+        features = {
+            "source_ip": str(src),
+            "dest_ip": str(dst),
+            "dest_port": dport,
+            "packet_count": packets,
+            "avg_pkt_len": nbytes / packets,
+            "duration_seconds": last - first,
+            "bytes_total": nbytes,
+            "protocol": PROTO_NAMES[proto],
+        }
+        if hostname:
+            features["hostname"] = hostname
+        return features
+
+    def add_chunk(self, cols: Columns, out: List[Dict[str, Any]], sni: Optional[Tuple[np.ndarray, List[str]]] = None,
+                  enricher=None) -> None:
+        """Count a chunk of decoded packets; flows that time out are appended to `out`.
+
+        With a HostnameEnricher, a new flow takes the cached name of its
+        destination at its first packet. `sni` is (packet indices, hostnames)
+        of the chunk's TLS ClientHellos (HostnameEnricher.scan); each
+        hostname is attached to its packet's flow, replacing a cached name.
+        """
+        n = len(cols["ts"])
+        if not n:
+            return
+        self.stats["packets"] += n
+        a_hi, a_lo, b_hi, b_lo = cols["a_hi"], cols["a_lo"], cols["b_hi"], cols["b_lo"]
+        sport, dport, ts = cols["sport"], cols["dport"], cols["ts"]
+        swap = (a_hi > b_hi) | ((a_hi == b_hi) & ((a_lo > b_lo) | ((a_lo == b_lo) & (sport > dport))))
+        canon = [cols["ver"], cols["proto"],
+                 np.where(swap, b_hi, a_hi), np.where(swap, b_lo, a_lo), np.where(swap, a_hi, b_hi), np.where(swap, a_lo, b_lo),
+                 np.where(swap, dport, sport), np.where(swap, sport, dport)]
+        h = np.zeros(n, dtype=np.uint64)
+        for col in canon:
+            h = _mix(h, col)
+
+        # stable sort keeps capture order within a flow
+        order = np.argsort(h, kind="stable")
+        hs, tss = h[order], ts[order]
+        brk = np.ones(n, dtype=bool)
+        np.not_equal(hs[1:], hs[:-1], out=brk[1:])
+        brk[1:] |= (tss[1:] - tss[:-1]) >= self.idle_timeout
+        starts = np.flatnonzero(brk)
+        first = order[starts]
+        counts = np.diff(np.append(starts, n))
+        nbytes = np.add.reduceat(cols["length"][order], starts)
+        t1 = tss[np.append(starts[1:], n) - 1]
+
+        keys = zip(*(c[first].tolist() for c in canon))
+        orient = zip(*(c[first].tolist() for c in (cols["ver"], cols["proto"], a_hi, a_lo, b_hi, b_lo, dport)))
+        flows, idle, active = self.flows, self.idle_timeout, self.active_timeout
+        for key, start, stop, cnt, size, o in zip(keys, ts[first].tolist(), t1.tolist(), counts.tolist(), nbytes.tolist(), orient):
+            entry = flows.get(key)
+            if entry is not None:
+                if start - entry[1] >= idle:
+                    out.append(self.to_features(flows.pop(key)))
+                    self.stats["idle_expired"] += 1
+                    entry = None
+                elif start - entry[0] >= active:
+                    out.append(self.to_features(flows.pop(key)))
+                    self.stats["active_expired"] += 1
+                    entry = None
+            if entry is None:
+                # o = (ver, proto, src_hi, src_lo, dst_hi, dst_lo, dport)
+                hostname = enricher.destination(o[0], o[4], o[5], start) if enricher is not None else None
+                flows[key] = [start, stop, cnt, size, *o, hostname]
+            else:
+                entry[1] = stop
+                entry[2] += cnt
+                entry[3] += size
+        if sni is not None:
+            for i, name in zip(sni[0].tolist(), sni[1]):
+                entry = flows.get(tuple(int(c[i]) for c in canon))
+                if entry is not None:
+                    entry[11] = name
+
+        now = float(tss[-1]) if tss[-1] >= tss[0] else float(ts.max())
+        if self._next_sweep is None:
+            self._next_sweep = now + self.sweep_interval
+        elif now >= self._next_sweep:
+            self.expire(now, out)
+            self._next_sweep = now + self.sweep_interval
+
+    def expire(self, now: float, out: List[Dict[str, Any]]) -> None:
+        idle = [k for k, e in self.flows.items() if now - e[1] >= self.idle_timeout]
+        for key in idle:
+            out.append(self.to_features(self.flows.pop(key)))
+        self.stats["idle_expired"] += len(idle)
+
+    def drain(self, out: List[Dict[str, Any]]) -> None:
+        """Emit every remaining flow (end of capture)."""
+        for entry in self.flows.values():
+            out.append(self.to_features(entry))
+        self.flows = {}
+
+
+def _describe_oriented(o: Tuple[int, ...]) -> Dict[str, Any]:
+    ver, proto, src_hi, src_lo, dst_hi, dst_lo, dport = o
+    if ver == 4:
+        src, dst = ipaddress.IPv4Address(src_lo), ipaddress.IPv4Address(dst_lo)
+    else:
+        src, dst = ipaddress.IPv6Address(src_hi << 64 | src_lo), ipaddress.IPv6Address(dst_hi << 64 | dst_lo)
+    return {"source_ip": str(src), "dest_ip": str(dst), "dest_port": dport, "protocol": PROTO_NAMES[proto]}
+
+
+def early_decisions(path: str, table, chunk_bytes: int = CHUNK_BYTES,
+                    max_wait: float = 0.001) -> Iterator[Dict[str, Any]]:
+    """Replay a capture packet by packet through an OnlineFlowTable and yield its decision events.
+
+    Flows are keyed by the 64-bit hash of their bidirectional 5-tuple, the
+    same hash FlowAggregator groups by. Due flows are classified together
+    once the oldest has waited `max_wait` seconds of capture time, so a
+    decision is never held back by the chunking. Idle flows are swept once per
+    chunk.
+    """
+    table.describe = _describe_oriented
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        buf8 = np.frombuffer(buf, dtype=np.uint8)
+        chunks = _frame_chunks(buf, buf8, chunk_bytes)
+        try:
+            for ts, off, caplen, lt in chunks:
+                cols, _ = decode_chunk(buf, buf8, ts, off, caplen, lt)
+                if not len(cols["ts"]):
+                    continue
+                a_hi, a_lo, b_hi, b_lo = cols["a_hi"], cols["a_lo"], cols["b_hi"], cols["b_lo"]
+                sport, dport = cols["sport"], cols["dport"]
+                swap = (a_hi > b_hi) | ((a_hi == b_hi) & ((a_lo > b_lo) | ((a_lo == b_lo) & (sport > dport))))
+                h = np.zeros(len(swap), dtype=np.uint64)
+                for col in (cols["ver"], cols["proto"], np.where(swap, b_hi, a_hi), np.where(swap, b_lo, a_lo),
+                            np.where(swap, a_hi, b_hi), np.where(swap, a_lo, b_lo),
+                            np.where(swap, dport, sport), np.where(swap, sport, dport)):
+                    h = _mix(h, col)
+                flows, update = table.flows, table.update
+                oriented = zip(*(c.tolist() for c in (cols["ver"], cols["proto"], a_hi, a_lo, b_hi, b_lo, dport)))
+                for key, t, length, o in zip(h.tolist(), cols["ts"].tolist(), cols["length"].tolist(), oriented):
+                    # only a new flow needs its oriented identity
+                    update(key, t, length, ident=None if key in flows else o)
+                    if table.due_since is not None and t - table.due_since >= max_wait:
+                        yield from table.decide()
+                table.expire(float(cols["ts"][-1]))
+        finally:
+            chunks.close()
+            del buf8, chunks
+    yield from table.decide()
+
+
+def ingest(path: str, batch_size: int = 512, idle_timeout: float = 15.0, active_timeout: float = 120.0,
+           aggregator: Optional[FlowAggregator] = None, chunk_bytes: int = CHUNK_BYTES,
+           enricher=None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield batches of FlowFeatures dicts (at most batch_size each) from a capture file.
+
+    With a hostname_enrichment.HostnameEnricher, flows carry a `hostname` when one is known.
+    """
+    agg = aggregator or FlowAggregator(idle_timeout, active_timeout)
+    pending: List[Dict[str, Any]] = []
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        buf8 = np.frombuffer(buf, dtype=np.uint8)
+        chunks = _frame_chunks(buf, buf8, chunk_bytes)
+        try:
+            for ts, off, caplen, lt in chunks:
+                cols, skipped = decode_chunk(buf, buf8, ts, off, caplen, lt)
+                agg.stats["skipped"] += skipped
+                sni = enricher.scan(buf, buf8, cols) if enricher is not None and len(cols["ts"]) else None
+                agg.add_chunk(cols, pending, sni, enricher)
+                while len(pending) >= batch_size:
+                    agg.stats["flows_emitted"] += batch_size
+                    yield pending[:batch_size]
+                    del pending[:batch_size]
+        finally:
+            # the mapping cannot be closed while a NumPy view of it is alive
+            chunks.close()
+            del buf8, chunks
+    agg.drain(pending)
+    for i in range(0, len(pending), batch_size):
+        agg.stats["flows_emitted"] += len(pending[i:i + batch_size])
+        yield pending[i:i + batch_size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate a pcap/pcapng capture into FlowFeatures JSON lines")
+    parser.add_argument("capture", help="Path to a .pcap or .pcapng file")
+    parser.add_argument("--idle-timeout", type=float, default=15.0, help="Emit a flow after this many idle seconds")
+    parser.add_argument("--active-timeout", type=float, default=120.0, help="Emit (and restart) a flow after this many seconds")
+    parser.add_argument("--batch-size", type=int, default=512, help="Flows per classifier batch")
+    parser.add_argument("--classify", action="store_true", help="Classify each batch with the Sentry model")
+    parser.add_argument("--model", default="sentry_model.pkl", help="Sentry model payload used with --classify/--early")
+    parser.add_argument("--early", action="store_true", help="Print provisional per-flow decisions as packets arrive")
+    parser.add_argument("--early-packets", type=int, default=8, help="Packets before a flow's first provisional decision")
+    parser.add_argument("--no-hostnames", action="store_true", help="Do not extract TLS SNI / DNS hostnames")
+    args = parser.parse_args()
+
+    if args.early:
+        from online_flows import OnlineFlowTable
+        from sentinel_ai_classifier import SENTRY_CONFIDENCE_THRESHOLD, init_sentry, sentry_predict_batch
+        sentry = init_sentry(args.model)
+        if sentry is None or sentry.model is None:
+            parser.error(f"--early needs a Sentry model ({args.model} could not be loaded)")
+        table = OnlineFlowTable(sentry_predict_batch, first_decision_packets=args.early_packets,
+                                final_confidence=SENTRY_CONFIDENCE_THRESHOLD, idle_timeout=args.idle_timeout)
+        for event in early_decisions(args.capture, table):
+            event.pop("key")
+            sys.stdout.write(json.dumps(event) + "\n")
+        print(json.dumps(table.stats), file=sys.stderr)
+        return
+
+    classify = None
+    if args.classify:
+        from sentinel_ai_classifier import classify_batch, init_sentry
+        init_sentry(args.model)
+        classify = classify_batch
+
+    enricher = None
+    if not args.no_hostnames:
+        from hostname_enrichment import HostnameEnricher
+        enricher = HostnameEnricher()
+
+    agg = FlowAggregator(args.idle_timeout, args.active_timeout)
+    out = sys.stdout
+    for batch in ingest(args.capture, args.batch_size, aggregator=agg, enricher=enricher):
+        results = classify(batch) if classify else [None] * len(batch)
+        for features, result in zip(batch, results):
+            out.write(json.dumps({**features, **result} if result else features) + "\n")
+    stats = dict(agg.stats)
+    if enricher is not None:
+        stats.update(hostnames=enricher.stats, hostname_cache=enricher.cache.stats)
+    print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Compiled matcher for approved and operator-defined policy rules.
+
+Rules are plain dicts:
+
+    {"id": "policy_rule_1", "app_type": "Gaming", "src_cidr": "192.168.1.0/24",
+     "dst_cidr": "10.0.0.0/8", "port_min": 27000, "port_max": 27100,
+     "protocol": "udp", "profile_id": None, "priority": 0}
+
+Every field except `id` and `app_type` is optional. Profile rules (from
+approved suggestions) are an exact dict lookup on the flow's profile
+fingerprint. All other rules are compiled into a binary longest-prefix-match
+trie on the destination prefix (one per address family). Each trie node holds
+a port table with exact ports, port ranges and wildcard rules. The ranges are
+compiled into disjoint port intervals, each carrying the rules that cover it
+narrowest first, so a port lookup is one bisect. A lookup walks at most one
+node per prefix bit. Adding or removing a rule only touches that rule's node,
+so approving or denying a suggestion never recompiles the whole table.
+"""
+
+import bisect
+import ipaddress
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class _PortTable:
+    """Rules at one trie node, indexed by destination port."""
+
+    __slots__ = ("exact", "ranges", "any", "_bounds", "_covering")
+
+    def __init__(self):
+        self.exact: Dict[int, List[Dict[str, Any]]] = {}
+        # sorted by (port_min, port_max, rule id)
+        self.ranges: List[Tuple[int, int, str, Dict[str, Any]]] = []
+        self.any: List[Dict[str, Any]] = []
+        # disjoint intervals: _covering[i] holds the range rules covering ports _bounds[i] .. _bounds[i + 1] - 1
+        self._bounds: List[int] = []
+        self._covering: List[List[Dict[str, Any]]] = []
+
+    def _compile_ranges(self) -> None:
+        narrowest = sorted(self.ranges, key=lambda r: r[1] - r[0])
+        bounds: List[int] = []
+        covering: List[List[Dict[str, Any]]] = []
+        for start in sorted({r[0] for r in self.ranges} | {r[1] + 1 for r in self.ranges}):
+            rules = [r[3] for r in narrowest if r[0] <= start <= r[1]]
+            if not covering or rules != covering[-1]:
+                bounds.append(start)
+                covering.append(rules)
+        self._bounds, self._covering = bounds, covering
+
+    def add(self, rule: Dict[str, Any]) -> None:
+        lo, hi = rule.get("port_min"), rule.get("port_max")
+        if lo is None and hi is None:
+            self.any.append(rule)
+        elif lo is not None and hi is not None and lo == hi:
+            self.exact.setdefault(int(lo), []).append(rule)
+        else:
+            bisect.insort(self.ranges, (int(lo if lo is not None else 0), int(hi if hi is not None else 65535), rule["id"], rule))
+            self._compile_ranges()
+
+    def remove(self, rule: Dict[str, Any]) -> None:
+        for bucket in [self.any] + list(self.exact.values()):
+            if rule in bucket:
+                bucket.remove(rule)
+        self.exact = {p: b for p, b in self.exact.items() if b}
+        ranges = [r for r in self.ranges if r[2] != rule["id"]]
+        if len(ranges) != len(self.ranges):
+            self.ranges = ranges
+            self._compile_ranges()
+
+    def __bool__(self) -> bool:
+        return bool(self.any or self.exact or self.ranges)
+
+    def candidates(self, port: int) -> List[List[Dict[str, Any]]]:
+        """Rules matching `port`, grouped by specificity: exact, ranges (narrowest first), any."""
+        i = bisect.bisect_right(self._bounds, port) - 1
+        return [self.exact.get(port, []), self._covering[i] if i >= 0 else [], self.any]
+
+
+class PrefixTrie:
+    """Binary trie keyed by network prefix; each node carries a _PortTable."""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        # node = [child0, child1, _PortTable or None]
+        self.root: List[Any] = [None, None, None]
+
+    def _node(self, network, create: bool):
+        node = self.root
+        addr = int(network.network_address)
+        for i in range(network.prefixlen):
+            bit = (addr >> (self.bits - 1 - i)) & 1
+            if node[bit] is None:
+                if not create:
+                    return None
+                node[bit] = [None, None, None]
+            node = node[bit]
+        return node
+
+    def insert(self, network, rule: Dict[str, Any]) -> None:
+        node = self._node(network, create=True)
+        if node[2] is None:
+            node[2] = _PortTable()
+        node[2].add(rule)
+
+    def remove(self, network, rule: Dict[str, Any]) -> None:
+        node = self._node(network, create=False)
+        if node is not None and node[2] is not None:
+            node[2].remove(rule)
+            if not node[2]:
+                node[2] = None
+
+    def tables(self, address: int) -> List[_PortTable]:
+        """Port tables on the path to `address`, longest prefix first."""
+        found: List[_PortTable] = []
+        node = self.root
+        depth = 0
+        while node is not None:
+            if node[2] is not None:
+                found.append(node[2])
+            if depth == self.bits:
+                break
+            node = node[(address >> (self.bits - 1 - depth)) & 1]
+            depth += 1
+        found.reverse()
+        return found
+
+
+def _network(value: Optional[str], version: int):
+    if not value:
+        return ipaddress.ip_network("0.0.0.0/0" if version == 4 else "::/0")
+    return ipaddress.ip_network(value, strict=False)
+
+
+class PolicyMatcher:
+    """Incrementally compiled rule set; `match` returns the winning rule or None."""
+
+    def __init__(self):
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        self._profile_rules: Dict[str, List[Dict[str, Any]]] = {}
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        # parsed source networks, so matching does not re-parse CIDR strings
+        self._src_nets: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _versions(self, rule: Dict[str, Any]) -> List[int]:
+        cidrs = [c for c in (rule.get("dst_cidr"), rule.get("src_cidr")) if c]
+        if not cidrs:
+            return [4, 6]
+        return [ipaddress.ip_network(cidrs[0], strict=False).version]
+
+    def add_rule(self, rule: Dict[str, Any]) -> Dict[str, Any]:
+        """Compile one rule in place (replacing an existing rule with the same id).
+
+        Raises ValueError on malformed CIDRs or mixed address families.
+        """
+        versions = {ipaddress.ip_network(c, strict=False).version for c in (rule.get("src_cidr"), rule.get("dst_cidr")) if c}
+        if len(versions) > 1:
+            raise ValueError("src_cidr and dst_cidr must be the same address family")
+        if rule["id"] in self.rules:
+            self.remove_rule(rule["id"])
+        self.rules[rule["id"]] = rule
+        if rule.get("src_cidr"):
+            self._src_nets[rule["id"]] = ipaddress.ip_network(rule["src_cidr"], strict=False)
+        if rule.get("profile_id"):
+            self._profile_rules.setdefault(rule["profile_id"], []).append(rule)
+            return rule
+        for version in self._versions(rule):
+            self._tries[version].insert(_network(rule.get("dst_cidr"), version), rule)
+        return rule
+
+    def remove_rule(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        self._src_nets.pop(rule_id, None)
+        if rule.get("profile_id"):
+            bucket = self._profile_rules.get(rule["profile_id"], [])
+            if rule in bucket:
+                bucket.remove(rule)
+            if not bucket:
+                self._profile_rules.pop(rule["profile_id"], None)
+            return rule
+        for version in self._versions(rule):
+            self._tries[version].remove(_network(rule.get("dst_cidr"), version), rule)
+        return rule
+
+    def _accepts(self, rule: Dict[str, Any], src, port: int, protocol: str) -> bool:
+        if rule.get("protocol") and str(rule["protocol"]).lower() != protocol:
+            return False
+        lo, hi = rule.get("port_min"), rule.get("port_max")
+        if (lo is not None and port < int(lo)) or (hi is not None and port > int(hi)):
+            return False
+        net = self._src_nets.get(rule["id"])
+        return net is None or (src is not None and src.version == net.version and src in net)
+
+    def match(self, features: Dict[str, Any], profile_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the most specific matching rule for a FlowFeatures dict.
+
+        Precedence: profile rules, then longest destination prefix, then
+        exact port over port range over any port, then `priority`.
+        """
+        if not self.rules:
+            return None
+        port = int(features.get("dest_port") or 0)
+        protocol = str(features.get("protocol") or "").lower()
+        try:
+            src = ipaddress.ip_address(str(features.get("source_ip")))
+        except ValueError:
+            src = None
+
+        if profile_id and profile_id in self._profile_rules:
+            hits = [r for r in self._profile_rules[profile_id] if self._accepts(r, src, port, protocol)]
+            if hits:
+                return max(hits, key=lambda r: r.get("priority", 0))
+
+        try:
+            dst = ipaddress.ip_address(str(features.get("dest_ip")))
+        except ValueError:
+            return None
+        for table in self._tries[dst.version].tables(int(dst)):
+            for group in table.candidates(port):
+                hits = [r for r in group if self._accepts(r, src, port, protocol)]
+                if hits:
+                    return max(hits, key=lambda r: r.get("priority", 0))
+        return None
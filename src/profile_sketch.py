@@ -0,0 +1,138 @@
+"""Stable traffic-profile fingerprints and bounded heavy-hitter counting.
+
+Suggestions are driven by how often a traffic *profile* (a quantized view of a
+flow's features) recurs with the same Vanguard label. Counting every profile
+exactly grows without bound, so counts are kept in a count-min sketch with a
+space-saving top-K table on top, both exponentially decayed so only recent
+activity (roughly one half-life) counts towards a heavy hitter.
+"""
+
+import hashlib
+import ipaddress
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _log2_bucket(value: Any) -> int:
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return -1
+    return int(math.log2(v)) if v >= 1 else 0
+
+
+def _dest_prefix(dest_ip: Any) -> str:
+    try:
+        ip = ipaddress.ip_address(str(dest_ip))
+    except ValueError:
+        return ""
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+def quantize_features(features: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Reduce a FlowFeatures dict to the coarse shape used for profile matching.
+
+    The source address is dropped (profiles span UEs), the destination is
+    reduced to its /24 (or /48) and volumetric features to log2 buckets.
+    """
+    try:
+        pkt_len_bucket = int(float(features.get("avg_pkt_len", 0)) // 100)
+    except (TypeError, ValueError):
+        pkt_len_bucket = -1
+    return (
+        _dest_prefix(features.get("dest_ip")),
+        int(features.get("dest_port") or 0),
+        str(features.get("protocol") or "").lower(),
+        pkt_len_bucket,
+        _log2_bucket(features.get("packet_count")),
+        _log2_bucket(features.get("duration_seconds")),
+        _log2_bucket(features.get("bytes_total")),
+    )
+
+
+def profile_fingerprint(features: Dict[str, Any]) -> str:
+    """Deterministic profile id, stable across restarts and worker processes."""
+    key = "|".join(str(x) for x in quantize_features(features)).encode()
+    return "profile_" + hashlib.blake2b(key, digest_size=8).hexdigest()
+
+
+class HeavyHitterDetector:
+    """Decayed count-min sketch plus space-saving top-K.
+
+    Decay uses forward scaling: an observation at time t is added with weight
+    2 ** ((t - landmark) / half_life) and estimates are scaled back by the same
+    factor, so no per-counter timers are needed. The landmark is moved forward
+    (rescaling all counters once) before weights can overflow.
+
+    A key is a heavy hitter once its decayed estimate reaches `min_count` and
+    `phi` of the decayed total. Memory is `depth * width` floats plus `top_k`
+    table entries regardless of how many distinct keys are observed.
+    """
+
+    _RESCALE_EXPONENT = 60.0
+
+    def __init__(self, width: int = 2048, depth: int = 4, top_k: int = 64, half_life_s: float = 600.0,
+                 min_count: float = 2.0, phi: float = 0.01):
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.half_life_s = half_life_s
+        self.min_count = min_count
+        self.phi = phi
+        self.counts = np.zeros((depth, width), dtype=np.float64)
+        self.total = 0.0
+        # key -> [scaled count, scaled overestimation error]
+        self.top: Dict[str, List[float]] = {}
+        self._landmark: Optional[float] = None
+
+    def _columns(self, key: str) -> np.ndarray:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % self.width
+
+    def _scale(self, now: float) -> float:
+        if self._landmark is None:
+            self._landmark = now
+        exponent = (now - self._landmark) / self.half_life_s
+        if exponent > self._RESCALE_EXPONENT:
+            factor = 2.0 ** -exponent
+            self.counts *= factor
+            self.total *= factor
+            for entry in self.top.values():
+                entry[0] *= factor
+                entry[1] *= factor
+            self._landmark = now
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def observe(self, key: str, ts: Optional[float] = None) -> Tuple[float, bool]:
+        """Count one occurrence of `key`; return (decayed estimate, is_heavy_hitter)."""
+        now = ts if ts is not None else time.time()
+        weight = self._scale(now)
+        rows = np.arange(self.depth)
+        cols = self._columns(key)
+        self.counts[rows, cols] += weight
+        self.total += weight
+        scaled_estimate = float(self.counts[rows, cols].min())
+
+        if key in self.top:
+            self.top[key][0] += weight
+        elif len(self.top) < self.top_k:
+            self.top[key] = [weight, 0.0]
+        else:
+            victim = min(self.top, key=lambda k: self.top[k][0])
+            floor = self.top.pop(victim)[0]
+            self.top[key] = [floor + weight, floor]
+
+        estimate = scaled_estimate / weight
+        is_heavy = estimate >= self.min_count and scaled_estimate >= self.phi * self.total
+        return estimate, is_heavy
+
+    def heavy_hitters(self, ts: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Current top-K keys with their guaranteed (count - error) decayed counts, largest first."""
+        now = ts if ts is not None else time.time()
+        weight = self._scale(now)
+        return sorted(((k, (v[0] - v[1]) / weight) for k, v in self.top.items()), key=lambda kv: kv[1], reverse=True)
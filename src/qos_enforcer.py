@@ -0,0 +1,220 @@
+"""Batched DSCP enforcement through nftables verdict maps.
+
+Instead of one iptables exec per flow, per-flow DSCP marks live as elements of
+two nftables maps (IPv4 and IPv6) keyed by `saddr . daddr . dport`. A single
+static rule per family looks the packet up in the map and sets its DSCP.
+Changes are staged in memory and flushed periodically as one `nft -f`
+transaction, so the cost of a batch is proportional to the number of changed
+flows and there is one process spawn per batch.
+
+With `dry_run=True` (the default, no root needed) nothing is executed.
+`ruleset_path` becomes a transaction log: the first batch writes the base
+ruleset and every later batch appends just its delta, so a tick costs the
+size of the batch. Replaying the file with `nft -f` reproduces the marks;
+`render_ruleset()` gives the compact effective ruleset on request.
+"""
+
+import ipaddress
+import os
+import subprocess
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (source_ip, dest_ip, dest_port)
+FlowKey = Tuple[str, str, int]
+
+NFT_TABLE = "sentinel_qos"
+NFT_FAMILY = "inet"
+MAP_V4 = "flow_dscp4"
+MAP_V6 = "flow_dscp6"
+
+
+def dscp_keyword(dscp_class: str) -> str:
+    """nftables dscp keyword for a POLICY_DEFINITIONS dscp_class (e.g. AF41 -> af41)."""
+    return str(dscp_class).strip().lower()
+
+
+def _family(key: FlowKey) -> Optional[int]:
+    try:
+        src = ipaddress.ip_address(key[0])
+        dst = ipaddress.ip_address(key[1])
+    except ValueError:
+        return None
+    return src.version if src.version == dst.version else None
+
+
+def _element(key: FlowKey) -> str:
+    return f"{key[0]} . {key[1]} . {int(key[2])}"
+
+
+def render_base_ruleset() -> str:
+    """Table, maps and the two lookup rules, replacing any existing table. Idempotent with `nft -f`.
+
+    The empty `table` line creates the table if it is missing so the
+    `delete table` cannot fail; the table is then defined from scratch,
+    which also drops map elements left in the kernel by an earlier run.
+    """
+    return "\n".join([
+        f"table {NFT_FAMILY} {NFT_TABLE}",
+        f"delete table {NFT_FAMILY} {NFT_TABLE}",
+        f"table {NFT_FAMILY} {NFT_TABLE} {{",
+        f"    map {MAP_V4} {{",
+        "        type ipv4_addr . ipv4_addr . inet_service : dscp",
+        "    }",
+        f"    map {MAP_V6} {{",
+        "        type ipv6_addr . ipv6_addr . inet_service : dscp",
+        "    }",
+        "    chain postrouting {",
+        "        type filter hook postrouting priority mangle; policy accept;",
+        f"        ip dscp set ip saddr . ip daddr . th dport map @{MAP_V4}",
+        f"        ip6 dscp set ip6 saddr . ip6 daddr . th dport map @{MAP_V6}",
+        "    }",
+        "}",
+        "",
+    ])
+
+
+def render_batch(adds: Dict[FlowKey, str], deletes: Iterable[FlowKey]) -> str:
+    """Render one atomic transaction of element deletes followed by adds.
+
+    Modified flows appear in both: nftables maps cannot overwrite an existing
+    element in place, so the old mapping is deleted first in the same batch.
+    """
+    lines: List[str] = []
+    for version, map_name in ((4, MAP_V4), (6, MAP_V6)):
+        dels = [_element(k) for k in deletes if _family(k) == version]
+        if dels:
+            lines.append(f"delete element {NFT_FAMILY} {NFT_TABLE} {map_name} {{ {', '.join(dels)} }}")
+        elems = [f"{_element(k)} : {dscp_keyword(v)}" for k, v in adds.items() if _family(k) == version]
+        if elems:
+            lines.append(f"add element {NFT_FAMILY} {NFT_TABLE} {map_name} {{ {', '.join(elems)} }}")
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+class NftEnforcer:
+    """Accumulates DSCP mark changes and applies them as periodic nft transactions."""
+
+    def __init__(self, dry_run: bool = True, ruleset_path: str = "sentinel_qos.nft", nft_bin: str = "nft"):
+        self.dry_run = dry_run
+        self.ruleset_path = ruleset_path
+        self.nft_bin = nft_bin
+        # marks known to be installed in the kernel (or in the dry-run file)
+        self.applied: Dict[FlowKey, str] = {}
+        # staged changes: dscp class to set, or None to remove
+        self.pending: Dict[FlowKey, Optional[str]] = {}
+        self._base_installed = False
+        self.stats = {"batches": 0, "elements_added": 0, "elements_deleted": 0, "errors": 0,
+                      "last_batch_size": 0, "last_apply_ms": 0.0}
+
+    def stage(self, key: FlowKey, dscp_class: Optional[str]) -> None:
+        """Stage a mark (or its removal when dscp_class is None); later stages win."""
+        if _family(key) is None:
+            return
+        if dscp_class is not None and self.applied.get(key) == dscp_class:
+            self.pending.pop(key, None)
+        else:
+            self.pending[key] = dscp_class
+
+    def _diff(self, pending: Dict[FlowKey, Optional[str]]) -> Tuple[Dict[FlowKey, str], List[FlowKey]]:
+        adds: Dict[FlowKey, str] = {}
+        deletes: List[FlowKey] = []
+        for key, dscp in pending.items():
+            current = self.applied.get(key)
+            if dscp is None:
+                if current is not None:
+                    deletes.append(key)
+            elif current != dscp:
+                if current is not None:
+                    deletes.append(key)
+                adds[key] = dscp
+        return adds, deletes
+
+    def _run(self, text: str, with_base: bool) -> None:
+        if self.dry_run:
+            # a batch carrying the base starts a new log; the rest append
+            with open(self.ruleset_path, "w" if with_base else "a") as fh:
+                fh.write(text)
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".nft", delete=False) as fh:
+            fh.write(text)
+            path = fh.name
+        try:
+            proc = subprocess.run([self.nft_bin, "-f", path], capture_output=True, text=True, timeout=10)
+            if proc.returncode != 0:
+                raise RuntimeError(proc.stderr.strip() or f"nft exited with {proc.returncode}")
+        finally:
+            os.unlink(path)
+
+    def take_pending(self) -> Tuple[Dict[FlowKey, Optional[str]], Dict[FlowKey, str], List[FlowKey]]:
+        """Detach the staged changes and diff them against `applied`.
+
+        Returns (staged, adds, deletes); hand `staged` back to `restage` if the
+        batch fails so it is retried.
+        """
+        staged, self.pending = self.pending, {}
+        adds, deletes = self._diff(staged)
+        return staged, adds, deletes
+
+    def restage(self, staged: Dict[FlowKey, Optional[str]]) -> None:
+        # changes staged after the failed batch was taken are newer and win
+        for key, dscp in staged.items():
+            self.pending.setdefault(key, dscp)
+
+    def execute(self, adds: Dict[FlowKey, str], deletes: List[FlowKey]) -> float:
+        """Render and run one transaction; returns the apply time in ms.
+
+        Does not touch `applied` or `pending`, so it is safe to run in a worker
+        thread while the event loop keeps staging; call `commit` afterwards.
+        Until a transaction carrying the base ruleset has succeeded, every
+        transaction carries it, even an empty one.
+        """
+        with_base = not self._base_installed
+        if not adds and not deletes and not with_base:
+            return 0.0
+        text = render_batch(adds, deletes)
+        if with_base:
+            text = render_base_ruleset() + text
+        start = time.perf_counter()
+        try:
+            self._run(text, with_base)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        self._base_installed = True
+        return (time.perf_counter() - start) * 1000.0
+
+    def commit(self, adds: Dict[FlowKey, str], deletes: List[FlowKey], elapsed_ms: float) -> Dict[str, float]:
+        """Record a successfully executed transaction as applied."""
+        for key in deletes:
+            self.applied.pop(key, None)
+        self.applied.update(adds)
+        if adds or deletes:
+            self.stats["batches"] += 1
+            self.stats["elements_added"] += len(adds)
+            self.stats["elements_deleted"] += len(deletes)
+            self.stats["last_batch_size"] = len(adds) + len(deletes)
+            self.stats["last_apply_ms"] = round(elapsed_ms, 3)
+        return {"added": len(adds), "deleted": len(deletes), "apply_ms": elapsed_ms}
+
+    def apply_changes(self, adds: Dict[FlowKey, str], deletes: Iterable[FlowKey]) -> Dict[str, float]:
+        """Apply explicit element adds/deletes as one transaction and update `applied`.
+
+        On failure nothing is recorded as applied (the kernel rejected the
+        whole transaction), the error is counted and re-raised.
+        """
+        deletes = list(deletes)
+        return self.commit(adds, deletes, self.execute(adds, deletes))
+
+    def flush(self) -> Dict[str, float]:
+        """Apply everything staged since the last flush as a single transaction."""
+        staged, adds, deletes = self.take_pending()
+        try:
+            return self.apply_changes(adds, deletes)
+        except Exception:
+            self.restage(staged)
+            raise
+
+    def render_ruleset(self) -> str:
+        """Full ruleset (base plus every applied element), e.g. for inspection or a cold start."""
+        return render_base_ruleset() + render_batch(self.applied, [])
@@ -0,0 +1,141 @@
+"""Desired-vs-applied reconciliation for per-flow DSCP marks.
+
+The orchestrator declares what it wants (`set_desired` / `clear`) as policies
+are created, replaced and removed; the reconciler keeps that desired table and
+hands only the differences to the enforcer, whose `applied` table is the
+applied state. Each tick flushes just the keys that changed since the last
+tick, so churn follows the actual changes rather than the number of flows. A
+periodic full resync diffs both tables completely to repair drift (e.g. after
+a failed batch), and owners that have not been refreshed within `ttl_s` are
+reported as expired so their rules can be garbage-collected.
+"""
+
+import heapq
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from qos_enforcer import FlowKey, NftEnforcer
+
+
+class Reconciler:
+    """Maintains desired marks keyed by flow tuple, each owned by one flow id.
+
+    When two flows resolve to the same tuple the most recent owner wins, and
+    clearing a stale owner does not remove the newer owner's mark.
+    """
+
+    def __init__(self, enforcer: NftEnforcer, ttl_s: float = 300.0, full_resync_every: int = 60):
+        self.enforcer = enforcer
+        self.ttl_s = ttl_s
+        self.full_resync_every = max(1, int(full_resync_every))
+        self.desired: Dict[FlowKey, Tuple[str, str]] = {}
+        self._owner_key: Dict[str, FlowKey] = {}
+        self._last_seen: Dict[str, float] = {}
+        # (expiry, owner) with lazy invalidation against _last_seen
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._ticks = 0
+        self.stats = {"runs": 0, "full_resyncs": 0, "desired": 0, "applied": 0, "pending_diff": 0,
+                      "last_adds": 0, "last_modifies": 0, "last_deletes": 0, "last_drift": 0,
+                      "last_apply_ms": 0.0, "expired_total": 0}
+
+    def set_desired(self, owner: str, key: FlowKey, dscp_class: str, ts: Optional[float] = None) -> None:
+        previous = self._owner_key.get(owner)
+        if previous is not None and previous != key:
+            self._release(owner, previous)
+        self._owner_key[owner] = key
+        self.desired[key] = (owner, dscp_class)
+        self.enforcer.stage(key, dscp_class)
+        self.touch(owner, ts)
+
+    def touch(self, owner: str, ts: Optional[float] = None) -> None:
+        """Refresh an owner's liveness; expired owners are returned by pop_expired."""
+        if owner not in self._owner_key or not self.ttl_s:
+            return
+        now = ts if ts is not None else time.time()
+        self._last_seen[owner] = now
+        heapq.heappush(self._expiry_heap, (now + self.ttl_s, owner))
+
+    def _release(self, owner: str, key: FlowKey) -> None:
+        current = self.desired.get(key)
+        if current is not None and current[0] == owner:
+            del self.desired[key]
+            self.enforcer.stage(key, None)
+
+    def clear(self, owner: str) -> None:
+        key = self._owner_key.pop(owner, None)
+        self._last_seen.pop(owner, None)
+        if key is not None:
+            self._release(owner, key)
+
+    def pop_expired(self, now: Optional[float] = None) -> List[str]:
+        """Owners not refreshed within ttl_s; their marks are cleared here."""
+        now = now if now is not None else time.time()
+        expired: List[str] = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            deadline, owner = heapq.heappop(self._expiry_heap)
+            last = self._last_seen.get(owner)
+            if last is None or last + self.ttl_s != deadline:
+                continue  # superseded by a later touch, or already cleared
+            self.clear(owner)
+            expired.append(owner)
+        self.stats["expired_total"] += len(expired)
+        return expired
+
+    def _stage_drift(self) -> int:
+        """Stage corrections for every key whose applied mark differs from the desired one."""
+        applied = self.enforcer.applied
+        drift = 0
+        for key in [k for k in applied if k not in self.desired]:
+            self.enforcer.stage(key, None)
+            drift += 1
+        for key, (_, dscp) in self.desired.items():
+            if applied.get(key) != dscp:
+                self.enforcer.stage(key, dscp)
+                drift += 1
+        return drift
+
+    def begin(self, full: Optional[bool] = None) -> Dict[str, Any]:
+        """Take the next diff batch; every `full_resync_every` ticks diff the full tables.
+
+        Run `enforcer.execute(batch["adds"], batch["deletes"])` (possibly in a
+        worker thread) and then call `complete` or `abort`.
+        """
+        self._ticks += 1
+        if full is None:
+            full = self._ticks % self.full_resync_every == 0
+        drift = self._stage_drift() if full else 0
+        staged, adds, deletes = self.enforcer.take_pending()
+        modifies = len(set(adds).intersection(deletes))
+        self.stats["runs"] += 1
+        self.stats["full_resyncs"] += int(bool(full))
+        self.stats["last_drift"] = drift
+        self.stats["pending_diff"] = len(adds) + len(deletes) - modifies
+        return {"staged": staged, "adds": adds, "deletes": deletes, "modifies": modifies}
+
+    def complete(self, batch: Dict[str, Any], elapsed_ms: float) -> None:
+        self.enforcer.commit(batch["adds"], batch["deletes"], elapsed_ms)
+        modifies = batch["modifies"]
+        if batch["adds"] or batch["deletes"]:
+            self.stats["last_adds"] = len(batch["adds"]) - modifies
+            self.stats["last_modifies"] = modifies
+            self.stats["last_deletes"] = len(batch["deletes"]) - modifies
+            self.stats["last_apply_ms"] = round(elapsed_ms, 3)
+        self.stats["desired"] = len(self.desired)
+        self.stats["applied"] = len(self.enforcer.applied)
+        self.stats["pending_diff"] = len(self.enforcer.pending)
+
+    def abort(self, batch: Dict[str, Any]) -> None:
+        """Put a failed batch back so the next tick retries it."""
+        self.enforcer.restage(batch["staged"])
+        self.stats["pending_diff"] = len(self.enforcer.pending)
+
+    def reconcile(self, full: Optional[bool] = None) -> Dict[str, Any]:
+        """Synchronous begin/execute/complete, for callers without an event loop."""
+        batch = self.begin(full)
+        try:
+            elapsed_ms = self.enforcer.execute(batch["adds"], batch["deletes"])
+        except Exception:
+            self.abort(batch)
+            raise
+        self.complete(batch, elapsed_ms)
+        return self.stats
@@ -1,10 +1,22 @@
 import json
 import asyncio
-from typing import Dict, Any
+import os
+import sys
+import time
+from typing import Dict, Any, List, Optional, Tuple
 try:
     import joblib
 except Exception:  # pragma: no cover - optional runtime
     joblib = None
+try:
+    from sentry_artifact import artifact_path, is_artifact, load_payload as load_artifact_payload
+    from feature_pipeline import payload_pipeline
+    from ood_detector import needs_vanguard, payload_scorer
+    from cascade import DEFAULT_RULE_GATE, DEFAULT_SIGNATURES, CascadeStats, SignatureTier
+    from hostname_enrichment import DEFAULT_DOMAIN_RULES, DomainMatcher
+    HAS_ARTIFACT = True
+except Exception:  # pragma: no cover - needs numpy
+    HAS_ARTIFACT = False
 
 HAS_OLLAMA = True
 try:
@@ -13,29 +25,72 @@ except Exception:
     HAS_OLLAMA = False
 
 
+def _artifact_for(path: str) -> Optional[str]:
+    """The memory-mapped artifact to load for `path`, if one exists and is not older than the pickle."""
+    if not HAS_ARTIFACT:
+        return None
+    if is_artifact(path):
+        return path
+    art = artifact_path(path)
+    if os.path.exists(art) and (not os.path.exists(path) or os.path.getmtime(art) >= os.path.getmtime(path)):
+        return art
+    return None
+
+
 class SentryWrapper:
+    """Loads the Sentry model for `path`, preferring its memory-mapped artifact (see sentry_artifact.py) over the pickle."""
+
     def __init__(self, path: str = "sentry_model.pkl"):
         self.path = path
         self.payload = None
+        # why an existing model file was not loaded, if it was not
+        self.error: Optional[str] = None
+        art = None
         try:
-            if joblib is None:
-                raise RuntimeError("joblib not available")
-            self.payload = joblib.load(path)
+            art = _artifact_for(path)
+            if art is not None:
+                try:
+                    self.payload = load_artifact_payload(art)
+                except (OSError, ValueError, KeyError):
+                    self.payload = None  # unreadable artifact: fall back to the pickle
+            if self.payload is None:
+                if joblib is None:
+                    raise RuntimeError("joblib not available")
+                self.payload = joblib.load(path)
             self.model = self.payload.get("model")
             self.le = self.payload.get("label_encoder")
             self.feature_columns = self.payload.get("feature_columns")
-        except Exception:
+            # the payload's own feature pipeline (see feature_pipeline.py) builds every model input
+            self.pipeline = payload_pipeline(self.payload)
+            foreign = self.pipeline.foreign_inputs()
+            if foreign:
+                # transform_rows would fill these with zeros for every flow
+                raise ValueError(f"model inputs {', '.join(foreign)} are not FlowFeatures fields; refusing to serve it")
+            # optional novelty scorer trained with the model (see ood_detector.py)
+            self.ood = payload_scorer(self.payload)
+        except Exception as e:
+            if art is not None or os.path.exists(path):
+                self.error = str(e) or type(e).__name__
+                print(f"WARNING: Sentry model {art or path} not loaded: {self.error}", file=sys.stderr)
             self.payload = None
             self.model = None
             self.le = None
             self.feature_columns = None
+            self.pipeline = None
+            self.ood = None
+
+    def _class_names(self, n_probs: int):
+        import numpy as np
+        classes = np.asarray(getattr(self.model, "classes_", np.arange(n_probs)))
+        if self.le:
+            classes = self.le.inverse_transform(classes.astype(int))
+        return [str(c) for c in classes]
 
     def predict_proba(self, features: Dict[str, Any]):
         if not self.model or not self.feature_columns:
             raise RuntimeError("No model loaded")
-        fv = [features.get(c, 0) for c in self.feature_columns]
         # model.predict_proba may return numpy arrays or sparse types; normalize to a list of floats
-        raw = self.model.predict_proba([fv])
+        raw = self.model.predict_proba(self.pipeline.transform_rows([features]))
         try:
             probs = raw[0]
         except Exception:
@@ -50,12 +105,40 @@ class SentryWrapper:
             except Exception:
                 return []
 
+    def predict_batch(self, rows: List[Dict[str, Any]]):
+        """(label, confidence) for each feature dict, with one predict_proba call for the whole batch."""
+        return [(label, confidence) for label, confidence, _ in self.predict_scored(rows)]
+
+    def predict_scored(self, rows: List[Dict[str, Any]]):
+        """(label, confidence, novelty) for each feature dict; novelty is None when the model has no OOD scorer."""
+        import numpy as np
+        if not self.model or not self.feature_columns:
+            raise RuntimeError("No model loaded")
+        X = self.pipeline.transform_rows(rows)
+        probs = np.asarray(self.model.predict_proba(X))
+        best = probs.argmax(axis=1)
+        names = self._class_names(probs.shape[1])
+        novelty = self.ood.novelty(X).tolist() if self.ood is not None else [None] * len(best)
+        return [(names[b], c, v) for b, c, v in zip(best.tolist(), probs[np.arange(len(best)), best].tolist(), novelty)]
+
+    def predict_columns(self, columns: Dict[str, Any]):
+        """(label names, per-row index into them, per-row confidence) for a dict of equal-length raw feature columns.
+
+        One predict_proba call for the whole matrix; missing raw columns are zero.
+        """
+        import numpy as np
+        if not self.model or not self.feature_columns:
+            raise RuntimeError("No model loaded")
+        n = len(next(iter(columns.values())))
+        probs = np.asarray(self.model.predict_proba(self.pipeline.transform_columns(columns, n)))
+        best = probs.argmax(axis=1)
+        return self._class_names(probs.shape[1]), best, probs[np.arange(n), best]
+
     def predict(self, features: Dict[str, Any]):
         if not self.model or not self.feature_columns:
             raise RuntimeError("No model loaded")
-        fv = [features.get(c, 0) for c in self.feature_columns]
         # normalize prediction output
-        raw = self.model.predict([fv])
+        raw = self.model.predict(self.pipeline.transform_rows([features]))
         try:
             lbl = raw[0]
         except Exception:
@@ -76,6 +159,50 @@ class SentryWrapper:
 # lazy-initialized module-level wrapper; call init_sentry(path) at startup
 sentry = None
 
+# Cascade tier 1 (see cascade.py): signatures from the model payload, calibrated by train_sentry.py, or the
+# uncalibrated defaults; rebuilt by init_sentry and set_rule_gate. Only signatures at or above the gate are used.
+rule_gate = DEFAULT_RULE_GATE if HAS_ARTIFACT else 1.0
+rule_tier = None
+cascade_stats = CascadeStats() if HAS_ARTIFACT else None
+# hostname -> app_type rules (hostname_enrichment.py), tried before the signatures; see set_domain_rules
+domain_rules = None
+domain_matcher = None
+
+# Sentry answers alone at or above this confidence; below it the flow escalates to Vanguard
+SENTRY_CONFIDENCE_THRESHOLD = 0.95
+
+# optional EscalationController (escalation_control.py) replacing the fixed threshold; see set_escalation_controller
+escalation_controller = None
+
+
+def set_escalation_controller(controller) -> None:
+    """Route Sentry -> Vanguard decisions through `controller` (None restores the fixed threshold)."""
+    global escalation_controller
+    escalation_controller = controller
+
+
+def _sentry_result(label: str, confidence: float, novelty: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """The Sentry answer for a prediction, or None when the flow should escalate to Vanguard.
+
+    `novelty` comes from the model's OOD scorer, if it has one; see ood_detector.needs_vanguard.
+    """
+    if escalation_controller is not None:
+        outcome = escalation_controller.decide(label, confidence, novelty)
+    elif needs_vanguard(confidence, SENTRY_CONFIDENCE_THRESHOLD, novelty):
+        outcome = "escalate"
+    else:
+        outcome = "sentry" if confidence >= SENTRY_CONFIDENCE_THRESHOLD else "familiar"
+    result = {"classification": label, "confidence": confidence, "explanation": "High-confidence classification by Sentry model.", "engine": "Sentry"}
+    if novelty is not None:
+        result["novelty"] = round(novelty, 4)
+    if outcome == "escalate":
+        return None
+    if outcome == "budget_denied":
+        result.update(explanation="Sentry model answer kept: Vanguard escalation budget exhausted.", budget_denied=True)
+    elif outcome == "familiar":
+        result["explanation"] = "Sentry model answer kept: low confidence, but the flow resembles the training data."
+    return result
+
 
 def init_sentry(path: str = "sentry_model.pkl"):
     """Initialize the module-level SentryWrapper. Safe to call multiple times."""
@@ -83,51 +210,140 @@ def init_sentry(path: str = "sentry_model.pkl"):
     try:
         sentry = SentryWrapper(path)
         # if model failed to load, SentryWrapper will set model to None
-        return sentry
     except Exception:
         sentry = None
+    _build_rule_tier()
+    return sentry
+
+
+def _build_rule_tier() -> None:
+    global rule_tier, domain_matcher
+    if not HAS_ARTIFACT:
+        return
+    payload = (sentry.payload or {}) if sentry is not None else {}
+    try:
+        rule_tier = SignatureTier(payload.get("signatures") or DEFAULT_SIGNATURES, rule_gate)
+    except (KeyError, TypeError, ValueError):
+        rule_tier = SignatureTier(DEFAULT_SIGNATURES, rule_gate)
+    try:
+        domain_matcher = DomainMatcher(domain_rules or payload.get("domain_rules") or DEFAULT_DOMAIN_RULES)
+    except (KeyError, TypeError, ValueError):
+        domain_matcher = DomainMatcher(DEFAULT_DOMAIN_RULES)
+
+
+def set_rule_gate(gate: float) -> None:
+    """Minimum signature confidence for the rule tier (above 1 disables it)."""
+    global rule_gate
+    rule_gate = gate
+    _build_rule_tier()
+
+
+def set_domain_rules(rules: Optional[List[Dict[str, Any]]]) -> None:
+    """Operator hostname rules ({"domain", "app_type"[, "confidence"]}); None restores the model's or the defaults."""
+    global domain_rules
+    domain_rules = rules
+    _build_rule_tier()
+
+
+def cascade_status() -> Dict[str, Any]:
+    """Per-tier counters plus the rule tier's gate, signatures and domain rules and the destination index settings."""
+    return {
+        "destination_index": destination_index.snapshot() if destination_index is not None else None,
+        "tiers": cascade_stats.snapshot() if cascade_stats is not None else {},
+        "rule_gate": rule_gate,
+        "active_signatures": rule_tier.active if rule_tier is not None else 0,
+        "signatures": rule_tier.signatures if rule_tier is not None else [],
+        "domain_rules": len(domain_matcher) if domain_matcher is not None else 0,
+    }
+
+
+# optional DestinationIndex (destination_index.py): cascade tier 2, fed by confident Sentry and Vanguard answers
+destination_index = None
+
+
+def set_destination_index(index) -> None:
+    global destination_index
+    destination_index = index
+
+
+def _index_result(features: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    hit = destination_index.lookup(features)
+    if hit is None:
         return None
+    return {"classification": hit["app_type"], "confidence": hit["agreement"], "engine": "Index",
+            "explanation": f"Destination {hit['key']} seen as {hit['app_type']} (support {hit['support']:.1f}, agreement {hit['agreement']:.2f})"}
+
+
+def _learn(features: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """Feed a Sentry or (real) Vanguard answer to the destination index."""
+    if destination_index is not None and not result.get("simulated") and not result.get("budget_denied"):
+        try:
+            destination_index.observe(features, str(result.get("classification") or ""), float(result.get("confidence") or 0.0), str(result.get("engine")))
+        except (TypeError, ValueError):
+            pass
+
+
+def _rule_result(features: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    hostname = features.get("hostname")
+    if hostname and domain_matcher is not None:
+        rule = domain_matcher.match(hostname)
+        if rule is not None and float(rule["confidence"]) >= rule_gate:
+            return {"classification": rule["app_type"], "confidence": float(rule["confidence"]),
+                    "explanation": f"Hostname {hostname} matches domain rule {rule['domain']}", "engine": "Rules"}
+    signature = rule_tier.match(features) if rule_tier is not None else None
+    if signature is None:
+        return None
+    return {"classification": signature["app_type"], "confidence": float(signature["confidence"]),
+            "explanation": f"Matched traffic signature {signature['id']}", "engine": "Rules"}
 
 
 def classify_traffic(features: Dict[str, Any]) -> Dict[str, Any]:
-    """Hybrid classifier (synchronous): try Sentry (fast) then Vanguard (LLM) if low confidence.
+    """Hybrid classifier (synchronous): signature rules, the destination index, then Sentry (fast), then Vanguard (LLM) if low confidence.
 
     Returns a dict: {classification, confidence, explanation, engine}
     This function is intentionally synchronous so callers can run it in a thread
     (e.g., via run_in_executor) to avoid blocking async event loops.
     """
-    # Try Sentry
-    # Attempt Sentry if model available
-    probs = None
-    classification = None
-    confidence = 0.0
-    try:
-        if sentry and getattr(sentry, 'model', None):
-            probs = sentry.predict_proba(features)
-            # normalize probs into a concrete Python list of floats (probs_list)
-            probs_list = []
-            try:
-                if probs is None:
-                    raise ValueError('no probs')
-                tmp = list(probs)
-                if len(tmp) == 0:
-                    raise ValueError('empty probs')
-                probs_list = [float(x) for x in tmp]
-            except Exception:
-                probs_list = []
+    start = time.perf_counter()
+    result = _rule_result(features)
+    _record_tier("rules", 1, result is not None, start)
+    if result is not None:
+        return result
 
-            if probs_list:
-                # safe argmax without depending on numpy
-                best_idx = max(range(len(probs_list)), key=lambda i: probs_list[i])
-                confidence = float(probs_list[best_idx])
-                classification = sentry.predict(features)
-    except Exception:
-        probs = None
+    if destination_index is not None:
+        start = time.perf_counter()
+        result = _index_result(features)
+        _record_tier("index", 1, result is not None, start)
+        if result is not None:
+            return result
 
-    if probs is not None and confidence >= 0.95 and classification is not None:
-        return {"classification": classification, "confidence": confidence, "explanation": "High-confidence classification by Sentry model.", "engine": "Sentry"}
+    # Then Sentry when a model is loaded: one model call gives label, confidence and novelty
+    if sentry and getattr(sentry, 'model', None):
+        start = time.perf_counter()
+        try:
+            result = _sentry_result(*sentry.predict_scored([features])[0])
+        except Exception:
+            result = None
+        _record_tier("sentry", 1, result is not None, start)
+        if result is not None:
+            _learn(features, result)
+            return result
 
     # Otherwise escalate to Vanguard (LLM)
+    start = time.perf_counter()
+    result = _vanguard_classify(features)
+    _record_tier("vanguard", 1, 1, start)
+    _learn(features, result)
+    return result
+
+
+def _record_tier(tier: str, offered: int, resolved: int, start: float) -> None:
+    if cascade_stats is not None:
+        cascade_stats.record(tier, offered, int(resolved), time.perf_counter() - start)
+
+
+def _vanguard_classify(features: Dict[str, Any]) -> Dict[str, Any]:
+    """Vanguard (LLM) classification with the simulated fallback when Ollama is unavailable."""
     prompt = f"Analyze this network traffic and provide a classification and short explanation. Features: {json.dumps(features)}"
 
     if HAS_OLLAMA:
@@ -171,9 +387,94 @@ def classify_traffic(features: Dict[str, Any]) -> Dict[str, Any]:
         except Exception:
             pass
 
-    # Fallback simulated LLM response
+    return _simulated_vanguard(features)
+
+
+def _simulated_vanguard(features: Dict[str, Any]) -> Dict[str, Any]:
+    """Simulated Vanguard answer, used when Ollama is unavailable and for load-generator traffic."""
     # Basic heuristic: flip to a plausible label with moderate confidence and explanation
     import random
     candidate = random.choice(["Audio/Video Call", "Video Streaming", "Browsing", "File Download", "Gaming"])
     explanation = f"Vanguard simulated: based on features, likely {candidate}."
-    return {"classification": candidate, "confidence": 0.88, "explanation": explanation, "engine": "Vanguard"}
+    return {"classification": candidate, "confidence": 0.88, "explanation": explanation, "engine": "Vanguard", "simulated": True}
+
+
+def sentry_predict_batch(features_list: List[Dict[str, Any]]) -> Optional[List[Tuple[str, float]]]:
+    """(label, confidence) per flow from the Sentry model alone, or None when no model is loaded."""
+    if not features_list or not (sentry and getattr(sentry, 'model', None)):
+        return None
+    try:
+        return sentry.predict_batch(features_list)
+    except Exception:
+        return None
+
+
+def sentry_predict_columns(columns: Dict[str, Any]):
+    """SentryWrapper.predict_columns on the loaded model, or None when no model is loaded."""
+    if not (sentry and getattr(sentry, 'model', None)):
+        return None
+    try:
+        return sentry.predict_columns(columns)
+    except Exception:
+        return None
+
+
+def sentry_features(features_list: List[Dict[str, Any]]):
+    """(feature column names, model matrix) from the loaded model's feature pipeline, or None when no model is loaded."""
+    if not (sentry and getattr(sentry, 'model', None)):
+        return None
+    return sentry.feature_columns, sentry.pipeline.transform_rows(features_list)
+
+
+def sentry_payload() -> Optional[Dict[str, Any]]:
+    """The payload dict of the loaded Sentry model, or None when no model is loaded."""
+    if not (sentry and getattr(sentry, 'model', None)):
+        return None
+    return sentry.payload
+
+
+def classify_batch(features_list: List[Dict[str, Any]], simulate_vanguard: bool = False) -> List[Dict[str, Any]]:
+    """Classify many flows through the cascade: signature rules, destination index, one Sentry model call for the rest, then Vanguard one by one.
+
+    Returns one result dict per input, in order, shaped like classify_traffic's.
+    With `simulate_vanguard` escalated flows get the simulated Vanguard answer
+    instead of an LLM call (synthetic load must measure the pipeline, not the LLM).
+    """
+    if not features_list:
+        return []
+    start = time.perf_counter()
+    results: List[Optional[Dict[str, Any]]] = [_rule_result(f) for f in features_list]
+    pending = [i for i, r in enumerate(results) if r is None]
+    _record_tier("rules", len(features_list), len(features_list) - len(pending), start)
+
+    if pending and destination_index is not None:
+        start = time.perf_counter()
+        for i in pending:
+            results[i] = _index_result(features_list[i])
+        offered = len(pending)
+        pending = [i for i in pending if results[i] is None]
+        _record_tier("index", offered, offered - len(pending), start)
+    learned = list(pending)
+
+    if pending and sentry and getattr(sentry, 'model', None):
+        start = time.perf_counter()
+        try:
+            predictions = sentry.predict_scored([features_list[i] for i in pending])
+        except Exception:
+            predictions = None
+        if predictions is not None:
+            for i, prediction in zip(pending, predictions):
+                results[i] = _sentry_result(*prediction)
+        offered = len(pending)
+        pending = [i for i in pending if results[i] is None]
+        _record_tier("sentry", offered, offered - len(pending), start)
+
+    if pending:
+        start = time.perf_counter()
+        vanguard = _simulated_vanguard if simulate_vanguard else _vanguard_classify
+        for i in pending:
+            results[i] = vanguard(features_list[i])
+        _record_tier("vanguard", len(pending), len(pending), start)
+    for i in learned:
+        _learn(features_list[i], results[i])
+    return results
@@ -0,0 +1,274 @@
+"""Memory-mappable Sentry model artifact.
+
+A joblib payload has to be unpickled in full by every process that loads
+it, and unpickling an uploaded file runs whatever code it contains. The
+artifact is a plain data file instead:
+
+    b"SNTRYART" | uint32 header length | JSON header | arrays
+
+The header holds the format version, feature columns, class names, the
+objective and free-form metadata (metrics, generation, ...), plus the
+dtype, shape and offset of every array. The arrays are the LightGBM trees
+flattened into parallel node arrays and are 64-byte aligned, so loading is
+a header parse plus `np.memmap`: pages are read on first use and shared by
+every process mapping the same file.
+
+`ArtifactModel` evaluates the trees with NumPy: every (row, tree) pair
+walks one level per step and leaves the walk at its leaf, so a step only
+costs as much as the walks still going. Only numerical (`<=`) splits are
+supported; LightGBM's missing-value rules (None / Zero / NaN with a default
+direction) are reproduced. That beats LightGBM's per-call overhead for the
+single rows /classify sends, but not its compiled loop on big batches, so
+the artifact also embeds LightGBM's model text: batches of
+NATIVE_BATCH_ROWS or more are handed to a booster built from it on first
+use, when lightgbm is installed.
+"""
+
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"SNTRYART"
+FORMAT_VERSION = 1
+ALIGN = 64
+ARTIFACT_SUFFIX = ".sentry"
+# rows x trees node states evaluated at once; bounds memory for large batches
+_CHUNK_CELLS = 1 << 22
+# batches at least this large go through a native LightGBM booster when lightgbm is installed
+NATIVE_BATCH_ROWS = 256
+_ZERO = 1e-35  # LightGBM's kZeroThreshold
+_MISSING_TYPES = {"None": 0, "Zero": 1, "NaN": 2}
+
+
+def artifact_path(model_path: str) -> str:
+    """Artifact file that belongs to a pickle payload path (same stem)."""
+    return os.path.splitext(model_path)[0] + ARTIFACT_SUFFIX
+
+
+def is_artifact(path_or_bytes) -> bool:
+    if isinstance(path_or_bytes, (bytes, bytearray)):
+        return bytes(path_or_bytes[:len(MAGIC)]) == MAGIC
+    try:
+        with open(path_or_bytes, "rb") as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _flatten_trees(tree_info: List[Dict[str, Any]]) -> Tuple[Dict[str, np.ndarray], int]:
+    """Node arrays of all trees; returns (arrays, deepest leaf depth).
+
+    Nodes are laid out breadth-first with the two children of a split in
+    adjacent slots, so the next node is `child[node] + went_right`. A leaf
+    is its own child with an infinite threshold and never moves again.
+    """
+    feature, threshold, child, missing, default_left, value = [], [], [], [], [], []
+    roots = []
+    max_depth = 0
+
+    def slot() -> int:
+        feature.append(0)
+        threshold.append(np.inf)
+        child.append(len(child))
+        missing.append(0)
+        default_left.append(True)
+        value.append(0.0)
+        return len(feature) - 1
+
+    for tree in tree_info:
+        queue = [(tree["tree_structure"], slot(), 0)]
+        roots.append(queue[0][1])
+        while queue:
+            node, idx, depth = queue.pop(0)
+            if "leaf_value" in node or "split_index" not in node:
+                value[idx] = float(node.get("leaf_value", 0.0))
+                max_depth = max(max_depth, depth)
+                continue
+            if node.get("decision_type", "<=") != "<=":
+                raise ValueError(f"unsupported split type {node.get('decision_type')!r} (categorical features)")
+            feature[idx] = int(node["split_feature"])
+            threshold[idx] = float(node["threshold"])
+            missing[idx] = _MISSING_TYPES.get(node.get("missing_type", "None"), 0)
+            default_left[idx] = bool(node.get("default_left", True))
+            left, right = slot(), slot()
+            child[idx] = left
+            queue += [(node["left_child"], left, depth + 1), (node["right_child"], right, depth + 1)]
+    arrays = {
+        "feature": np.asarray(feature, dtype=np.int32),
+        "threshold": np.asarray(threshold, dtype=np.float64),
+        "child": np.asarray(child, dtype=np.int32),
+        "missing": np.asarray(missing, dtype=np.int8),
+        "default_left": np.asarray(default_left, dtype=np.bool_),
+        "value": np.asarray(value, dtype=np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    return arrays, max_depth
+
+
+def write_artifact(payload: Dict[str, Any], path: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+    """Export a {model, label_encoder, feature_columns} payload with a LightGBM model; written atomically.
+
+    Raises ValueError for models the format cannot represent (non-LightGBM,
+    categorical splits, unsupported objectives).
+    """
+    model = payload["model"]
+    booster = getattr(model, "booster_", None)
+    if booster is None:
+        raise ValueError(f"only LightGBM models can be exported, not {type(model).__name__}")
+    dump = booster.dump_model()
+    objective, *obj_params = str(dump.get("objective", "")).split()
+    if objective not in ("multiclass", "softmax", "binary"):
+        raise ValueError(f"unsupported objective {objective!r}")
+    arrays, max_depth = _flatten_trees(dump["tree_info"])
+    arrays["lightgbm_model"] = np.frombuffer(booster.model_to_string().encode(), dtype=np.uint8)
+    classes = np.asarray(getattr(model, "classes_", []))
+    le = payload.get("label_encoder")
+    names = [str(c) for c in (le.inverse_transform(classes.astype(int)) if le is not None else classes)]
+    feature_columns = list(payload.get("feature_columns") or dump.get("feature_names") or [])
+    meta = {k: v for k, v in payload.items() if k not in ("model", "label_encoder", "feature_columns")}
+    meta.update(metadata or {})
+
+    header: Dict[str, Any] = {
+        "version": FORMAT_VERSION, "feature_columns": feature_columns, "classes": names,
+        "objective": objective, "sigmoid": next((float(p.split(":")[1]) for p in obj_params if p.startswith("sigmoid:")), 1.0),
+        "num_class": int(dump.get("num_class", 1)), "num_trees": len(arrays["roots"]), "max_depth": max_depth,
+        "metadata": json.loads(json.dumps(meta, default=str)), "arrays": {},
+    }
+    offset = 0
+    for name, arr in arrays.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes
+    head = json.dumps(header).encode()
+    start = -(-(len(MAGIC) + 4 + len(head)) // ALIGN) * ALIGN
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC + struct.pack("<I", len(head)) + head)
+        for name, arr in arrays.items():
+            fh.seek(start + header["arrays"][name]["offset"])
+            fh.write(arr.tobytes())
+    os.replace(tmp, path)
+
+
+def read_header(buf) -> Tuple[Dict[str, Any], int]:
+    """(header, data start offset) of an artifact held in a bytes-like object or memmap."""
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a Sentry model artifact")
+    (n,) = struct.unpack("<I", bytes(buf[len(MAGIC):len(MAGIC) + 4]))
+    header = json.loads(bytes(buf[len(MAGIC) + 4:len(MAGIC) + 4 + n]))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"unsupported artifact version {header.get('version')}")
+    return header, -(-(len(MAGIC) + 4 + n) // ALIGN) * ALIGN
+
+
+class ArtifactModel:
+    """predict_proba/predict over a mapped artifact, shaped like the sklearn classifiers SentryWrapper uses.
+
+    `classes_` holds the class names, so no label encoder is needed.
+    """
+
+    def __init__(self, header: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.header = header
+        self.feature_columns: List[str] = header["feature_columns"]
+        self.classes_ = np.asarray(header["classes"], dtype=object)
+        self.num_class = max(1, header["num_class"])
+        self.max_depth = header["max_depth"]
+        for name, arr in arrays.items():
+            setattr(self, "_" + name, arr)
+        # without NaN inputs, only Zero-as-missing splits need the missing-value rules
+        self._has_missing_rules = bool((self._missing == 1).any())
+        self._booster = None
+
+    def _native(self):
+        """LightGBM booster for large batches, built once; None without lightgbm or embedded model text."""
+        if self._booster is None:
+            self._booster = False
+            text = getattr(self, "_lightgbm_model", None)
+            try:
+                import lightgbm  # type: ignore
+                if text is not None:
+                    self._booster = lightgbm.Booster(model_str=bytes(text).decode())
+            except Exception:
+                pass
+        return self._booster or None
+
+    @classmethod
+    def load(cls, path: str) -> "ArtifactModel":
+        return cls.from_buffer(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    @classmethod
+    def from_buffer(cls, buf: np.ndarray) -> "ArtifactModel":
+        """Model over an artifact held in a uint8 array (a memmap or bytes read into memory)."""
+        header, start = read_header(buf)
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            begin = start + spec["offset"]
+            arrays[name] = buf[begin:begin + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        return cls(header, arrays)
+
+    def raw_score(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        n, trees = len(X), len(self._roots)
+        out = np.empty(n * trees, dtype=np.float64)
+        step = max(1, _CHUNK_CELLS // max(1, trees))
+        for lo in range(0, n, step):
+            x = X[lo:lo + step]
+            # one cell per (row, tree); cells that reached a leaf drop out of the walk
+            flat = x.ravel()
+            base = np.repeat(np.arange(len(x), dtype=np.int64) * x.shape[1], trees)
+            node = np.tile(self._roots, len(x))
+            cell = np.arange(len(node))
+            plain = not self._has_missing_rules and not np.isnan(x).any()
+            for _ in range(self.max_depth):
+                nxt = self._child[node]
+                inner = nxt != node
+                if not inner.all():
+                    out[lo * trees + cell[~inner]] = self._value[node[~inner]]
+                    node, nxt, cell, base = node[inner], nxt[inner], cell[inner], base[inner]
+                    if not len(node):
+                        break
+                v = flat[base + self._feature[node]]
+                if plain:
+                    went_right = ~(v <= self._threshold[node])
+                else:
+                    nan = np.isnan(v)
+                    v = np.where(nan, 0.0, v)
+                    went_right = ~(v <= self._threshold[node])
+                    mtype = self._missing[node]
+                    is_missing = ((mtype == 2) & nan) | ((mtype == 1) & (nan | (np.abs(v) <= _ZERO)))
+                    went_right = np.where(is_missing, ~self._default_left[node], went_right)
+                node = nxt + went_right
+            out[lo * trees + cell] = self._value[node]
+        # trees are ordered iteration-major: tree t adds to class t % num_class
+        return out.reshape(n, -1, self.num_class).sum(axis=1)
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) >= NATIVE_BATCH_ROWS and X.ndim == 2 and self._native() is not None:
+            probs = np.asarray(self._native().predict(X))
+            return np.column_stack([1.0 - probs, probs]) if probs.ndim == 1 else probs
+        raw = self.raw_score(X)
+        if self.header["objective"] == "binary":
+            p = 1.0 / (1.0 + np.exp(-self.header["sigmoid"] * raw[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        raw = raw - raw.max(axis=1, keepdims=True)
+        e = np.exp(raw)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def load_payload(path: str) -> Dict[str, Any]:
+    """A SentryWrapper payload dict backed by the artifact at `path` (label_encoder is None)."""
+    model = ArtifactModel.load(path)
+    return {**model.header.get("metadata", {}), "model": model, "label_encoder": None,
+            "feature_columns": model.feature_columns, "artifact": path}
@@ -1,5 +1,9 @@
 #!/bin/bash
 
+# Static bootstrap layout. The orchestrator now generates this tree from
+# POLICY_DEFINITIONS and resizes it from measured load (see tc_config.py);
+# this script is kept for manual setups without the backend.
+
 # Define the network interface to apply QoS rules
 # Replace 'eth0' with your actual network interface (e.g., wlan0, enp0s3)
 IFACE="eth0"
@@ -0,0 +1,174 @@
+"""Generate and maintain the HTB tc configuration from POLICY_DEFINITIONS.
+
+The class layout (classid, priority, DSCP filters, default class) is derived
+from the orchestrator's POLICY_DEFINITIONS, so the policy map is the single
+source of truth instead of `setup_qos.sh`. Guaranteed rates are sized from the
+measured per-class demand. Each class gets a floor and the rest of the link
+is shared in proportion to observed load with some headroom; every class may
+borrow up to the full link (ceil).
+
+The first apply emits the full configuration as one `tc -batch` file. Later
+applies only emit `class change` lines for classes whose rate moved by more
+than `min_change_ratio`, so a steady link generates no tc traffic at all.
+"""
+
+import os
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# Static split from setup_qos.sh (of a 1000mbit link), used until demand is measured
+DEFAULT_WEIGHTS = {"1:10": 200, "1:20": 400, "1:30": 300, "1:40": 100}
+
+
+def qos_classes(policy_definitions: Dict[str, Dict[str, str]], default_app: str = "Browsing") -> List[Dict[str, object]]:
+    """Collapse POLICY_DEFINITIONS into one entry per tc class, ordered by classid.
+
+    Each entry: {"classid", "prio", "dscp_values", "metric_key", "apps", "default"}.
+    Lower classid minors are higher priority (1:10 before 1:40), matching the
+    original setup_qos.sh layout.
+    """
+    by_class: Dict[str, Dict[str, object]] = {}
+    default_tc = policy_definitions.get(default_app, {}).get("tc_class")
+    for app, pol in policy_definitions.items():
+        entry = by_class.setdefault(pol["tc_class"], {"classid": pol["tc_class"], "dscp_values": [], "metric_key": pol.get("metric_key"), "apps": []})
+        dscp = int(pol["dscp_value"], 16)
+        if dscp not in entry["dscp_values"]:
+            entry["dscp_values"].append(dscp)  # type: ignore[union-attr]
+        entry["apps"].append(app)  # type: ignore[union-attr]
+    ordered = sorted(by_class.values(), key=lambda c: int(str(c["classid"]).split(":")[1], 16))
+    for prio, entry in enumerate(ordered, start=1):
+        entry["prio"] = prio
+        entry["default"] = entry["classid"] == default_tc
+    return ordered
+
+
+def plan_rates(classes: List[Dict[str, object]], demand_bps: Dict[str, float], link_bps: float,
+               floor_ratio: float = 0.05, headroom: float = 1.25) -> Dict[str, int]:
+    """Guaranteed rate (bit/s) per classid from measured demand.
+
+    Every class keeps `floor_ratio` of the link. Each class then asks for
+    `demand * headroom`, capped so that the sum of guarantees never exceeds
+    the link. Capacity nobody asked for is split by the static default
+    weights. With no measurements at all this reduces to the static split.
+    """
+    ids = [str(c["classid"]) for c in classes]
+    floor = link_bps * floor_ratio
+    spare = max(0.0, link_bps - floor * len(ids))
+    wanted = {cid: max(0.0, float(demand_bps.get(cid, 0.0)) * headroom - floor) for cid in ids}
+    total_wanted = sum(wanted.values())
+    if total_wanted > spare:
+        granted = {cid: spare * w / total_wanted for cid, w in wanted.items()}
+    else:
+        granted = dict(wanted)
+        leftover = spare - total_wanted
+        weights = {cid: DEFAULT_WEIGHTS.get(cid, 1) for cid in ids}
+        wsum = float(sum(weights.values()))
+        for cid in ids:
+            granted[cid] += leftover * weights[cid] / wsum
+    # whole kbit, so tiny fluctuations do not show up as changes
+    return {cid: int((floor + granted[cid]) // 1000 * 1000) for cid in ids}
+
+
+def _kbit(bps: float) -> str:
+    return f"{int(bps // 1000)}kbit"
+
+
+class TcConfigurator:
+    """Renders the HTB tree and applies full or incremental `tc -batch` files."""
+
+    def __init__(self, policy_definitions: Dict[str, Dict[str, str]], iface: str = "eth0", link_bps: float = 1e9,
+                 dry_run: bool = True, batch_path: str = "sentinel_qos.tc", min_change_ratio: float = 0.10,
+                 tc_bin: str = "tc"):
+        self.classes = qos_classes(policy_definitions)
+        self.iface = iface
+        self.link_bps = link_bps
+        self.dry_run = dry_run
+        self.batch_path = batch_path
+        self.min_change_ratio = min_change_ratio
+        self.tc_bin = tc_bin
+        # rates currently configured on the link; empty until the first full apply
+        self.applied: Dict[str, int] = {}
+        self.stats = {"applies": 0, "full_applies": 0, "classes_changed": 0, "errors": 0, "last_apply_ms": 0.0}
+
+    def _class_line(self, verb: str, entry: Dict[str, object], rate_bps: int) -> str:
+        return (f"class {verb} dev {self.iface} parent 1:1 classid {entry['classid']} htb "
+                f"rate {_kbit(rate_bps)} ceil {_kbit(self.link_bps)} prio {entry['prio']}")
+
+    def render_full(self, rates: Dict[str, int]) -> str:
+        """Complete qdisc/class/filter configuration as `tc -batch` input."""
+        default = next((c for c in self.classes if c["default"]), self.classes[-1])
+        default_minor = str(default["classid"]).split(":")[1]
+        # Every line is a replace with explicit ids, so re-applying the full
+        # batch is idempotent and never duplicates classes or filters.
+        lines = [
+            f"qdisc replace dev {self.iface} root handle 1: htb default {default_minor}",
+            f"class replace dev {self.iface} parent 1: classid 1:1 htb rate {_kbit(self.link_bps)}",
+        ]
+        lines += [self._class_line("replace", c, rates[str(c["classid"])]) for c in self.classes]
+        # ip_tos is the whole TOS / traffic-class byte: DSCP sits in the top 6 bits
+        pref = 1
+        for c in self.classes:
+            for dscp in c["dscp_values"]:  # type: ignore[union-attr]
+                tos = dscp << 2
+                for proto, offset in (("ip", 0), ("ipv6", 100)):
+                    lines.append(f"filter replace dev {self.iface} parent 1: protocol {proto} prio {pref + offset} handle 1 "
+                                 f"flower ip_tos 0x{tos:02x}/0xfc classid {c['classid']}")
+                pref += 1
+        return "\n".join(lines) + "\n"
+
+    def render_diff(self, rates: Dict[str, int]) -> str:
+        """`class change` lines for classes whose rate moved more than min_change_ratio."""
+        lines = []
+        for c in self.classes:
+            cid = str(c["classid"])
+            old = self.applied.get(cid)
+            new = rates[cid]
+            if old is None or abs(new - old) > self.min_change_ratio * max(old, 1):
+                lines.append(self._class_line("change", c, new))
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def _run(self, text: str) -> None:
+        if self.dry_run:
+            with open(self.batch_path, "w") as fh:
+                fh.write(text)
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".tc", delete=False) as fh:
+            fh.write(text)
+            path = fh.name
+        try:
+            proc = subprocess.run([self.tc_bin, "-batch", path], capture_output=True, text=True, timeout=10)
+            if proc.returncode != 0:
+                raise RuntimeError(proc.stderr.strip() or f"tc exited with {proc.returncode}")
+        finally:
+            os.unlink(path)
+
+    def apply(self, demand_bps: Dict[str, float], full: bool = False) -> Optional[Dict[str, int]]:
+        """Size classes from demand (bit/s per classid) and apply the result.
+
+        Returns the new rates when anything was applied, otherwise None.
+        """
+        rates = plan_rates(self.classes, demand_bps, self.link_bps)
+        full = full or not self.applied
+        text = self.render_full(rates) if full else self.render_diff(rates)
+        if not text:
+            return None
+        start = time.perf_counter()
+        try:
+            self._run(text)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        changed = len(self.classes) if full else text.count("\n")
+        if full:
+            self.applied = dict(rates)
+        else:
+            for line in text.splitlines():
+                cid = line.split(" classid ")[1].split()[0]
+                self.applied[cid] = rates[cid]
+        self.stats["applies"] += 1
+        self.stats["full_applies"] += int(full)
+        self.stats["classes_changed"] += changed
+        self.stats["last_apply_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+        return dict(self.applied)
@@ -0,0 +1,307 @@
+"""Record /classify requests and replay them as a benchmark workload.
+
+Recording (enabled in the orchestrator with SENTINEL_RECORD_DIR):
+every /classify input is appended, with its arrival time, as one compact
+JSON array line to a gzip segment file. Each segment starts with a header
+line, {"format": N, "fields": [...]}, naming the record layout; segments
+without one are format 1 (no hostname). Records are buffered and written in
+blocks, and segments rotate by size or age. `record` only buffers; the
+caller runs `flush` off the request path (the orchestrator uses a worker
+thread, on a timer and whenever `record` reports a full buffer). A segment is
+written as `*.ndjson.gz.part` and renamed to `*.ndjson.gz` once closed, so a
+replay only sees complete segments. Segments left as `.part` by a process
+that died are recovered when a recorder is created on the directory: their
+complete records are rewritten to a closed segment.
+
+Replay:
+  python traffic_replay.py recordings/*.ndjson.gz [--speed 4] [--url http://host:8000] [--concurrency 64]
+
+Requests are issued at their recorded offsets divided by `--speed` (0 = as
+fast as possible), either in-process through the orchestrator's
+classify_flow (default) or over HTTP. The report gives throughput, how far
+behind schedule requests were sent, and latency percentiles per engine.
+"""
+
+import argparse
+import asyncio
+import glob
+import gzip
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# FlowFeatures fields in record order; a record line is [arrival_ts, *fields]
+RECORD_FIELDS = ("source_ip", "dest_ip", "dest_port", "packet_count", "avg_pkt_len", "duration_seconds",
+                 "bytes_total", "protocol", "hostname")
+RECORD_FORMAT = 2
+# layout of format 1 segments, which have no header line
+_LEGACY_FIELDS = RECORD_FIELDS[:8]
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+
+class SegmentRecorder:
+    """Appends (timestamp, FlowFeatures) records to rotating gzip segments in `directory`.
+
+    `record` may be called from one thread while `flush` runs in another.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = 64 << 20, max_segment_seconds: float = 300.0,
+                 flush_records: int = 256, flush_seconds: float = 1.0):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        os.makedirs(directory, exist_ok=True)
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._fh = None
+        self._path: Optional[str] = None
+        self._opened = 0.0
+        self._segment_bytes = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.stats = {"records": 0, "segments": 0, "bytes_raw": 0, "errors": 0, "recovered": 0}
+        self.recover()
+
+    def recover(self) -> None:
+        """Close segments left as `.part` by an earlier process, keeping their complete records."""
+        for part in sorted(glob.glob(os.path.join(self.directory, "*" + SEGMENT_SUFFIX + ".part"))):
+            lines: List[str] = []
+            try:
+                with gzip.open(part, "rt") as fh:
+                    for line in fh:
+                        lines.append(line)
+            except (OSError, EOFError):
+                pass  # truncated stream: keep what decompressed
+            if lines and not lines[-1].endswith("\n"):
+                lines.pop()
+            try:
+                if lines:
+                    with gzip.open(part + ".tmp", "wt", compresslevel=6) as out:
+                        out.writelines(lines)
+                    os.replace(part + ".tmp", part[:-len(".part")])
+                os.remove(part)
+            except OSError:
+                self.stats["errors"] += 1
+                continue
+            self.stats["recovered"] += 1
+
+    def record(self, features: Dict[str, Any], ts: Optional[float] = None) -> bool:
+        """Buffer one record; True when the buffer is full or old and `flush` is due."""
+        row = [round(ts if ts is not None else time.time(), 6)] + [features.get(f) for f in RECORD_FIELDS]
+        self._buffer.append(json.dumps(row, separators=(",", ":")))
+        self.stats["records"] += 1
+        return len(self._buffer) >= self.flush_records or time.monotonic() - self._last_flush >= self.flush_seconds
+
+    def _open(self) -> None:
+        self._seq += 1
+        name = time.strftime("classify-%Y%m%dT%H%M%S", time.gmtime()) + f"-{self._seq:04d}{SEGMENT_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._fh = gzip.open(self._path + ".part", "wt", compresslevel=6)
+        self._fh.write(json.dumps({"format": RECORD_FORMAT, "fields": list(RECORD_FIELDS)}, separators=(",", ":")) + "\n")
+        self._opened = time.monotonic()
+        self._segment_bytes = 0
+        self.stats["segments"] += 1
+
+    def _close_segment(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            os.replace(self._path + ".part", self._path)
+            self._fh = None
+
+    def flush(self) -> None:
+        """Write buffered records, rotating the segment first if it is full or old. Blocking (gzip and file I/O)."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        # swap first: records appended meanwhile go to the new buffer
+        buffer, self._buffer = self._buffer, []
+        text = "\n".join(buffer) + "\n"
+        try:
+            if self._fh is not None and (self._segment_bytes >= self.max_segment_bytes
+                                         or time.monotonic() - self._opened >= self.max_segment_seconds):
+                self._close_segment()
+            if self._fh is None:
+                self._open()
+            self._fh.write(text)
+        except OSError:
+            self.stats["errors"] += 1
+            return
+        self._segment_bytes += len(text)
+        self.stats["bytes_raw"] += len(text)
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._close_segment()
+
+
+def read_segments(paths: Iterable[str]) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """(arrival_ts, features) from segment files, in file-name (i.e. recording) order.
+
+    Raises ValueError on a segment written in a newer format than this reader knows.
+    """
+    for path in sorted(paths):
+        fields = _LEGACY_FIELDS
+        with gzip.open(path, "rt") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if isinstance(row, dict):
+                    if int(row.get("format", 0)) > RECORD_FORMAT:
+                        raise ValueError(f"{path}: segment format {row.get('format')} is newer than {RECORD_FORMAT}")
+                    fields = tuple(row["fields"])
+                    continue
+                yield float(row[0]), dict(zip(fields, row[1:]))
+
+
+Sender = Callable[[Dict[str, Any]], Awaitable[str]]
+
+
+def latency_report(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """count and p50/p90/p99/max (ms) per key of `samples` (latencies in seconds)."""
+    report = {}
+    for key, values in sorted(samples.items()):
+        arr = np.asarray(values) * 1000.0
+        p50, p90, p99 = np.percentile(arr, [50, 90, 99]).tolist()
+        report[key] = {"count": len(values), "p50_ms": round(p50, 3), "p90_ms": round(p90, 3),
+                       "p99_ms": round(p99, 3), "max_ms": round(float(arr.max()), 3)}
+    return report
+
+
+async def replay(records: Iterable[Tuple[float, Dict[str, Any]]], send: Sender, speed: float = 1.0,
+                 concurrency: int = 64) -> Dict[str, Any]:
+    """Issue every record through `send` on the recorded schedule scaled by `speed`.
+
+    `send` returns the engine that answered. At most `concurrency` requests
+    are outstanding; when that limit is hit, sending falls behind schedule
+    and the lag percentiles show it.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    latencies: Dict[str, List[float]] = {}
+    lags: List[float] = []
+    errors: Dict[str, int] = {}
+    tasks = []
+
+    async def one(features: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        try:
+            engine = await send(features)
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return
+        finally:
+            sem.release()
+        latencies.setdefault(engine or "unknown", []).append(time.perf_counter() - start)
+
+    wall0 = time.perf_counter()
+    t0 = None
+    for ts, features in records:
+        if t0 is None:
+            t0 = ts
+        due = wall0 + (ts - t0) / speed if speed > 0 else wall0
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await sem.acquire()
+        lags.append(max(0.0, time.perf_counter() - due))
+        tasks.append(asyncio.ensure_future(one(features)))
+        # drop finished tasks so a long replay does not hold them all
+        if len(tasks) >= 4 * concurrency:
+            tasks = [t for t in tasks if not t.done()]
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - wall0
+    completed = sum(len(v) for v in latencies.values())
+    all_latencies = [v for values in latencies.values() for v in values]
+    return {
+        "requests": len(lags),
+        "completed": completed,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 1) if elapsed > 0 else 0.0,
+        "speed": speed,
+        "latency": {**latency_report(latencies), **latency_report({"all": all_latencies} if all_latencies else {})},
+        "send_lag": latency_report({"schedule": lags}).get("schedule", {}),
+    }
+
+
+def in_process_sender() -> Sender:
+    """Calls the orchestrator's classify_flow directly (no HTTP)."""
+    from backend.orchestrator import FlowFeatures, classify_flow
+    from sentinel_ai_classifier import init_sentry
+    init_sentry()
+
+    async def send(features: Dict[str, Any]) -> str:
+        result = await classify_flow(FlowFeatures(**features))
+        return str(result.engine)
+    return send
+
+
+def http_sender(url: str, concurrency: int) -> Sender:
+    """POSTs to `url`/classify from a thread pool, one keep-alive connection per thread."""
+    parsed = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    path = parsed.path.rstrip("/") + "/classify"
+    local = threading.local()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def post(features: Dict[str, Any]) -> str:
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = conn_cls(parsed.netloc, timeout=30)
+        try:
+            conn.request("POST", path, body=json.dumps(features), headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            local.conn = None
+            conn.close()
+            raise
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
+        return str(json.loads(body).get("engine"))
+
+    async def send(features: Dict[str, Any]) -> str:
+        return await asyncio.get_event_loop().run_in_executor(pool, post, features)
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded /classify traffic and report latency per engine")
+    parser.add_argument("segments", nargs="+", help="Segment files or directories of *.ndjson.gz segments")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (0 = as fast as possible)")
+    parser.add_argument("--url", help="Orchestrator base URL; default replays in-process")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum outstanding requests")
+    parser.add_argument("--limit", type=int, help="Replay only the first N records")
+    args = parser.parse_args()
+
+    paths = []
+    for p in args.segments:
+        paths += sorted(glob.glob(os.path.join(p, "*" + SEGMENT_SUFFIX))) if os.path.isdir(p) else [p]
+    records: Iterable[Tuple[float, Dict[str, Any]]] = read_segments(paths)
+    if args.limit:
+        records = (r for i, r in zip(range(args.limit), records))
+
+    async def run():
+        send = http_sender(args.url, args.concurrency) if args.url else in_process_sender()
+        return await replay(records, send, args.speed, args.concurrency)
+
+    print(json.dumps(asyncio.run(run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,51 @@
 """Train a LightGBM Sentry model from a CSV of precomputed features.
 
 Usage:
-  python train_sentry.py --csv training_data.csv --out sentry_model.pkl [--plot]
+  python train_sentry.py --csv training_data.csv --out sentry_model.pkl [--plot] [--sha256 HEX] [--no-cache]
+  python train_sentry.py --csv training_data.csv --search --latency-budget-us 150 [--candidates 24] [--workers N]
+  python train_sentry.py --csv training_data.csv --pipeline features.json
+  python train_sentry.py --csv training_data.csv --no-ood --signatures signatures.json
 
-The script saves a payload with keys: model, label_encoder, feature_columns.
+--csv may be an HTTP(S) URL; it is streamed to data/cache/datasets (resuming an
+interrupted download). The CSV is parsed in chunks with downcast dtypes and
+cached as memory-mapped columns under data/cache/features, keyed by content
+hash, so retraining on the same data skips CSV parsing. SENTINEL_CACHE_DIR
+moves both.
+
+Model inputs come from a feature pipeline (see feature_pipeline.py): the
+default one (raw flow fields plus rates, log transforms and port buckets)
+when the CSV has the FlowFeatures columns, the CSV's numeric columns as they
+are otherwise, or the spec given with --pipeline. The pipeline is saved in
+the payload and applied by SentryWrapper at serving time.
+
+--search replaces the fixed model with a parallel search over tree count,
+depth, leaves and feature subsets (see model_search.py). It keeps the most
+accurate candidate whose measured single-row inference latency fits
+--latency-budget-us, prints the accuracy/latency Pareto front and writes
+every candidate to search_report.json.
+
+The cascade's signature rules (see cascade.py; the defaults, or the JSON
+list given with --signatures) are calibrated on the CSV: each signature's
+confidence becomes its measured precision, and the calibrated list is saved
+in the payload for the serving rule tier.
+
+Unless --no-ood is given, an out-of-distribution scorer (see ood_detector.py)
+is fitted on the model features and calibrated on the test split. At serving
+time, low-confidence flows then escalate to Vanguard only when they are
+novel.
+
+The script saves a payload with keys: model, label_encoder, feature_columns,
+feature_pipeline, signatures, ood (and search, the selected candidate's metrics, after --search). Next to it,
+<out stem>.sentry is written: the same model as a memory-mappable artifact
+(see sentry_artifact.py), which SentryWrapper loads in preference to the
+pickle.
 """
 
 import argparse
+import json
 import sys
 import os
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 missing = []
 try:
@@ -55,65 +91,99 @@ if missing:
     print('Install them with: pip install pandas scikit-learn lightgbm joblib')
     sys.exit(2)
 
-
-def _download_if_url(path_or_url: str) -> str:
-    """If path_or_url is an HTTP(S) URL, download and cache it locally and return the local path."""
-    if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
-        cache_dir = os.path.join(".cache", "datasets")
-        os.makedirs(cache_dir, exist_ok=True)
-        fname = os.path.basename(path_or_url)
-        local_path = os.path.join(cache_dir, fname)
-        if not os.path.exists(local_path):
-            try:
-                import requests
-                resp = requests.get(path_or_url)
-                resp.raise_for_status()
-                with open(local_path, "wb") as f:
-                    f.write(resp.content)
-                print(f"Downloaded dataset to {local_path}")
-            except Exception as e:
-                print(f"ERROR: failed to download {path_or_url}: {e}")
-                raise
-        else:
-            print(f"Using cached dataset: {local_path}")
-        return local_path
-    return path_or_url
+from training_data import FEATURE_CACHE_DIR, SENTRY_LGBM_PARAMS, SPLIT_SEED, TEST_FRACTION, download, is_url, load_training_data  # noqa: E402  (needs numpy/pandas, checked above)
+from sentry_artifact import artifact_path, write_artifact  # noqa: E402
+from feature_pipeline import FeaturePipeline  # noqa: E402
+from ood_detector import OODScorer  # noqa: E402
+from cascade import DEFAULT_SIGNATURES, calibrate_signatures  # noqa: E402
 
 
-def train_sentry_model(csv_path: str = 'training_data.csv', out_path: str = 'sentry_model.pkl', do_plot: bool = False):
+def train_sentry_model(csv_path: str = 'training_data.csv', out_path: str = 'sentry_model.pkl', do_plot: bool = False,
+                       sha256: Optional[str] = None, use_cache: bool = True, search: bool = False,
+                       latency_budget_us: Optional[float] = None, search_candidates: int = 24,
+                       search_workers: Optional[int] = None, pipeline_spec: Optional[str] = None, fit_ood: bool = True,
+                       signatures_path: Optional[str] = None):
     # support passing a Hugging Face or HTTP URL for the CSV
-    try:
-        csv_path = _download_if_url(csv_path)
-    except Exception:
-        return
+    if is_url(csv_path):
+        try:
+            csv_path = download(csv_path, sha256=sha256)
+        except Exception as e:
+            print(f"ERROR: failed to download {csv_path}: {e}")
+            return
 
     if not os.path.exists(csv_path):
         print(f"ERROR: CSV file not found: {csv_path}")
         return
 
-    df = pd.read_csv(csv_path)
-    if 'label' not in df.columns:
-        print("ERROR: 'label' column not found in CSV")
+    try:
+        features, y_enc, classes = load_training_data(csv_path, cache_dir=FEATURE_CACHE_DIR if use_cache else None)
+    except (KeyError, ValueError) as e:
+        print(f"ERROR: {e}")
         return
 
-    X = df.drop(columns=['label'])
-    y = df['label'].astype(str)
-
     # numeric features only
-    X = X.select_dtypes(include=['number']).fillna(0)
-    if X.shape[1] == 0:
+    if not features:
         print('ERROR: no numeric feature columns found in CSV')
         return
+    try:
+        if pipeline_spec:
+            with open(pipeline_spec) as fh:
+                pipeline = FeaturePipeline.from_dict(json.load(fh))
+        else:
+            pipeline = FeaturePipeline.for_columns(list(features))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: invalid feature pipeline: {e}")
+        return
+    absent = [c for c in pipeline.inputs if c not in features]
+    if absent:
+        print(f"ERROR: feature pipeline needs columns missing from the CSV: {', '.join(absent)}")
+        return
+    foreign = pipeline.foreign_inputs()
+    if foreign:
+        print(f"WARNING: model inputs {', '.join(foreign)} are not FlowFeatures fields; "
+              "the orchestrator will refuse to serve this model")
+    X = pd.DataFrame(pipeline.transform_columns(features), columns=pipeline.output_columns)
+    print(f"Feature pipeline: {len(pipeline.inputs)} raw columns -> {len(pipeline.output_columns)} model features")
 
+    # codes from load_training_data are indices into the sorted label names, as LabelEncoder assigns them
     le = LabelEncoder()
-    y_enc = le.fit_transform(y)
+    le.fit(classes)
+    y_enc = np.asarray(y_enc)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y_enc, test_size=0.2, random_state=42, stratify=y_enc)
+    # the same split as training_data.test_rows, which continual retraining uses as its base holdout
+    X_train, X_test, y_train, y_test = train_test_split(X, y_enc, test_size=TEST_FRACTION, random_state=SPLIT_SEED, stratify=y_enc)
 
-    clf = LGBMClassifier(n_estimators=100, max_depth=6, learning_rate=0.1)
-    clf.fit(X_train, y_train)
+    selected = None
+    if search:
+        from model_search import search as search_models
+        result = search_models(X_train, y_train, X_test, y_test, latency_budget_us=latency_budget_us,
+                               max_candidates=search_candidates, workers=search_workers)
+        selected = {k: v for k, v in result['selected'].items() if k != 'id'}
+        print(f"Searched {len(result['results'])} candidates; Pareto front (validation accuracy vs serving latency):")
+        for r in result['pareto']:
+            print(f"  val_acc={r['accuracy']:.4f} single={r['single_row_us']:.1f}us batch={r['batch_per_flow_us']:.2f}us/flow "
+                  f"trees={r['best_iteration']} depth={r['max_depth']} leaves={r['num_leaves']} features={len(r['features'])}")
+        if not result['within_budget']:
+            print(f"Warning: no candidate meets the {latency_budget_us}us budget; using the fastest")
+        print(f"Selected: val_acc={selected['accuracy']:.4f} test_acc={selected['test_accuracy']:.4f} single={selected['single_row_us']:.1f}us "
+              f"trees={selected['best_iteration']} depth={selected['max_depth']} leaves={selected['num_leaves']} "
+              f"features={selected['features']}")
+        try:
+            with open('search_report.json', 'w') as fh:
+                json.dump({'latency_budget_us': latency_budget_us, 'selected': selected,
+                           'pareto': result['pareto'], 'results': result['results']}, fh, indent=2)
+            print("Saved search report to 'search_report.json'")
+        except OSError as e:
+            print('Warning: failed to save search report:', e)
+        clf = result['model']
+        X, X_test = X[selected['features']], X_test[selected['features']]
+        pipeline = pipeline.select(selected['features'])
+    else:
+        clf = LGBMClassifier(**SENTRY_LGBM_PARAMS)
+        clf.fit(X_train, y_train)
 
     # Evaluate
+    metrics = {}
     try:
         y_pred = clf.predict(X_test)
         # coerce to numpy 1-D arrays to avoid sparse/matrix typing issues
@@ -133,6 +203,7 @@ def train_sentry_model(csv_path: str = 'training_data.csv', out_path: str = 'sen
 
         acc = accuracy_score(y_test_np, y_pred_np)
         print(f"Model accuracy on the test set: {acc:.4f}")
+        metrics['accuracy'] = round(float(acc), 5)
 
         try:
             print('\nClassification report:')
@@ -159,12 +230,40 @@ def train_sentry_model(csv_path: str = 'training_data.csv', out_path: str = 'sen
         print('Warning: evaluation failed:', e)
 
     # Save payload (model + encoder + feature list)
-    payload = {'model': clf, 'label_encoder': le, 'feature_columns': list(X.columns)}
+    payload = {'model': clf, 'label_encoder': le, 'feature_columns': list(X.columns), 'feature_pipeline': pipeline.to_dict()}
+    try:
+        if signatures_path:
+            with open(signatures_path) as fh:
+                signatures = json.load(fh)
+        else:
+            signatures = DEFAULT_SIGNATURES
+        payload['signatures'] = calibrate_signatures(signatures, features, le.inverse_transform(y_enc))
+        print('Signature rules (precision on the CSV):')
+        for sig in payload['signatures']:
+            note = f"{sig['confidence']:.4f} over {sig['support']} flows" if sig['calibrated'] else f"{sig['confidence']} (prior, not calibrated)"
+            print(f"  {sig['id']:<16} -> {sig['app_type']:<18} {note}")
+    except (OSError, ValueError, KeyError) as e:
+        print('Warning: failed to calibrate signature rules:', e)
+    if fit_ood:
+        try:
+            ood = OODScorer.fit(X_train[list(X.columns)], y_train, X_calibration=X_test)
+            payload['ood'] = ood.to_dict()
+            novel = float((ood.novelty(X_test) >= 1.0).mean())
+            print(f"OOD scorer: calibration radius {ood.radius:.3f}, {novel:.2%} of test flows flagged novel")
+        except (ValueError, np.linalg.LinAlgError) as e:
+            print('Warning: failed to fit OOD scorer:', e)
+    if selected is not None:
+        payload['search'] = selected
     try:
         joblib.dump(payload, out_path)
         print(f"Saved Sentry model payload to {out_path}")
     except Exception as e:
         print('ERROR: failed to save model payload:', e)
+    try:
+        write_artifact(payload, artifact_path(out_path), metadata={'metrics': metrics})
+        print(f"Saved memory-mappable model artifact to {artifact_path(out_path)}")
+    except (OSError, ValueError) as e:
+        print('Warning: failed to write model artifact:', e)
 
     # also save encoder separately for convenience
     try:
@@ -192,9 +291,21 @@ def main():
     parser.add_argument('--csv', default='training_data.csv', help='Path to CSV with features and label')
     parser.add_argument('--out', default='sentry_model.pkl', help='Output joblib payload path')
     parser.add_argument('--plot', action='store_true', help='Save confusion matrix image')
+    parser.add_argument('--sha256', help='Expected SHA-256 of the CSV when --csv is a URL')
+    parser.add_argument('--no-cache', action='store_true', help='Always parse the CSV instead of using the columnar cache')
+    parser.add_argument('--search', action='store_true', help='Search hyperparameters and feature subsets in parallel')
+    parser.add_argument('--latency-budget-us', type=float, help='Per-flow single-row inference budget for --search (microseconds)')
+    parser.add_argument('--candidates', type=int, default=24, help='Number of --search candidates')
+    parser.add_argument('--workers', type=int, help='Worker processes for --search (default: one per CPU)')
+    parser.add_argument('--pipeline', help='JSON feature pipeline spec (default: chosen from the CSV columns)')
+    parser.add_argument('--signatures', help='JSON list of cascade signature rules to calibrate (default: the built-in ones)')
+    parser.add_argument('--no-ood', action='store_true', help='Do not fit the out-of-distribution scorer (escalate on confidence alone)')
     args = parser.parse_args()
 
-    train_sentry_model(csv_path=args.csv, out_path=args.out, do_plot=args.plot)
+    train_sentry_model(csv_path=args.csv, out_path=args.out, do_plot=args.plot, sha256=args.sha256, use_cache=not args.no_cache,
+                       search=args.search, latency_budget_us=args.latency_budget_us, search_candidates=args.candidates,
+                       search_workers=args.workers, pipeline_spec=args.pipeline, fit_ood=not args.no_ood,
+                       signatures_path=args.signatures)
 
 
 if __name__ == '__main__':
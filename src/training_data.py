@@ -0,0 +1,234 @@
+"""Training data loading for train_sentry.py: streaming download, chunked CSV, columnar cache.
+
+Large flow exports do not fit through `requests.get(...).content` or a
+default `pd.read_csv`, so:
+
+- `download` streams a URL to disk in blocks, resumes an interrupted
+  download from its `.part` file with an HTTP Range request, and verifies
+  the SHA-256 when one is given.
+- `read_csv_chunked` parses the CSV in chunks. It keeps the numeric feature
+  columns downcast (float32, smallest integer type) and the label as
+  category codes.
+- `load_training_data` converts a CSV once into a cache directory of
+  `.npy` columns, keyed by the SHA-256 of the CSV's content, the label
+  column and the cache format version. Later runs memory-map those columns
+  instead of parsing text.
+
+`test_rows` is train_sentry's stratified train/test split of those rows.
+Continual retraining uses it as its base holdout, so that holdout is data
+the serving model never trained on.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pandas as pd  # type: ignore
+    HAS_PANDAS = True
+except Exception:  # pragma: no cover - optional runtime
+    pd = None
+    HAS_PANDAS = False
+
+BLOCK_BYTES = 1 << 20
+CACHE_VERSION = 1
+# downloads and columnar caches; the default is git-ignored
+CACHE_DIR = os.environ.get("SENTINEL_CACHE_DIR", os.path.join("data", "cache"))
+DATASET_CACHE_DIR = os.path.join(CACHE_DIR, "datasets")
+FEATURE_CACHE_DIR = os.path.join(CACHE_DIR, "features")
+# LightGBM settings of the Sentry model, shared by train_sentry and continual retraining
+SENTRY_LGBM_PARAMS = {"n_estimators": 100, "max_depth": 6, "learning_rate": 0.1}
+# train_sentry's test split; see test_rows
+TEST_FRACTION = 0.2
+SPLIT_SEED = 42
+
+
+def test_rows(codes) -> np.ndarray:
+    """Boolean mask of the rows train_sentry holds out for testing (stratified on the label codes).
+
+    The split depends only on the row count, the labels and the seed, so it
+    is the same whether train_sentry splits the feature frame or this mask
+    is computed again later from the same CSV.
+    """
+    from sklearn.model_selection import train_test_split  # type: ignore
+    codes = np.asarray(codes)
+    idx = np.arange(len(codes))
+    try:
+        _, test = train_test_split(idx, test_size=TEST_FRACTION, random_state=SPLIT_SEED, stratify=codes)
+    except ValueError:  # a class with a single row cannot be stratified
+        _, test = train_test_split(idx, test_size=TEST_FRACTION, random_state=SPLIT_SEED)
+    mask = np.zeros(len(codes), dtype=bool)
+    mask[test] = True
+    return mask
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(BLOCK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_url(path_or_url: str) -> bool:
+    return path_or_url.startswith("http://") or path_or_url.startswith("https://")
+
+
+def download(url: str, cache_dir: str = DATASET_CACHE_DIR, sha256: Optional[str] = None,
+             timeout: float = 60.0) -> str:
+    """Stream `url` into `cache_dir` and return the local path.
+
+    An existing complete file is reused (after checking `sha256` if given).
+    A leftover `<name>.part` from an interrupted run is resumed with a Range
+    request; a server that ignores Range restarts the download from zero. On
+    a checksum mismatch the file is deleted and ValueError is raised.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    local_path = os.path.join(cache_dir, os.path.basename(url.split("?", 1)[0]) or "dataset.csv")
+    if os.path.exists(local_path):
+        if sha256 and file_sha256(local_path) != sha256.lower():
+            os.remove(local_path)
+        else:
+            print(f"Using cached dataset: {local_path}")
+            return local_path
+
+    part = local_path + ".part"
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    req = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        if offset and resp.status != 206:
+            offset = 0  # Range not honoured: start over
+        with open(part, "ab" if offset else "wb") as fh:
+            shutil.copyfileobj(resp, fh, BLOCK_BYTES)
+    if offset:
+        print(f"Resumed download at byte {offset}")
+    if sha256:
+        actual = file_sha256(part)
+        if actual != sha256.lower():
+            os.remove(part)
+            raise ValueError(f"checksum mismatch for {url}: expected {sha256}, got {actual}")
+    os.replace(part, local_path)
+    print(f"Downloaded dataset to {local_path}")
+    return local_path
+
+
+def _downcast(col) -> np.ndarray:
+    values = col.to_numpy()
+    if values.dtype.kind == "f":
+        return values.astype(np.float32)
+    if values.dtype.kind in "iu" and len(values):
+        return pd.to_numeric(col, downcast="integer" if values.min() < 0 else "unsigned").to_numpy()
+    return values
+
+
+def read_csv_chunked(csv_path: str, label: str = "label", chunksize: int = 500_000) -> Tuple[Dict[str, np.ndarray], np.ndarray, List[str]]:
+    """Parse a feature CSV chunk by chunk.
+
+    Returns ({feature column: downcast array}, label codes, sorted label
+    names); codes index into the names, i.e. they match a LabelEncoder fitted
+    on the same labels. Numeric columns are those numeric in the first chunk;
+    missing values become 0, as in the original full-file read.
+    """
+    columns: Dict[str, List[np.ndarray]] = {}
+    labels: List[Tuple[np.ndarray, List[str]]] = []  # per chunk: (codes, that chunk's categories)
+    numeric: Optional[List[str]] = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        if label not in chunk.columns:
+            raise KeyError(f"'{label}' column not found in CSV")
+        if numeric is None:
+            numeric = [c for c in chunk.drop(columns=[label]).select_dtypes(include=["number"]).columns]
+            columns = {c: [] for c in numeric}
+        for c in numeric:
+            col = pd.to_numeric(chunk[c], errors="coerce")
+            columns[c].append(_downcast(col.fillna(0) if col.hasnans else col))
+        cat = chunk[label].astype(str).astype("category")
+        labels.append((cat.cat.codes.to_numpy(), [str(x) for x in cat.cat.categories]))
+    if numeric is None:
+        raise ValueError(f"no rows in {csv_path}")
+    # chunks may have downcast differently; join at the widest type any chunk needed
+    features = {c: np.concatenate(parts).astype(np.result_type(*parts), copy=False) for c, parts in columns.items()}
+    names = sorted({name for _, cats in labels for name in cats})
+    index = {name: i for i, name in enumerate(names)}
+    codes = np.concatenate([np.array([index[c] for c in cats], dtype=np.int32)[chunk_codes] for chunk_codes, cats in labels])
+    return features, codes, names
+
+
+def _write_cache(path: str, features: Dict[str, np.ndarray], codes: np.ndarray, names: List[str], source: str) -> None:
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for i, (name, values) in enumerate(features.items()):
+        np.save(os.path.join(tmp, f"f{i}.npy"), values)
+    np.save(os.path.join(tmp, "label.npy"), codes)
+    meta = {"version": CACHE_VERSION, "source": source, "rows": int(len(codes)),
+            "feature_columns": list(features), "labels": names}
+    with open(os.path.join(tmp, "meta.json"), "w") as fh:
+        json.dump(meta, fh)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def _read_cache(path: str) -> Tuple[Dict[str, np.ndarray], np.ndarray, List[str]]:
+    with open(os.path.join(path, "meta.json")) as fh:
+        meta = json.load(fh)
+    if meta.get("version") != CACHE_VERSION:
+        raise ValueError("stale cache version")
+    features = {name: np.load(os.path.join(path, f"f{i}.npy"), mmap_mode="r")
+                for i, name in enumerate(meta["feature_columns"])}
+    return features, np.load(os.path.join(path, "label.npy"), mmap_mode="r"), meta["labels"]
+
+
+def _content_key(csv_path: str, cache_dir: str) -> str:
+    """SHA-256 of the CSV, remembered per (path, size, mtime) so an unchanged file is hashed once."""
+    st = os.stat(csv_path)
+    stamp = f"{os.path.abspath(csv_path)}:{st.st_size}:{st.st_mtime_ns}"
+    index_path = os.path.join(cache_dir, "digests.json")
+    try:
+        with open(index_path) as fh:
+            index = json.load(fh)
+    except (OSError, ValueError):
+        index = {}
+    if stamp not in index:
+        index[stamp] = file_sha256(csv_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(index_path + ".tmp", "w") as fh:
+            json.dump(index, fh)
+        os.replace(index_path + ".tmp", index_path)
+    return index[stamp]
+
+
+def _cache_name(digest: str, label: str) -> str:
+    """Cache directory name for a CSV digest parsed with `label` as the target column."""
+    return hashlib.sha256(f"{CACHE_VERSION}\0{label}\0{digest}".encode()).hexdigest()
+
+
+def load_training_data(csv_path: str, label: str = "label", cache_dir: Optional[str] = FEATURE_CACHE_DIR,
+                       chunksize: int = 500_000) -> Tuple[Dict[str, np.ndarray], np.ndarray, List[str]]:
+    """read_csv_chunked output for `csv_path`, served from the columnar cache when possible.
+
+    The cache key is the CSV's SHA-256 plus the label column and
+    CACHE_VERSION, so a renamed copy hits the cache while an edited file, a
+    different label or a new cache format misses it. The digest itself is remembered per path, size
+    and mtime, so an unchanged file is only hashed once. Cached columns are
+    memory-mapped read-only. Pass cache_dir=None to always parse.
+    """
+    if cache_dir is None:
+        return read_csv_chunked(csv_path, label, chunksize)
+    digest = _content_key(csv_path, cache_dir)
+    path = os.path.join(cache_dir, _cache_name(digest, label))
+    if os.path.isdir(path):
+        try:
+            out = _read_cache(path)
+            print(f"Loaded {len(out[1])} cached rows from {path}")
+            return out
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable or stale: rebuild below
+    features, codes, names = read_csv_chunked(csv_path, label, chunksize)
+    _write_cache(path, features, codes, names, os.path.abspath(csv_path))
+    print(f"Cached {len(codes)} rows as columns in {path}")
+    return features, codes, names
@@ -0,0 +1,140 @@
+"""Byte-level builders for capture and flow-export fixtures used by the parser tests."""
+
+import ipaddress
+import struct
+from typing import Iterable, List, Sequence, Tuple
+
+
+def ip_bytes(address: str) -> bytes:
+    return ipaddress.ip_address(address).packed
+
+
+def _checksum(header: bytes) -> int:
+    s = sum(struct.unpack(f"!{len(header) // 2}H", header))
+    s = (s >> 16) + (s & 0xFFFF)
+    return ~(s + (s >> 16)) & 0xFFFF
+
+
+def ipv4(src: str, dst: str, proto: int, payload: bytes) -> bytes:
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, 0, 64, proto, 0, ip_bytes(src), ip_bytes(dst))
+    return header[:10] + struct.pack("!H", _checksum(header)) + header[12:] + payload
+
+
+def ipv6(src: str, dst: str, proto: int, payload: bytes) -> bytes:
+    return struct.pack("!IHBB16s16s", 6 << 28, len(payload), proto, 64, ip_bytes(src), ip_bytes(dst)) + payload
+
+
+def ethernet(packet: bytes) -> bytes:
+    ethertype = 0x86DD if packet[0] >> 4 == 6 else 0x0800
+    return b"\x02\x00\x00\x00\x00\x01\x02\x00\x00\x00\x00\x02" + struct.pack("!H", ethertype) + packet
+
+
+def tcp(sport: int, dport: int, payload: bytes = b"") -> bytes:
+    return struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 5 << 4, 0x18, 65535, 0, 0) + payload
+
+
+def udp(sport: int, dport: int, payload: bytes = b"") -> bytes:
+    return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+
+
+def client_hello(server_name: str) -> bytes:
+    """A TLS 1.2-framed ClientHello record with a server_name and one other extension."""
+    name = server_name.encode()
+    sni = struct.pack("!HBH", len(name) + 3, 0, len(name)) + name
+    extensions = struct.pack("!HH", 10, 2) + b"\x00\x00" + struct.pack("!HH", 0, len(sni)) + sni
+    body = (b"\x03\x03" + b"\x11" * 32 + b"\x00" + struct.pack("!H", 2) + b"\x13\x01" + b"\x01\x00"
+            + struct.pack("!H", len(extensions)) + extensions)
+    handshake = b"\x01" + len(body).to_bytes(3, "big") + body
+    return b"\x16\x03\x01" + struct.pack("!H", len(handshake)) + handshake
+
+
+def _dns_name(name: str) -> bytes:
+    return b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\x00"
+
+
+def dns_response(question: str, answers: Sequence[Tuple[str, int]], cname: str = "") -> bytes:
+    """A DNS response for `question` with A/AAAA `answers` of (address, ttl).
+
+    With `cname`, the question first resolves to that name and the addresses
+    are answers for it, as a CDN-fronted lookup would return.
+    """
+    records = b""
+    owner = b"\xc0\x0c"  # compression pointer to the question name
+    if cname:
+        target = _dns_name(cname)
+        records += owner + struct.pack("!HHIH", 5, 1, 60, len(target)) + target
+        owner = target
+    for address, ttl in answers:
+        raw = ip_bytes(address)
+        records += owner + struct.pack("!HHIH", 1 if len(raw) == 4 else 28, 1, ttl, len(raw)) + raw
+    header = struct.pack("!HHHHHH", 0x1234, 0x8180, 1, len(answers) + bool(cname), 0, 0)
+    return header + _dns_name(question) + struct.pack("!HH", 1, 1) + records
+
+
+def pcap(frames: Iterable[Tuple[float, bytes]]) -> bytes:
+    """Classic little-endian microsecond pcap of Ethernet frames."""
+    out = [struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)]
+    for ts, frame in frames:
+        sec = int(ts)
+        out.append(struct.pack("<IIII", sec, int(round((ts - sec) * 1e6)), len(frame), len(frame)) + frame)
+    return b"".join(out)
+
+
+def _pad4(data: bytes) -> bytes:
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def _block(btype: int, body: bytes) -> bytes:
+    length = 12 + len(body)
+    return struct.pack("<II", btype, length) + body + struct.pack("<I", length)
+
+
+def pcapng(frames: Iterable[Tuple[float, bytes]]) -> bytes:
+    """pcapng with one Ethernet interface (nanosecond timestamps) and enhanced packet blocks."""
+    shb = _block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1))
+    tsresol = struct.pack("<HH", 9, 1) + b"\x09" + b"\x00" * 3 + struct.pack("<HH", 0, 0)
+    idb = _block(1, struct.pack("<HHI", 1, 0, 65535) + tsresol)
+    blocks = [shb, idb]
+    for ts, frame in frames:
+        stamp = int(round(ts * 1e9))
+        blocks.append(_block(6, struct.pack("<IIIII", 0, stamp >> 32, stamp & 0xFFFFFFFF, len(frame), len(frame))
+                             + _pad4(frame)))
+    return b"".join(blocks)
+
+
+# --- NetFlow / IPFIX exports ---
+
+def netflow_v5(records: Sequence[Tuple[str, str, int, int, int, int, int, int]]) -> bytes:
+    """v5 datagram of (src, dst, sport, dport, proto, packets, bytes, duration_ms) records."""
+    out = [struct.pack("!HHIIIIBBH", 5, len(records), 100000, 1700000000, 0, 1, 0, 0, 0)]
+    for src, dst, sport, dport, proto, packets, nbytes, duration_ms in records:
+        first = 50000
+        out.append(struct.pack("!4s4s4sHHIIIIHHBBBBHHBBH", ip_bytes(src), ip_bytes(dst), b"\x00" * 4, 1, 2,
+                               packets, nbytes, first, first + duration_ms, sport, dport, 0, 0x18, proto, 0,
+                               0, 0, 24, 24, 0))
+    return b"".join(out)
+
+
+def template_fields(fields: Sequence[Tuple[int, int]], enterprise: Sequence[int] = ()) -> bytes:
+    """Field specifiers; fields whose index is in `enterprise` get the IPFIX enterprise bit and number."""
+    out = b""
+    for i, (ftype, length) in enumerate(fields):
+        if i in enterprise:
+            out += struct.pack("!HHI", ftype | 0x8000, length, 29305)
+        else:
+            out += struct.pack("!HH", ftype, length)
+    return out
+
+
+def export_set(set_id: int, body: bytes) -> bytes:
+    body = _pad4(body)
+    return struct.pack("!HH", set_id, 4 + len(body)) + body
+
+
+def netflow_v9(source_id: int, sets: List[bytes]) -> bytes:
+    return struct.pack("!HHIIII", 9, len(sets), 100000, 1700000000, 1, source_id) + b"".join(sets)
+
+
+def ipfix(domain: int, sets: List[bytes]) -> bytes:
+    body = b"".join(sets)
+    return struct.pack("!HHIII", 10, 16 + len(body), 1700000000, 1, domain) + body
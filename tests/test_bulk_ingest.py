@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+from bulk_ingest import arrow_chunks, ndjson_chunks, validate_columns
+
+GOOD = {"source_ip": "10.0.0.1", "dest_ip": "93.184.216.34", "dest_port": 443, "packet_count": 12,
+        "avg_pkt_len": 540.5, "duration_seconds": 1.5, "bytes_total": 6486, "protocol": "tcp"}
+
+
+async def pieces(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def collect(chunks):
+    async def run():
+        out = []
+        async for start, columns, n, errors in chunks:
+            rows, errors = validate_columns(columns, n, errors)
+            out.append((start, n, [(start + i, row) for i, row in rows], {start + i: e for i, e in errors.items()}))
+        return out
+    return asyncio.run(run())
+
+
+def ndjson(rows):
+    return b"".join((r if isinstance(r, bytes) else json.dumps(r).encode()) + b"\n" for r in rows)
+
+
+@pytest.mark.parametrize("piece", [1, 7, 4096])
+def test_ndjson_chunks_are_independent_of_body_boundaries(piece):
+    body = ndjson([dict(GOOD, dest_port=1000 + i) for i in range(25)]) + b"\n\n"
+    chunks = collect(ndjson_chunks(pieces(body, piece), chunk_rows=10))
+    assert [(start, n) for start, n, _, _ in chunks] == [(0, 10), (10, 10), (20, 5)]
+    rows = [row for _, _, valid, _ in chunks for row in valid]
+    assert [r["dest_port"] for _, r in rows] == list(range(1000, 1025))
+    assert rows[0][1] == dict(GOOD, dest_port=1000, hostname=None)
+
+
+def test_ndjson_error_rows_keep_their_position():
+    body = ndjson([
+        GOOD,
+        b"{not json",
+        b"[1, 2]",
+        {k: v for k, v in GOOD.items() if k != "dest_ip"},
+        dict(GOOD, dest_port=70000, packet_count=-1),
+        dict(GOOD, bytes_total=1.5, avg_pkt_len="big"),
+        dict(GOOD, protocol=None, hostname="cdn.example.com"),
+    ])
+    ((_, n, valid, errors),) = collect(ndjson_chunks(pieces(body, 5)))
+    assert n == 7
+    assert [i for i, _ in valid] == [0, 6]
+    assert valid[1][1]["hostname"] == "cdn.example.com"
+    assert errors[1].startswith("invalid JSON")
+    assert errors[2] == "row is not a JSON object"
+    assert errors[3] == "invalid dest_ip"
+    assert errors[4] == "invalid dest_port, packet_count"
+    assert errors[5] == "invalid avg_pkt_len, bytes_total"
+
+
+def test_ndjson_rejects_overlong_lines():
+    async def run():
+        async for _ in ndjson_chunks(pieces(b"x" * 64, 16), max_line_bytes=32):
+            pass
+    with pytest.raises(ValueError, match="exceeds"):
+        asyncio.run(run())
+
+
+def arrow_stream(rows, nulls=False):
+    pa = pytest.importorskip("pyarrow")
+    table = pa.Table.from_pylist(rows)
+    if nulls:
+        col = table.column("packet_count").to_pylist()
+        col[1] = None
+        table = table.set_column(table.schema.get_field_index("packet_count"), "packet_count", pa.array(col))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=7):
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize("piece", [3, 100, 1 << 16])
+def test_arrow_chunks_match_ndjson(piece):
+    rows = [dict(GOOD, dest_port=2000 + i) for i in range(20)]
+    chunks = collect(arrow_chunks(pieces(arrow_stream(rows), piece), chunk_rows=5))
+    # record batches of 7 rows are sliced to at most 5 without leaving gaps
+    assert [(start, n) for start, n, _, _ in chunks] == [(0, 5), (5, 2), (7, 5), (12, 2), (14, 5), (19, 1)]
+    valid = [row for _, _, v, _ in chunks for row in v]
+    assert valid == collect(ndjson_chunks(pieces(ndjson(rows), 4096)))[0][2]
+
+
+def test_arrow_nulls_are_error_rows():
+    ((_, _, valid, errors),) = collect(arrow_chunks(pieces(arrow_stream([GOOD] * 3, nulls=True), 64)))
+    assert [i for i, _ in valid] == [0, 2]
+    assert errors == {1: "invalid packet_count"}
+
+
+def test_truncated_arrow_stream_raises():
+    data = arrow_stream([GOOD] * 10)
+
+    async def run():
+        async for _ in arrow_chunks(pieces(data[:len(data) - 30], 64)):
+            pass
+    with pytest.raises(ValueError, match="truncated"):
+        asyncio.run(run())
@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+import sentinel_ai_classifier as sac
+from cascade import DEFAULT_SIGNATURES, CascadeStats, SignatureTier, calibrate_signatures
+
+SIGNATURES = [
+    {"id": "rtmp", "app_type": "Video Upload", "confidence": 0.99, "ports": [1935], "protocol": "tcp"},
+    {"id": "big", "app_type": "Video Streaming", "confidence": 0.995, "above": {"avg_pkt_len": 900}},
+    {"id": "voip_net", "app_type": "Audio/Video Call", "confidence": 0.99, "ports": [1935, 5004], "dst_cidr": "203.0.113.0/24"},
+    {"id": "short", "app_type": "Browsing", "confidence": 0.99, "below": {"duration_seconds": 1}},
+    {"id": "weak", "app_type": "Gaming", "confidence": 0.5, "ports": [3074]},
+]
+
+
+def flow(**kw):
+    base = {"dest_port": 443, "protocol": "TCP", "dest_ip": "198.51.100.1", "avg_pkt_len": 500.0,
+            "duration_seconds": 10.0, "packet_count": 100, "bytes_total": 50_000}
+    base.update(kw)
+    return base
+
+
+def match_id(tier, **kw):
+    s = tier.match(flow(**kw))
+    return s["id"] if s else None
+
+
+def test_signatures_match_in_list_order():
+    tier = SignatureTier(SIGNATURES, gate=0.99)
+    assert tier.active == 4
+    assert match_id(tier, dest_port=1935) == "rtmp"
+    # a portless signature listed earlier beats a port one listed later
+    assert match_id(tier, dest_port=5004, dest_ip="203.0.113.7", avg_pkt_len=1200) == "big"
+    assert match_id(tier, dest_port=5004, dest_ip="203.0.113.7") == "voip_net"
+    assert match_id(tier, dest_port=1935, protocol="udp", dest_ip="203.0.113.7") == "voip_net"
+    assert match_id(tier, duration_seconds=0.5) == "short"
+    assert match_id(tier) is None
+
+
+def test_gate_bounds_and_bad_fields():
+    tier = SignatureTier(SIGNATURES, gate=0.99)
+    assert match_id(tier, dest_port=3074) is None  # below the gate
+    assert match_id(SignatureTier(SIGNATURES, gate=0.4), dest_port=3074) == "weak"
+    assert SignatureTier(SIGNATURES, gate=1.01).active == 0
+    assert match_id(tier, avg_pkt_len=900) is None  # bounds are strict
+    assert match_id(tier, duration_seconds=1) is None
+    assert match_id(tier, dest_port=5004, dest_ip="2001:db8::1") is None
+    assert match_id(tier, dest_port=5004, dest_ip=None) is None
+    assert match_id(tier, dest_port="not-a-port", duration_seconds=0) == "short"
+
+
+def test_calibration_uses_measured_precision():
+    rng = np.random.default_rng(0)
+    n = 1000
+    ports = rng.choice([443, 1935, 3074], n)
+    avg = rng.uniform(100, 1400, n)
+    labels = np.where(ports == 3074, "Gaming", np.where(avg > 900, np.where(rng.random(n) < 0.3, "Video Streaming", "Browsing"), "Browsing"))
+    signatures = [
+        {"id": "games", "app_type": "Gaming", "confidence": 0.5, "ports": [3074]},
+        {"id": "big", "app_type": "Video Streaming", "confidence": 0.99, "above": {"avg_pkt_len": 900}},
+        {"id": "rare", "app_type": "Gaming", "confidence": 0.99, "ports": [9999]},
+        {"id": "net", "app_type": "Gaming", "confidence": 0.99, "dst_cidr": "10.0.0.0/8"},
+    ]
+    games, big, rare, net = calibrate_signatures(signatures, {"dest_port": ports, "avg_pkt_len": avg}, labels)
+    matched = int((ports == 3074).sum())
+    assert games["support"] == matched and games["confidence"] == round((matched + 1) / (matched + 2), 4)
+    assert 0.2 < big["confidence"] < 0.4  # a plausible heuristic, wrong most of the time
+    assert rare["support"] == 0 and rare["confidence"] == 0.0
+    assert net["calibrated"] is False and net["confidence"] == 0.99
+    assert [s["id"] for s in SignatureTier([games, big, rare, net]).signatures if s["confidence"] >= 0.99] == ["games", "net"]
+
+
+def test_cascade_stats_snapshot():
+    stats = CascadeStats()
+    stats.record("rules", 10, 4, 0.001)
+    stats.record("sentry", 6, 5, 0.006)
+    snap = stats.snapshot()
+    assert snap["rules"] == {"offered": 10, "resolved": 4, "hit_rate": 0.4, "share_of_flows": 0.4, "mean_latency_us": 100.0}
+    assert snap["sentry"]["share_of_flows"] == 0.5
+    assert snap["sentry"]["mean_latency_us"] == 1000.0
+    assert snap["vanguard"]["offered"] == 0
+
+
+class FakeSentry:
+    model = True
+
+    def __init__(self):
+        self.calls = []
+
+    def predict_scored(self, rows):
+        self.calls.append([r["dest_port"] for r in rows])
+        return [("Browsing", 0.99 if r["dest_port"] == 443 else 0.6, None) for r in rows]
+
+
+class FakeIndex:
+    def __init__(self):
+        self.observed = []
+
+    def lookup(self, features):
+        if features["dest_ip"] == "192.0.2.9":
+            return {"app_type": "Gaming", "agreement": 0.97, "support": 12.0, "key": "192.0.2.9:*"}
+        return None
+
+    def observe(self, features, app_type, confidence, engine):
+        self.observed.append((features["dest_port"], app_type, engine))
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    sentry, index = FakeSentry(), FakeIndex()
+    monkeypatch.setattr(sac, "rule_tier", SignatureTier(DEFAULT_SIGNATURES))
+    monkeypatch.setattr(sac, "domain_matcher", None)
+    monkeypatch.setattr(sac, "sentry", sentry)
+    monkeypatch.setattr(sac, "destination_index", index)
+    monkeypatch.setattr(sac, "cascade_stats", CascadeStats())
+    monkeypatch.setattr(sac, "escalation_controller", None)
+    monkeypatch.setattr(sac, "HAS_OLLAMA", False)
+    return sentry, index
+
+
+FLOWS = [
+    flow(dest_port=3478),                         # signature
+    flow(dest_ip="192.0.2.9", dest_port=3478),    # signature before the index
+    flow(dest_ip="192.0.2.9"),                    # index
+    flow(),                                       # confident Sentry
+    flow(dest_port=8080),                         # unsure Sentry: Vanguard
+]
+
+
+def test_each_flow_stops_at_the_first_tier_that_answers(cascade):
+    sentry, index = cascade
+    results = sac.classify_batch(FLOWS, simulate_vanguard=True)
+    assert [r["engine"] for r in results] == ["Rules", "Rules", "Index", "Sentry", "Vanguard"]
+    # one model call, for the flows the rules and the index left
+    assert sentry.calls == [[443, 8080]]
+    # only Sentry and real Vanguard answers teach the index
+    assert index.observed == [(443, "Browsing", "Sentry")]
+    tiers = sac.cascade_stats.snapshot()
+    assert [(tiers[t]["offered"], tiers[t]["resolved"]) for t in ("rules", "index", "sentry", "vanguard")] == [(5, 2), (3, 1), (2, 1), (1, 1)]
+
+
+def test_single_flow_path_takes_the_same_tiers(cascade):
+    sentry, _ = cascade
+    engines = [sac.classify_traffic(f)["engine"] for f in FLOWS]
+    assert engines == ["Rules", "Rules", "Index", "Sentry", "Vanguard"]
+    assert sentry.calls == [[443], [8080]]
+
+
+def test_rule_gate_above_one_disables_the_rule_tier(cascade, monkeypatch):
+    monkeypatch.setattr(sac, "rule_tier", SignatureTier(DEFAULT_SIGNATURES, gate=1.01))
+    results = sac.classify_batch(FLOWS[:2], simulate_vanguard=True)
+    assert [r["engine"] for r in results] == ["Vanguard", "Index"]
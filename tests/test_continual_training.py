@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("lightgbm")
+pytest.importorskip("sklearn")
+pytest.importorskip("pandas")
+
+import continual_training  # noqa: E402
+from continual_training import LabelHarvester, retrain  # noqa: E402
+
+
+def flows(n, seed):
+    rng = np.random.default_rng(seed)
+    video = rng.random(n) < 0.5
+    cols = {
+        "packet_count": rng.integers(50, 5000, n),
+        "avg_pkt_len": np.where(video, rng.uniform(1000, 1400, n), rng.uniform(80, 400, n)),
+        "duration_seconds": rng.uniform(1, 100, n),
+        "dest_port": np.where(video, 443, 27015),
+    }
+    cols["bytes_total"] = (cols["packet_count"] * cols["avg_pkt_len"]).astype(int)
+    return cols, np.where(video, "Video Streaming", "Gaming")
+
+
+@pytest.fixture
+def base_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the columnar cache goes under the working directory
+    cols, labels = flows(400, seed=0)
+    lines = [",".join(list(cols) + ["label"])]
+    lines += [",".join([str(cols[c][i]) for c in cols] + [labels[i]]) for i in range(len(labels))]
+    (tmp_path / "base.csv").write_text("\n".join(lines) + "\n")
+    return str(tmp_path / "base.csv")
+
+
+def harvest(tmp_path, n, seed):
+    harvester = LabelHarvester(str(tmp_path / "state" / "labels.ndjson"), min_confidence=0.9)
+    cols, labels = flows(n, seed)
+    for i in range(n):
+        harvester.add({c: float(v[i]) for c, v in cols.items()}, labels[i], 0.97)
+    assert not harvester.add({"packet_count": 1.0}, "Gaming", 0.5)  # below min_confidence
+    return harvester
+
+
+def test_first_candidate_is_accepted_and_learns(base_csv, tmp_path):
+    harvester = harvest(tmp_path, 50, seed=1)
+    candidate, report = retrain(base_csv, harvester.rows, None)
+    assert report["accepted"] and candidate is not None
+    assert report["usable_harvested_rows"] == 50
+    assert report["candidate"]["accuracy"] > 0.95
+    assert candidate["generation"] == 1
+    assert not report["warm_start"]
+
+
+def test_weaker_serving_model_is_replaced_and_stronger_one_kept(base_csv, tmp_path):
+    harvester = harvest(tmp_path, 50, seed=1)
+    strong, _ = retrain(base_csv, harvester.rows, None)
+    # a serving model trained on labels unrelated to the features
+    weak = dict(strong, model=continual_training.LGBMClassifier(n_estimators=5, verbose=-1).fit(
+        np.random.default_rng(2).normal(size=(200, len(strong["feature_columns"]))),
+        np.arange(200) % 2))
+    candidate, report = retrain(base_csv, harvester.rows, weak)
+    assert report["accepted"] and candidate["generation"] == strong["generation"] + 1
+    assert report["candidate"]["accuracy"] > report["current"]["accuracy"]
+
+
+@pytest.mark.parametrize("candidate, current, accepted", [
+    ({"accuracy": 0.90, "escalation_rate": 0.30}, {"accuracy": 0.89, "escalation_rate": 0.10}, True),
+    ({"accuracy": 0.897, "escalation_rate": 0.05}, {"accuracy": 0.90, "escalation_rate": 0.10}, True),
+    ({"accuracy": 0.897, "escalation_rate": 0.10}, {"accuracy": 0.90, "escalation_rate": 0.10}, False),
+    ({"accuracy": 0.85, "escalation_rate": 0.00}, {"accuracy": 0.90, "escalation_rate": 0.10}, False),
+])
+def test_decision_rule(base_csv, tmp_path, monkeypatch, candidate, current, accepted):
+    serving, _ = retrain(base_csv, harvest(tmp_path, 20, seed=3).rows, None)
+    scores = iter([candidate, current])
+    monkeypatch.setattr(continual_training, "evaluate", lambda *args, **kwargs: next(scores))
+    result, report = retrain(base_csv, [], serving)
+    assert report["accepted"] is accepted
+    assert (result is not None) is accepted
+
+
+def test_base_data_must_be_flow_features(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "odd.csv").write_text("packet_count,entropy,label\n" + "".join(
+        f"{i},{i % 7},{'a' if i % 2 else 'b'}\n" for i in range(50)))
+    with pytest.raises(ValueError, match="entropy"):
+        retrain(str(tmp_path / "odd.csv"), [], None)
@@ -0,0 +1,128 @@
+import types
+
+import pytest
+
+import destination_index
+from destination_index import DestinationIndex
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1_700_000_000.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(destination_index, "time", types.SimpleNamespace(time=clock))
+    return clock
+
+
+def dest(ip="203.0.113.7", port=443):
+    return {"dest_ip": ip, "dest_port": port}
+
+
+def teach(index, n, features=None, app="Video Streaming", confidence=0.99, engine="Sentry"):
+    for _ in range(n):
+        index.observe(features or dest(), app, confidence, engine)
+
+
+def test_lookup_needs_support_and_agreement(clock):
+    index = DestinationIndex(min_support=5, min_agreement=0.9)
+    teach(index, 4)
+    assert index.lookup(dest()) is None
+    teach(index, 1)
+    hit = index.lookup(dest())
+    assert hit == {"key": "203.0.113.7:443", "app_type": "Video Streaming", "support": 5.0, "agreement": 1.0}
+    teach(index, 1, app="Browsing")
+    assert index.lookup(dest()) is None  # 5 of 6 agree
+    assert index.stats["hits_exact"] == 1 and index.stats["misses"] == 2
+
+
+def test_prefix_entry_covers_the_pool(clock):
+    index = DestinationIndex(min_support=3)
+    for host in (7, 8, 9):
+        teach(index, 1, dest(f"203.0.113.{host}"))
+    hit = index.lookup(dest("203.0.113.200"))
+    assert hit["key"] == "203.0.113.0/24:443"
+    assert index.lookup(dest("203.0.113.200", port=80)) is None
+    assert index.lookup(dest("203.0.114.7")) is None
+    for host in range(3):
+        teach(index, 1, dest(f"2001:db8::{host}"), app="Gaming")
+    assert index.lookup(dest("2001:db8::ffff"))["key"] == "2001:db8::/64:443"
+    assert index.stats["hits_prefix"] == 2
+
+
+def test_only_confident_model_answers_are_evidence(clock):
+    index = DestinationIndex(min_confidence=0.95)
+    assert not index.observe(dest(), "Video Streaming", 0.9, "Sentry")
+    assert not index.observe(dest(), "Video Streaming", 0.99, "Index")
+    assert not index.observe(dest(), "Video Streaming", 0.99, "Rules")
+    assert not index.observe(dest(), "Unknown", 0.99, "Vanguard")
+    index.observe({"dest_port": 443}, "Video Streaming", 0.99, "Sentry")  # no destination to key on
+    assert len(index) == 0
+    assert index.observe(dest(), "Video Streaming", 0.99, "Vanguard")
+    assert len(index) == 2  # exact and prefix
+
+
+def test_evidence_decays_until_the_model_is_asked_again(clock):
+    index = DestinationIndex(half_life=60.0, min_support=5)
+    teach(index, 10)
+    assert index.lookup(dest())["support"] == 10.0
+    clock.t += 60
+    assert index.lookup(dest())["support"] == 5.0
+    clock.t += 1
+    assert index.lookup(dest()) is None
+    # one fresh model answer on top of the decayed weight
+    teach(index, 1)
+    assert index.lookup(dest())["support"] == pytest.approx(10 * 0.5 ** (61 / 60) + 1, abs=1e-3)
+
+
+def test_decay_lets_a_new_label_take_over(clock):
+    index = DestinationIndex(half_life=10.0, min_support=3, min_agreement=0.9)
+    teach(index, 20, app="Browsing")
+    clock.t += 120  # 2^-12 of the old weight is left, and dropped
+    teach(index, 3, app="Video Streaming")
+    assert index.lookup(dest())["app_type"] == "Video Streaming"
+    assert index.lookup(dest())["agreement"] == 1.0
+
+
+def test_least_recently_updated_keys_are_evicted(clock):
+    index = DestinationIndex(max_entries=4, min_support=1)
+    teach(index, 1, dest("198.51.100.1"))
+    teach(index, 1, dest("203.0.113.1"))
+    clock.t += 1
+    teach(index, 1, dest("198.51.100.1"))  # refreshes both its keys
+    teach(index, 1, dest("192.0.2.1"))
+    assert len(index) == 4
+    assert index.stats["evictions"] == 2
+    assert index.lookup(dest("203.0.113.1")) is None
+    assert index.lookup(dest("198.51.100.1")) is not None
+    assert index.lookup(dest("192.0.2.1")) is not None
+
+
+def test_save_and_load(clock, tmp_path):
+    path = str(tmp_path / "state" / "index.json")
+    index = DestinationIndex(path, min_support=2)
+    index.set_model_key("gen-1")
+    teach(index, 3)
+    index.save()
+
+    restored = DestinationIndex(path, min_support=2)
+    assert restored.load("gen-1") == 2
+    assert restored.lookup(dest()) == index.lookup(dest())
+    # saved for another model: its decisions are not this model's
+    assert DestinationIndex(path).load("gen-2") == 0
+    assert DestinationIndex(path, max_entries=1).load("gen-1") == 1
+
+
+def test_model_change_clears_the_index(clock):
+    index = DestinationIndex(min_support=1)
+    assert not index.set_model_key("gen-1")
+    teach(index, 2)
+    assert not index.set_model_key("gen-1")
+    assert index.set_model_key("gen-2")
+    assert len(index) == 0 and index.stats["invalidations"] == 1
@@ -0,0 +1,116 @@
+import time
+import types
+
+import numpy as np
+import pytest
+
+import escalation_control
+from escalation_control import BUDGET_DENIED, ESCALATE, FAMILIAR, SENTRY, EscalationController
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(escalation_control, "time", types.SimpleNamespace(monotonic=clock, time=time.time))
+    return clock
+
+
+def confidences(n, rng, low=0.5, high=4.0):
+    # 1 - 10^-u: spread over the decades the bins resolve
+    return 1.0 - 10.0 ** -rng.uniform(low, high, n)
+
+
+def run(ctl, clock, seconds, flows_per_s, rng, label="video", **kw):
+    outcomes = []
+    for _ in range(seconds):
+        for c in confidences(flows_per_s, rng, **kw):
+            outcomes.append(ctl.decide(label, float(c)))
+            clock.t += 1.0 / flows_per_s
+    return outcomes
+
+
+def test_inactive_controller_uses_the_fixed_threshold(clock):
+    ctl = EscalationController(default_threshold=0.95)
+    assert not ctl.active
+    assert ctl.decide("video", 0.94) == ESCALATE
+    assert ctl.decide("video", 0.96) == SENTRY
+    clock.t += 5
+    ctl.decide("video", 0.5)
+    assert ctl.threshold("video") == 0.95
+    assert ctl.allowed_rate is None
+
+
+def test_target_rate_is_tracked(clock):
+    rng = np.random.default_rng(0)
+    ctl = EscalationController(target_rate=0.05, min_threshold=0.5, max_threshold=0.999999)
+    run(ctl, clock, 10, 500, rng)  # warm-up
+    outcomes = run(ctl, clock, 20, 500, rng)
+    assert outcomes.count(ESCALATE) / len(outcomes) == pytest.approx(0.05, abs=0.015)
+    assert ctl.allowed_rate == 0.05
+
+
+def test_budget_caps_llm_calls_through_a_traffic_shift(clock):
+    rng = np.random.default_rng(1)
+    budget = 10.0
+    ctl = EscalationController(target_rate=0.05, llm_budget_cps=budget, burst_seconds=2.0, half_life=2.0)
+    run(ctl, clock, 10, 200, rng)
+    # traffic turns much less certain and twice as heavy
+    outcomes = run(ctl, clock, 10, 400, rng, low=0.5, high=2.0)
+    escalated = outcomes.count(ESCALATE)
+    assert escalated <= budget * 10 + budget * 2.0  # refill over the window plus one burst
+    assert outcomes.count(BUDGET_DENIED) > 0
+    # the thresholds follow the shift, so denials are only the transient
+    assert ctl.allowed_rate == pytest.approx(budget / ctl.flow_rate)
+    assert outcomes[-1600:].count(BUDGET_DENIED) <= 0.1 * outcomes[-1600:].count(ESCALATE)
+
+
+def test_zero_budget_allows_no_calls(clock):
+    ctl = EscalationController(llm_budget_cps=0.0)
+    assert [ctl.decide("video", 0.1) for _ in range(5)] == [BUDGET_DENIED] * 5
+
+
+def test_thresholds_are_clamped(clock):
+    rng = np.random.default_rng(2)
+    ctl = EscalationController(target_rate=0.5, min_threshold=0.9, max_threshold=0.99, half_life=1.0)
+    run(ctl, clock, 5, 400, rng, low=0.0, high=0.5)  # median confidence < 0.9
+    assert ctl.threshold("video") == 0.9
+    run(ctl, clock, 10, 400, rng, low=3.0, high=5.0)  # median confidence > 0.99
+    assert ctl.threshold("video") == 0.99
+
+
+def test_sparse_classes_use_the_pooled_histogram(clock):
+    rng = np.random.default_rng(3)
+    ctl = EscalationController(target_rate=0.1, min_samples=200)
+    run(ctl, clock, 5, 200, rng, label="video")
+    for c in confidences(20, rng, low=0.0, high=0.3):
+        ctl.decide("gaming", float(c))
+    clock.t += 1.0
+    ctl.decide("video", 0.999)
+    # 20 samples are too few for its own quantile: gaming gets the pooled one
+    assert ctl.thresholds["gaming"] == pytest.approx(ctl._quantile(ctl._pooled, 0.1), abs=1e-6)
+    assert ctl.thresholds["gaming"] != pytest.approx(ctl._quantile(ctl._hist["gaming"], 0.1), abs=1e-6)
+
+
+def test_novelty_keeps_familiar_flows_on_sentry(clock):
+    ctl = EscalationController(default_threshold=0.95)
+    assert ctl.decide("video", 0.5, novelty=0.2) == FAMILIAR
+    assert ctl.decide("video", 0.5, novelty=2.0) == ESCALATE
+    assert ctl.decide("video", 0.99, novelty=0.2) == SENTRY
+    assert ctl.per_class["video"] == {SENTRY: 1, FAMILIAR: 1, ESCALATE: 1, BUDGET_DENIED: 0}
+
+
+def test_configure_rejects_unknown_settings(clock):
+    ctl = EscalationController()
+    with pytest.raises(KeyError):
+        ctl.configure(half_life=5)
+    ctl.configure(llm_budget_cps=5.0)
+    assert ctl.active
+    assert ctl.snapshot()["history"][-1]["reason"] == "configured"
@@ -0,0 +1,127 @@
+import math
+
+import numpy as np
+import pytest
+
+from feature_pipeline import FLOW_INPUTS, FeaturePipeline, payload_pipeline
+
+
+def flow_rows(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "packet_count": int(rng.integers(1, 5000)),
+            "avg_pkt_len": float(rng.integers(40, 1500)),
+            # dyadic durations, exact in float32 as well as float64
+            "duration_seconds": float(rng.integers(0, 4000)) / 16,
+            "bytes_total": int(rng.integers(0, 5_000_000)),
+            "dest_port": int(rng.choice([53, 443, 3478, 8080, 19302, 50000])),
+            "label": "realtime" if i % 3 == 0 else "bulk",
+        })
+    return rows
+
+
+def as_columns(rows, names):
+    return {c: np.array([r[c] for r in rows], dtype=np.float64) for c in names}
+
+
+def test_rows_and_columns_give_the_same_matrix():
+    pipeline = FeaturePipeline.default()
+    rows = flow_rows()
+    np.testing.assert_array_equal(pipeline.transform_rows(rows), pipeline.transform_columns(as_columns(rows, FLOW_INPUTS)))
+
+
+def test_default_steps():
+    row = {"packet_count": 10, "avg_pkt_len": 100.0, "duration_seconds": 0.0, "bytes_total": 1000, "dest_port": 3478}
+    out = dict(zip(FeaturePipeline.default().output_columns, FeaturePipeline.default().transform_rows([row])[0]))
+    assert out["bytes_per_sec"] == pytest.approx(1000 / 1e-3)  # zero duration hits the ratio's eps
+    assert out["log_bytes_total"] == pytest.approx(math.log1p(1000))
+    assert out["port_bucket"] == 1.0
+    assert out["realtime_port"] == 1.0
+
+
+def test_missing_and_nan_inputs_are_zero():
+    pipeline = FeaturePipeline.default()
+    full = {c: 0 for c in FLOW_INPUTS}
+    sparse = [{}, {"bytes_total": None}, {"duration_seconds": float("nan")}]
+    expected = pipeline.transform_rows([full])[0]
+    for row in sparse:
+        np.testing.assert_array_equal(pipeline.transform_rows([row])[0], expected)
+    np.testing.assert_array_equal(pipeline.transform_columns({}, 2), np.tile(expected, (2, 1)))
+
+
+def test_spec_round_trip():
+    pipeline = FeaturePipeline.default().select(["log_bytes_total", "dest_port", "realtime_port"])
+    restored = FeaturePipeline.from_dict(pipeline.to_dict())
+    assert restored.output_columns == ["log_bytes_total", "dest_port", "realtime_port"]
+    assert restored.inputs == ["bytes_total", "dest_port"]
+    rows = flow_rows(50)
+    np.testing.assert_array_equal(restored.transform_rows(rows), pipeline.transform_rows(rows))
+
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError):
+        FeaturePipeline.from_dict({"version": 99, "steps": []})
+    with pytest.raises(ValueError):
+        FeaturePipeline([{"name": "x", "op": "cube", "input": "bytes_total"}])
+    with pytest.raises(ValueError):
+        FeaturePipeline([{"name": "x", "op": "input", "input": "a"}, {"name": "x", "op": "input", "input": "b"}])
+
+
+def test_payload_pipeline():
+    spec = FeaturePipeline.default().to_dict()
+    columns = FeaturePipeline.default().output_columns
+    assert payload_pipeline({"feature_pipeline": spec, "feature_columns": columns}).output_columns == columns
+    # payloads saved before pipelines existed pass their columns through
+    assert payload_pipeline({"feature_columns": ["bytes_total"]}).steps == [{"name": "bytes_total", "op": "input", "input": "bytes_total"}]
+    with pytest.raises(ValueError):
+        payload_pipeline({"feature_pipeline": spec, "feature_columns": columns[::-1]})
+
+
+def test_foreign_inputs():
+    assert FeaturePipeline.for_columns(["feature1", "feature2"]).foreign_inputs() == ["feature1", "feature2"]
+    assert FeaturePipeline.for_columns(list(FLOW_INPUTS) + ["feature1"]).foreign_inputs() == []
+
+
+def test_served_model_sees_the_training_features(tmp_path, monkeypatch):
+    pytest.importorskip("lightgbm")
+    pd = pytest.importorskip("pandas")
+    import joblib
+
+    from sentinel_ai_classifier import SentryWrapper
+    from train_sentry import train_sentry_model
+
+    monkeypatch.chdir(tmp_path)
+    rows = flow_rows(600)
+    pd.DataFrame(rows).to_csv("train.csv", index=False)
+    train_sentry_model("train.csv", "model.pkl", fit_ood=False)
+
+    payload = joblib.load("model.pkl")
+    pipeline = payload_pipeline(payload)
+    assert pipeline.output_columns == FeaturePipeline.default().output_columns
+    # the matrix train_sentry fits on, rebuilt from the CSV columns
+    expected = payload["model"].predict_proba(pd.DataFrame(
+        pipeline.transform_columns(as_columns(rows, FLOW_INPUTS)), columns=pipeline.output_columns))
+
+    wrapper = SentryWrapper("model.pkl")
+    assert wrapper.error is None
+    np.testing.assert_allclose(np.array([wrapper.predict_proba(r) for r in rows[:50]]), expected[:50], rtol=1e-9, atol=1e-12)
+    scored = wrapper.predict_scored(rows)
+    np.testing.assert_allclose([c for _, c, _ in scored], expected.max(axis=1), rtol=1e-9, atol=1e-12)
+
+
+def test_wrapper_refuses_foreign_inputs(tmp_path):
+    joblib = pytest.importorskip("joblib")
+    from sklearn.dummy import DummyClassifier
+
+    from sentinel_ai_classifier import SentryWrapper
+
+    pipeline = FeaturePipeline.passthrough(["feature1", "bytes_total"])
+    model = DummyClassifier().fit(np.zeros((4, 2)), [0, 1, 0, 1])
+    path = str(tmp_path / "model.pkl")
+    joblib.dump({"model": model, "label_encoder": None, "feature_columns": pipeline.output_columns,
+                 "feature_pipeline": pipeline.to_dict()}, path)
+    wrapper = SentryWrapper(path)
+    assert wrapper.model is None
+    assert "feature1" in wrapper.error
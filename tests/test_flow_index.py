@@ -0,0 +1,75 @@
+import pytest
+
+from flow_index import IndexedStore
+
+
+def flow(i, **overrides):
+    record = {"id": f"f{i}", "source_ip": f"10.0.{i % 4}.{i}", "dest_port": 443 if i % 2 else 80, "app_type": "Gaming"}
+    record.update(overrides)
+    return record
+
+
+def store(n, **kwargs):
+    s = IndexedStore(("app_type", "dest_port"), cidr_fields=("source_ip",), **kwargs)
+    for i in range(n):
+        s.upsert(f"f{i}", flow(i))
+    return s
+
+
+def pages(s, filters=None, limit=7, between=None):
+    """Walk every page, calling between(page_number) after each one."""
+    seen, cursor, page = [], None, 0
+    while True:
+        items, cursor = s.query(filters, cursor=cursor, limit=limit)
+        seen.extend(r["id"] for r in items)
+        if cursor is None:
+            return seen
+        page += 1
+        if between:
+            between(page)
+
+
+@pytest.mark.parametrize("filters", [None, {"dest_port": 443}, {"source_ip": "10.0.0.0/16"},
+                                     {"source_ip": "10.0.1.0/24", "dest_port": 443}])
+def test_pages_cover_matches_once_in_order(filters):
+    s = store(60)
+    expected = [r["id"] for r in s.query(filters, limit=500)[0]]
+    assert expected and pages(s, filters) == expected
+
+
+def test_cursor_is_stable_across_writes():
+    s = store(40)
+    removed = set()
+
+    def churn(page):
+        # new records land after every cursor, updates keep their position, removals drop out
+        s.upsert(f"new{page}", flow(100 + page, id=f"new{page}"))
+        s.upsert("f30", flow(30, app_type="Browsing"))
+        victim = f"f{page * 3}"
+        s.remove(victim)
+        removed.add(victim)
+
+    seen = pages(s, limit=5, between=churn)
+    assert len(seen) == len(set(seen))
+    originals = [k for k in seen if k.startswith("f")]
+    assert originals == sorted(originals, key=lambda k: int(k[1:]))
+    # every record still present was served; the new ones come last, in insertion order
+    assert {f"f{i}" for i in range(40)} - removed <= set(originals)
+    assert [k for k in seen if k.startswith("new")] == [f"new{p}" for p in range(1, len(seen) - len(originals) + 1)]
+    assert seen.index("new1") > seen.index("f39")
+
+
+def test_cursor_survives_compaction_and_eviction():
+    s = store(200, capacity=150)
+    assert len(s) == 150 and "f49" not in s and "f50" in s
+    items, cursor = s.query(limit=10)
+    assert [r["id"] for r in items] == [f"f{i}" for i in range(50, 60)]
+    for i in range(60, 180):  # enough removals to compact the sequence list
+        s.remove(f"f{i}")
+    items, cursor = s.query(cursor=cursor, limit=10)
+    assert [r["id"] for r in items] == [f"f{i}" for i in range(180, 190)]
+
+
+def test_unindexed_filter_is_rejected():
+    with pytest.raises(KeyError):
+        store(1).query({"dest_ip": "192.0.2.1"})
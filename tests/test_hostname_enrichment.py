@@ -0,0 +1,78 @@
+import pytest
+
+from hostname_enrichment import DomainMatcher, HostnameCache, parse_dns_answers, parse_sni
+from packet_builders import client_hello, dns_response
+
+
+def test_sni_round_trip():
+    hello = client_hello("Video.Example.COM")
+    assert parse_sni(hello, 0, len(hello)) == "video.example.com"
+    # at an offset inside a larger buffer
+    buf = b"\xff" * 7 + hello
+    assert parse_sni(buf, 7, len(buf)) == "video.example.com"
+
+
+def test_truncated_client_hello_yields_none():
+    hello = client_hello("a.example.com")
+    assert all(parse_sni(hello, 0, end) is None for end in range(len(hello)))
+    assert all(parse_sni(hello[:end], 0, end) is None for end in range(len(hello)))
+
+
+def test_sni_ignores_other_handshakes():
+    hello = bytearray(client_hello("a.example.com"))
+    hello[5] = 2  # ServerHello
+    assert parse_sni(bytes(hello), 0, len(hello)) is None
+
+
+def test_dns_answers_round_trip():
+    resp = dns_response("media.example.com", [("198.51.100.9", 300), ("2001:db8::9", 60)])
+    assert parse_dns_answers(resp, 0, len(resp)) == [("198.51.100.9", "media.example.com", 300),
+                                                     ("2001:db8::9", "media.example.com", 60)]
+
+
+def test_dns_cname_chain_is_labelled_with_the_question():
+    resp = dns_response("www.example.com", [("203.0.113.1", 120)], cname="edge.cdn.example.net")
+    assert parse_dns_answers(resp, 0, len(resp)) == [("203.0.113.1", "www.example.com", 120)]
+
+
+def test_dns_queries_and_errors_are_ignored():
+    resp = bytearray(dns_response("example.com", [("192.0.2.1", 30)]))
+    query = bytes(resp[:2]) + b"\x01\x00" + bytes(resp[4:])
+    assert parse_dns_answers(query, 0, len(query)) == []
+    resp[3] |= 3  # NXDOMAIN
+    assert parse_dns_answers(bytes(resp), 0, len(resp)) == []
+
+
+def test_truncated_dns_response_does_not_raise():
+    resp = dns_response("media.example.com", [("198.51.100.9", 300), ("198.51.100.10", 300)])
+    for end in range(len(resp)):
+        answers = parse_dns_answers(resp, 0, end)
+        assert answers in ([], [("198.51.100.9", "media.example.com", 300)])
+
+
+def test_cache_expiry_and_learned_time():
+    cache = HostnameCache(min_ttl=10.0, max_ttl=100.0)
+    cache.put("192.0.2.1", "a.example.com", now=50.0, ttl=1.0)  # clamped to min_ttl
+    assert cache.get("192.0.2.1", 49.0) is None  # not learned yet
+    assert cache.get("192.0.2.1", 59.0) == "a.example.com"
+    assert cache.get("192.0.2.1", 61.0) is None
+    assert cache.stats["expired"] == 1
+
+
+def test_cache_is_bounded():
+    cache = HostnameCache(max_entries=2)
+    for i in range(3):
+        cache.put(f"192.0.2.{i}", f"h{i}.example.com", now=0.0, ttl=60.0)
+    assert len(cache) == 2 and cache.get("192.0.2.0", 1.0) is None
+
+
+@pytest.mark.parametrize("hostname, app_type", [
+    ("rr3.sn-abc.googlevideo.com.", "Video Streaming"),
+    ("US04WEB.zoom.us", "Audio/Video Call"),
+    ("notzoom.us", None),
+])
+def test_domain_matcher_suffixes(hostname, app_type):
+    matcher = DomainMatcher([{"domain": "googlevideo.com", "app_type": "Video Streaming"},
+                             {"domain": "zoom.us", "app_type": "Audio/Video Call"}])
+    rule = matcher.match(hostname)
+    assert (rule["app_type"] if rule else None) == app_type
@@ -0,0 +1,56 @@
+import pytest
+
+from metrics_engine import MetricsEngine
+
+NOW = 1_700_000_000
+
+
+def engine():
+    return MetricsEngine(["Gaming", "Browsing"])
+
+
+@pytest.mark.parametrize("window_s, points, resolution, n", [
+    (10, 60, 1, 10),       # fewer seconds than points: one point per second, not 60
+    (300, 60, 1, 60),
+    (3600, 60, 60, 60),
+    (7200, 60, 60, 60),    # past the 1 s tier's hour
+    (7200, 7200, 60, 120),  # moved to a coarser tier: no more points than its slots in the window
+    (86400 * 7, 10, 3600, 10),
+])
+def test_points_cover_the_window(window_s, points, resolution, n):
+    result = engine().timeseries("Gaming", window_s=window_s, points=points, now=NOW)
+    assert result["resolution"] == resolution
+    stamps = [t for t, _ in result["points"]]
+    assert len(stamps) == n
+    covered = n * result["step"]
+    assert window_s <= covered < window_s + result["step"]
+    assert stamps[-1] + result["step"] > NOW >= stamps[-1]
+
+
+def test_rates_and_percentiles():
+    e = engine()
+    for t in range(NOW - 9, NOW + 1):
+        e.record("Gaming", 1000, 2, ts=t)
+    e.record("Gaming", 9000, 0, ts=NOW)
+    result = e.timeseries("Gaming", window_s=10, points=5, now=NOW)
+    assert result["step"] == 2
+    assert [v for _, v in result["points"]] == [1000.0] * 4 + [5500.0]
+    assert result["p50"] == 1000.0 and result["p99"] > 9000.0
+    assert e.rate("Gaming", window_s=10, now=NOW) == pytest.approx(1900.0)
+    assert e.timeseries("Browsing", window_s=10, now=NOW)["p95"] == 0.0
+
+
+def test_late_records_do_not_wipe_newer_slots():
+    e = engine()
+    e.record("Gaming", 500, ts=NOW)
+    e.record("Gaming", 100, ts=NOW - 3600)  # same 1 s slot, an hour older
+    assert e.stats["late_dropped"][1] == 1
+    assert e.timeseries("Gaming", window_s=1, points=1, now=NOW)["points"][0][1] == 500.0
+    # the minute tier still covers the late record
+    hourly = e.timeseries("Gaming", window_s=7200, points=120, now=NOW)
+    assert sum(v * hourly["step"] for _, v in hourly["points"]) == 600.0
+
+
+def test_unknown_series():
+    with pytest.raises(KeyError):
+        engine().timeseries("Nope")
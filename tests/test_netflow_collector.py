@@ -0,0 +1,87 @@
+import struct
+
+import pytest
+
+from netflow_collector import (FLOW_END_MILLISECONDS, FLOW_START_MILLISECONDS, IN_BYTES, IN_PKTS, IPV4_DST_ADDR,
+                               IPV4_SRC_ADDR, IPV6_DST_ADDR, IPV6_SRC_ADDR, L4_DST_PORT, L4_SRC_PORT, OCTET_TOTAL,
+                               PACKET_TOTAL, PROTOCOL, FIRST_SWITCHED, LAST_SWITCHED, NetFlowDecoder)
+from packet_builders import export_set, ip_bytes, ipfix, netflow_v5, netflow_v9, template_fields
+
+
+def features(src, dst, dport, proto, packets, nbytes, duration):
+    return {"source_ip": src, "dest_ip": dst, "dest_port": dport, "packet_count": packets,
+            "avg_pkt_len": nbytes / packets, "duration_seconds": duration, "bytes_total": nbytes, "protocol": proto}
+
+
+def test_v5_round_trip_skips_non_tcp_udp():
+    decoder = NetFlowDecoder()
+    data = netflow_v5([
+        ("10.0.0.1", "93.184.216.34", 51000, 443, 6, 120, 150000, 2500),
+        ("10.0.0.2", "8.8.8.8", 53000, 53, 17, 1, 74, 0),
+        ("10.0.0.3", "10.0.0.4", 0, 0, 1, 4, 336, 3000),  # ICMP
+    ])
+    assert decoder.decode(data) == [
+        features("10.0.0.1", "93.184.216.34", 443, "tcp", 120, 150000, 2.5),
+        features("10.0.0.2", "8.8.8.8", 53, "udp", 1, 74, 0.0),
+    ]
+    assert decoder.stats["skipped_records"] == 1
+    assert decoder.stats["malformed"] == 0
+
+
+V9_FIELDS = [(IPV4_SRC_ADDR, 4), (IPV4_DST_ADDR, 4), (L4_SRC_PORT, 2), (L4_DST_PORT, 2), (PROTOCOL, 1),
+             (IN_PKTS, 4), (IN_BYTES, 4), (FIRST_SWITCHED, 4), (LAST_SWITCHED, 4), (10, 2)]  # 10 = input SNMP, unused
+
+
+def v9_record(src, dst, sport, dport, proto, packets, nbytes, first, last):
+    return struct.pack("!4s4sHHBIIIIH", ip_bytes(src), ip_bytes(dst), sport, dport, proto, packets, nbytes,
+                       first, last, 7)
+
+
+def test_v9_template_then_data():
+    decoder = NetFlowDecoder()
+    template = export_set(0, struct.pack("!HH", 300, len(V9_FIELDS)) + template_fields(V9_FIELDS))
+    data = export_set(300, v9_record("192.168.1.10", "203.0.113.7", 40000, 3478, 17, 500, 80000, 1000, 31000)
+                      + v9_record("192.168.1.11", "203.0.113.8", 40001, 443, 6, 10, 5200, 2000, 2400))
+
+    # data before its template is dropped until the template arrives
+    assert decoder.decode(netflow_v9(1, [data]), exporter="r1") == []
+    assert decoder.stats["unknown_template_sets"] == 1
+
+    assert decoder.decode(netflow_v9(1, [template]), exporter="r1") == []
+    assert decoder.decode(netflow_v9(1, [data]), exporter="r1") == [
+        features("192.168.1.10", "203.0.113.7", 3478, "udp", 500, 80000, 30.0),
+        features("192.168.1.11", "203.0.113.8", 443, "tcp", 10, 5200, 0.4),
+    ]
+    # templates are per exporter and source id
+    assert decoder.decode(netflow_v9(2, [data]), exporter="r1") == []
+    assert decoder.decode(netflow_v9(1, [data]), exporter="r2") == []
+
+
+def test_ipfix_ipv6_with_enterprise_field_and_millisecond_times():
+    decoder = NetFlowDecoder()
+    fields = [(IPV6_SRC_ADDR, 16), (IPV6_DST_ADDR, 16), (L4_SRC_PORT, 2), (L4_DST_PORT, 2), (PROTOCOL, 1),
+              (PACKET_TOTAL, 8), (OCTET_TOTAL, 8), (FLOW_START_MILLISECONDS, 8), (FLOW_END_MILLISECONDS, 8),
+              (100, 4)]
+    template = export_set(2, struct.pack("!HH", 400, len(fields)) + template_fields(fields, enterprise=[9]))
+    start_ms = 1_700_000_000_000
+    record = struct.pack("!16s16sHHBQQQQI", ip_bytes("2001:db8::1"), ip_bytes("2001:db8:ffff::2"), 50000, 443, 6,
+                         3000, 4_000_000, start_ms, start_ms + 12_345, 0)
+    flows = decoder.decode(ipfix(7, [template, export_set(400, record * 2)]), exporter="r1")
+    assert flows == [features("2001:db8::1", "2001:db8:ffff::2", 443, "tcp", 3000, 4_000_000, 12.345)] * 2
+
+
+def test_variable_length_template_is_not_compiled():
+    decoder = NetFlowDecoder()
+    fields = [(IPV4_SRC_ADDR, 4), (IPV4_DST_ADDR, 4), (PROTOCOL, 1), (IN_PKTS, 4), (IN_BYTES, 4), (82, 0xFFFF)]
+    decoder.decode(ipfix(1, [export_set(2, struct.pack("!HH", 500, len(fields)) + template_fields(fields))]))
+    assert decoder.templates == {}
+
+
+@pytest.mark.parametrize("cut", [1, 3, 10, 23, 30, 60])
+def test_truncated_datagrams_do_not_raise(cut):
+    decoder = NetFlowDecoder()
+    template = export_set(0, struct.pack("!HH", 300, len(V9_FIELDS)) + template_fields(V9_FIELDS))
+    for data in (netflow_v5([("10.0.0.1", "10.0.0.2", 1, 2, 6, 1, 60, 0)]), netflow_v9(1, [template])):
+        decoder.decode(data[:cut])
+    decoder.decode(b"\x00\x07" + b"\x00" * 30)  # unknown version
+    assert decoder.stats["malformed"] >= 1
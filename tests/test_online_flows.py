@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from online_flows import OnlineFlowTable
+
+KEY = ("10.0.0.1", "93.184.216.34", 443, "tcp")
+
+
+class Script:
+    """Predict function answering each call with the next scripted (label, confidence), or None."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def __call__(self, rows):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        return None if answer is None else [answer] * len(rows)
+
+
+def run(table, packets, start=0):
+    """Feed `packets` packets, deciding whenever a flow is due; returns the events."""
+    events = []
+    for i in range(start, start + packets):
+        table.update(KEY, ts=i * 0.01, length=500)
+        events += table.decide()
+    return events
+
+
+def table(answers, **kwargs):
+    kwargs.setdefault("first_decision_packets", 2)
+    return OnlineFlowTable(Script(answers), **kwargs)
+
+
+def test_evaluations_double_in_packets():
+    t = table([("Gaming", 0.6)] * 4)
+    seen = []
+    for i in range(20):
+        t.update(KEY, ts=i * 0.01, length=500)
+        if t._due:
+            seen.append(t.flows[KEY].packets)
+            t.decide()
+    assert seen == [2, 4, 8, 16]
+
+
+def test_first_label_needs_min_confidence():
+    t = table([("Gaming", 0.4), ("Gaming", 0.55)])
+    assert run(t, 2) == []
+    (event,) = run(t, 2, start=2)
+    assert (event["app_type"], event["provisional"], event["packets"]) == ("Gaming", True, 4)
+
+
+def test_switch_needs_margin_on_consecutive_evaluations():
+    t = table([("Gaming", 0.6),
+               ("Browsing", 0.62),  # within the margin: suppressed
+               ("Browsing", 0.7),   # first confirmation
+               ("Gaming", 0.6),     # agreement resets the challenger
+               ("Browsing", 0.7),
+               ("Browsing", 0.72)], max_evaluations=10, confirmations=2)
+    events = run(t, 64)
+    assert [(e["app_type"], e["packets"]) for e in events] == [("Gaming", 2), ("Browsing", 64)]
+    assert t.stats["switches"] == 1 and t.stats["suppressed"] == 3
+
+
+def test_final_decisions_stop_evaluations():
+    predict = Script([("Gaming", 0.6), ("Gaming", 0.97)])
+    t = OnlineFlowTable(predict, first_decision_packets=2)
+    events = run(t, 100)
+    assert [e["provisional"] for e in events] == [True, False]
+    assert predict.calls == 2 and t.flows[KEY].final
+
+
+def test_max_evaluations_make_a_decision_final():
+    t = table([("Gaming", 0.6)] * 3, max_evaluations=3)
+    events = run(t, 100)
+    assert [e["provisional"] for e in events] == [True, False]
+    assert t.flows[KEY].evaluations == 3
+
+
+def test_missing_model_retries_at_the_next_evaluation():
+    t = table([None, ("Gaming", 0.6)])
+    assert run(t, 3) == []
+    assert t.stats["evaluations"] == 0
+    assert [e["packets"] for e in run(t, 1, start=3)] == [4]
+
+
+def test_running_statistics_and_expiry():
+    t = table([])
+    lengths = [60, 1500, 400, 1200, 90]
+    stamps = [0.0, 0.1, 0.15, 0.45, 0.5]
+    for ts, n in zip(stamps, lengths):
+        t.update(KEY, ts=ts, length=n)
+    features = t.flows[KEY].features()
+    assert features["packet_count"] == 5 and features["bytes_total"] == sum(lengths)
+    assert features["avg_pkt_len"] == pytest.approx(np.mean(lengths))
+    assert features["pkt_len_std"] == pytest.approx(np.std(lengths))
+    assert features["iat_mean"] == pytest.approx(np.mean(np.diff(stamps)))
+    assert features["iat_std"] == pytest.approx(np.std(np.diff(stamps)))
+    assert t.expire(now=10.0) == []
+    assert [k for k, _ in t.expire(now=15.5)] == [KEY] and len(t) == 0
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+
+from ood_detector import NOVELTY_OVERRIDE, OODScorer, needs_vanguard, payload_scorer
+
+
+def clustered(n, seed, shift=0.0):
+    """Three correlated classes in 4 dimensions; `shift` moves every row off them."""
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0, 0, 0, 0], [8, 8, 0, 0], [0, 8, 8, 100]], dtype=np.float64)
+    mixing = np.array([[1.0, 0.8, 0, 0], [0, 0.6, 0, 0], [0, 0, 1.0, 0], [0, 0, 0, 20.0]])
+    labels = rng.integers(0, 3, n)
+    X = centers[labels] + rng.normal(size=(n, 4)) @ mixing + shift
+    return X, np.array(["bulk", "video", "gaming"])[labels]
+
+
+@pytest.fixture(scope="module")
+def scorer():
+    X, y = clustered(6000, 0)
+    X_cal, _ = clustered(3000, 1)
+    return OODScorer.fit(X, y, X_cal)
+
+
+def test_calibration_puts_one_percent_past_the_edge(scorer):
+    X, _ = clustered(20000, 2)
+    assert np.mean(scorer.novelty(X) > 1.0) == pytest.approx(0.01, abs=0.005)
+
+
+def test_shifted_traffic_is_novel(scorer):
+    X, _ = clustered(500, 3, shift=np.array([0, 0, 30.0, 0]))
+    assert np.median(scorer.novelty(X)) > NOVELTY_OVERRIDE
+    # far outside every class even on a feature the others vary in a lot
+    assert scorer.novelty([[4, 4, 4, 5000]])[0] > NOVELTY_OVERRIDE
+
+
+def test_distance_is_mahalanobis_to_the_nearest_class():
+    X, y = clustered(3000, 4)
+    scorer = OODScorer.fit(X, y)
+    queries, _ = clustered(50, 5, shift=1.5)
+    Z = (X - scorer.mean) / scorer.scale
+    Zq = (queries - scorer.mean) / scorer.scale
+    expected = np.full(len(Zq), np.inf)
+    for k, c in enumerate(scorer.classes):
+        inv = scorer.whiten[k] @ scorer.whiten[k].T
+        cov = np.linalg.inv(inv)
+        assert np.allclose(scorer.centroids[k], Z[y == c].mean(axis=0))
+        # the shrunk class covariance
+        raw = np.cov(Z[y == c], rowvar=False)
+        assert np.allclose(cov, 0.9 * raw + 0.1 * (np.trace(raw) / 4 + 1e-6) * np.eye(4))
+        D = Zq - scorer.centroids[k]
+        expected = np.minimum(expected, np.einsum("ij,jk,ik->i", D, inv, D))
+    np.testing.assert_allclose(scorer.distance(queries), np.sqrt(expected), rtol=1e-9)
+
+
+def test_degenerate_inputs_stay_finite():
+    X = np.array([[1.0, 5.0], [2.0, 5.0], [3.0, 5.0], [10.0, 5.0]])
+    y = np.array(["a", "a", "a", "b"])  # a constant column and a single-row class
+    scorer = OODScorer.fit(X, y)
+    assert np.all(np.isfinite(scorer.novelty(X)))
+    assert np.all(np.isfinite(scorer.novelty([[1e6, -1e6]])))
+
+
+def test_round_trip_through_json(scorer):
+    restored = OODScorer.from_dict(json.loads(json.dumps(scorer.to_dict())))
+    X, _ = clustered(200, 6, shift=2.0)
+    np.testing.assert_array_equal(restored.novelty(X), scorer.novelty(X))
+    assert restored.classes == scorer.classes
+    with pytest.raises(ValueError):
+        OODScorer.from_dict({**scorer.to_dict(), "version": 2})
+
+
+def test_payload_scorer(scorer):
+    columns = ["a", "b", "c", "d"]
+    assert payload_scorer({"feature_columns": columns}) is None
+    assert payload_scorer({"feature_columns": columns, "ood": scorer.to_dict()}).radius == scorer.radius
+    # unreadable or fitted on other features: served without a scorer
+    assert payload_scorer({"feature_columns": columns, "ood": {"version": 1}}) is None
+    assert payload_scorer({"feature_columns": columns[:3], "ood": scorer.to_dict()}) is None
+
+
+@pytest.mark.parametrize("confidence, novelty, expected", [
+    (0.5, None, True),
+    (0.99, None, False),
+    (0.5, 0.5, False),  # unsure but familiar: Vanguard has nothing to add
+    (0.5, 1.5, True),
+    (0.99, 1.5, False),
+    (0.99, NOVELTY_OVERRIDE, True),  # confident, far outside the training data
+])
+def test_needs_vanguard(confidence, novelty, expected):
+    assert needs_vanguard(confidence, 0.9, novelty) is expected
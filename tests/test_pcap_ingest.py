@@ -0,0 +1,106 @@
+import pytest
+
+from hostname_enrichment import HostnameEnricher
+from packet_builders import client_hello, dns_response, ethernet, ip_bytes, ipv4, ipv6, pcap, pcapng, tcp, udp
+from pcap_ingest import FlowAggregator, ingest, parse_headers
+
+
+def capture():
+    """(frames, expected flows): a bidirectional TCP flow, a UDP flow, an IPv6 flow and an ICMP packet."""
+    frames = []
+    for i in range(6):
+        frames.append((100.0 + 0.1 * i, ethernet(ipv4("10.0.0.1", "93.184.216.34", 6, tcp(51000, 443, b"a" * 960)))))
+        frames.append((100.05 + 0.1 * i, ethernet(ipv4("93.184.216.34", "10.0.0.1", 6, tcp(443, 51000, b"b" * 40)))))
+    for i in range(4):
+        frames.append((101.0 + 0.25 * i, ethernet(ipv4("10.0.0.2", "203.0.113.9", 17, udp(40000, 3478, b"c" * 172)))))
+    frames.append((102.0, ethernet(ipv6("2001:db8::1", "2001:db8::2", 6, tcp(50000, 8443, b"d" * 100)))))
+    frames.append((102.5, ethernet(ipv4("10.0.0.3", "10.0.0.4", 1, b"\x08\x00" + b"\x00" * 62))))
+    frames.sort()
+    expected = [
+        {"source_ip": "10.0.0.1", "dest_ip": "93.184.216.34", "dest_port": 443, "packet_count": 12,
+         "bytes_total": 6 * 1000 + 6 * 80, "duration_seconds": 0.55, "protocol": "tcp"},
+        {"source_ip": "10.0.0.2", "dest_ip": "203.0.113.9", "dest_port": 3478, "packet_count": 4,
+         "bytes_total": 4 * 200, "duration_seconds": 0.75, "protocol": "udp"},
+        {"source_ip": "2001:db8::1", "dest_ip": "2001:db8::2", "dest_port": 8443, "packet_count": 1,
+         "bytes_total": 160, "duration_seconds": 0.0, "protocol": "tcp"},
+    ]
+    return frames, expected
+
+
+def read_flows(path, **kwargs):
+    return sorted((f for batch in ingest(str(path), **kwargs) for f in batch), key=lambda f: f["source_ip"])
+
+
+def check(flows, expected):
+    assert len(flows) == len(expected)
+    for flow, want in zip(flows, expected):
+        for key, value in want.items():
+            assert flow[key] == pytest.approx(value, abs=1e-6) if isinstance(value, float) else flow[key] == value
+        assert flow["avg_pkt_len"] == pytest.approx(want["bytes_total"] / want["packet_count"])
+
+
+@pytest.mark.parametrize("writer", [pcap, pcapng])
+def test_capture_round_trip(tmp_path, writer):
+    frames, expected = capture()
+    path = tmp_path / "capture.cap"
+    path.write_bytes(writer(frames))
+    check(read_flows(path), expected)
+
+
+def test_small_chunks_match_one_chunk(tmp_path):
+    frames, expected = capture()
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap(frames))
+    check(read_flows(path, chunk_bytes=256), expected)
+
+
+def test_idle_timeout_splits_flow(tmp_path):
+    frames = [(100.0, ethernet(ipv4("10.0.0.1", "10.0.0.9", 17, udp(1000, 2000, b"x" * 10)))),
+              (200.0, ethernet(ipv4("10.0.0.1", "10.0.0.9", 17, udp(1000, 2000, b"x" * 10))))]
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap(frames))
+    aggregator = FlowAggregator(idle_timeout=15.0)
+    flows = read_flows(path, aggregator=aggregator)
+    assert [f["packet_count"] for f in flows] == [1, 1]
+
+
+def test_ipv6_extension_header_goes_through_scalar_parser(tmp_path):
+    # hop-by-hop options header (8 bytes) between the IPv6 header and UDP
+    payload = bytes([17, 0]) + b"\x00" * 6 + udp(5353, 53, b"q" * 12)
+    frame = ethernet(ipv6("2001:db8::1", "2001:db8::2", 0, payload))
+    assert parse_headers(frame, 0, len(frame), 1) == (17, ip_bytes("2001:db8::1"), ip_bytes("2001:db8::2"), 5353, 53,
+                                                      40 + len(payload))
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap([(1.0, frame)]))
+    check(read_flows(path), [{"source_ip": "2001:db8::1", "dest_ip": "2001:db8::2", "dest_port": 53, "packet_count": 1,
+                              "bytes_total": 40 + len(payload), "protocol": "udp"}])
+
+
+def test_hostnames_from_sni_and_dns(tmp_path):
+    frames = [(10.0, ethernet(ipv4("8.8.8.8", "10.0.0.2", 17, udp(53, 5555, dns_response(
+        "video.example.com", [("198.51.100.9", 300)], cname="edge.cdn.example.net")))))]
+    frames += [(10.1 + 0.01 * i, ethernet(ipv4("10.0.0.2", "198.51.100.9", 6, tcp(40000, 443, b"x" * 500))))
+               for i in range(5)]
+    frames.append((11.0, ethernet(ipv4("10.0.0.3", "203.0.113.5", 6, tcp(40001, 443, client_hello("Meet.Example.ORG"))))))
+    frames.append((12.0, ethernet(ipv4("10.0.0.4", "192.0.2.1", 6, tcp(40002, 443, b"z" * 100)))))
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap(frames))
+
+    enricher = HostnameEnricher()
+    by_dest = {f["dest_ip"]: f for f in read_flows(path, enricher=enricher)}
+    assert by_dest["198.51.100.9"]["hostname"] == "video.example.com"
+    assert by_dest["203.0.113.5"]["hostname"] == "meet.example.org"
+    assert "hostname" not in by_dest["192.0.2.1"]
+    assert all("hostname" not in f for f in read_flows(path))
+
+
+def test_dns_name_is_taken_when_flow_starts(tmp_path):
+    # the answer arrives after the flow began, so the flow keeps no name
+    frames = [(10.0 + 0.01 * i, ethernet(ipv4("10.0.0.2", "198.51.100.9", 6, tcp(40000, 443, b"x" * 500))))
+              for i in range(5)]
+    frames.append((10.5, ethernet(ipv4("8.8.8.8", "10.0.0.2", 17, udp(53, 5555, dns_response(
+        "late.example.com", [("198.51.100.9", 300)]))))))
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap(frames))
+    flows = [f for f in read_flows(path, enricher=HostnameEnricher()) if f["dest_ip"] == "198.51.100.9"]
+    assert len(flows) == 1 and "hostname" not in flows[0]
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from policy_matcher import PolicyMatcher
+
+
+def flow(port, dest_ip="10.1.2.3", protocol="udp", source_ip="192.168.1.5"):
+    return {"source_ip": source_ip, "dest_ip": dest_ip, "dest_port": port, "protocol": protocol}
+
+
+def matcher(*rules):
+    m = PolicyMatcher()
+    for i, rule in enumerate(rules):
+        m.add_rule({"id": f"r{i}", **rule})
+    return m
+
+
+def winner(m, *args, **kwargs):
+    rule = m.match(flow(*args, **kwargs))
+    return rule["id"] if rule else None
+
+
+OVERLAPPING = [
+    {"app_type": "A", "port_min": 1000, "port_max": 2000},
+    {"app_type": "B", "port_min": 1500, "port_max": 1600},
+    {"app_type": "C", "port_min": 1550, "port_max": 3000},
+]
+
+
+@pytest.mark.parametrize("port, expected", [
+    (999, None), (1000, "r0"), (1549, "r1"), (1580, "r1"), (1600, "r1"),
+    (1601, "r0"),  # r0 and r2 cover it; r0 is narrower
+    (2000, "r0"), (2001, "r2"), (3000, "r2"), (3001, None),
+])
+def test_overlapping_ranges_pick_the_narrowest(port, expected):
+    assert winner(matcher(*OVERLAPPING), port) == expected
+
+
+def test_removing_a_range_recompiles_the_intervals():
+    m = matcher(*OVERLAPPING)
+    m.remove_rule("r1")
+    assert winner(m, 1580) == "r0"
+    m.remove_rule("r0")
+    assert winner(m, 1580) == "r2" and winner(m, 1200) is None
+
+
+def test_priority_then_filters_within_the_range_group():
+    m = matcher({"app_type": "wide", "port_min": 1000, "port_max": 2000, "priority": 5},
+                {"app_type": "narrow", "port_min": 1400, "port_max": 1500},
+                {"app_type": "tcp-only", "port_min": 1450, "port_max": 1460, "protocol": "tcp"})
+    assert winner(m, 1455) == "r0"
+    m.remove_rule("r0")
+    assert winner(m, 1455) == "r1"  # narrowest rule rejects udp
+    assert winner(m, 1455, protocol="tcp") == "r2"
+
+
+def test_specificity_order():
+    m = matcher({"app_type": "any"},
+                {"app_type": "range", "port_min": 27000, "port_max": 27100},
+                {"app_type": "exact", "port_min": 27015, "port_max": 27015},
+                {"app_type": "prefix", "dst_cidr": "10.1.0.0/16"},
+                {"app_type": "open", "port_min": 50000})
+    assert winner(m, 27015, dest_ip="172.16.0.1") == "r2"
+    assert winner(m, 27016, dest_ip="172.16.0.1") == "r1"
+    assert winner(m, 80, dest_ip="172.16.0.1") == "r0"
+    assert winner(m, 60000, dest_ip="172.16.0.1") == "r4"
+    # a longer destination prefix wins before port specificity is considered
+    assert winner(m, 27015) == "r3"
+
+
+def test_matches_a_linear_scan():
+    rng = random.Random(7)
+    rules = []
+    for _ in range(60):
+        lo = rng.randrange(0, 2000)
+        rules.append({"app_type": "x", "port_min": lo, "port_max": lo + rng.randrange(1, 400),
+                      "priority": rng.randrange(3), "protocol": rng.choice([None, "udp", "tcp"])})
+    m = matcher(*rules)
+    for port in range(0, 2500, 7):
+        hits = [(r["port_max"] - r["port_min"], r["port_min"], r["port_max"], f"r{i}", r)
+                for i, r in enumerate(rules)
+                if r["port_min"] <= port <= r["port_max"] and r["protocol"] in (None, "udp")]
+        hits.sort(key=lambda h: h[:4])
+        expected = max(hits, key=lambda h: h[4]["priority"])[3] if hits else None
+        assert winner(m, port) == expected
@@ -0,0 +1,129 @@
+import os
+import stat
+
+import pytest
+
+from qos_enforcer import NftEnforcer
+from qos_reconciler import Reconciler
+
+FLOW_A = ("10.0.0.1", "93.184.216.34", 443)
+FLOW_B = ("2001:db8::1", "2001:db8::2", 8443)
+
+
+@pytest.fixture
+def nft(tmp_path):
+    """A stand-in `nft` that appends each transaction to a log and fails while `fail` exists."""
+    script = tmp_path / "nft"
+    script.write_text('#!/bin/sh\n'
+                      'dir=$(dirname "$0")\n'
+                      'if [ -e "$dir/fail" ]; then echo "transaction rejected" >&2; exit 1; fi\n'
+                      'cat "$2" >> "$dir/log"\n'
+                      'echo "--" >> "$dir/log"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    def transactions():
+        log = tmp_path / "log"
+        return log.read_text().split("--\n")[:-1] if log.exists() else []
+
+    enforcer = NftEnforcer(dry_run=False, nft_bin=str(script))
+    return enforcer, transactions, tmp_path / "fail"
+
+
+def test_empty_first_tick_does_not_skip_the_base(nft):
+    enforcer, transactions, _ = nft
+    reconciler = Reconciler(enforcer, ttl_s=0)
+    # what reconcile_loop does on an idle tick
+    batch = reconciler.begin()
+    assert not batch["adds"] and not batch["deletes"]
+    reconciler.complete(batch, 0.0)
+
+    reconciler.set_desired("a", FLOW_A, "EF")
+    reconciler.reconcile()
+    sent = transactions()
+    assert len(sent) == 1
+    assert sent[0].index("delete table inet sentinel_qos") < sent[0].index("add element")
+    assert enforcer.applied == {FLOW_A: "EF"}
+
+
+def test_only_the_diff_is_sent(nft):
+    enforcer, transactions, _ = nft
+    reconciler = Reconciler(enforcer, ttl_s=0)
+    reconciler.set_desired("a", FLOW_A, "EF")
+    reconciler.set_desired("b", FLOW_B, "AF41")
+    reconciler.reconcile()
+
+    reconciler.set_desired("a", FLOW_A, "CS1")
+    reconciler.clear("b")
+    reconciler.reconcile()
+    second = transactions()[1]
+    assert "table" not in second.replace("inet sentinel_qos", "")
+    assert "delete element inet sentinel_qos flow_dscp4 { 10.0.0.1 . 93.184.216.34 . 443 }" in second
+    assert "add element inet sentinel_qos flow_dscp4 { 10.0.0.1 . 93.184.216.34 . 443 : cs1 }" in second
+    assert "delete element inet sentinel_qos flow_dscp6 { 2001:db8::1 . 2001:db8::2 . 8443 }" in second
+    assert enforcer.applied == {FLOW_A: "CS1"}
+    assert reconciler.stats["last_modifies"] == 1 and reconciler.stats["last_deletes"] == 1
+
+    # nothing changed: no transaction at all
+    reconciler.reconcile()
+    assert len(transactions()) == 2
+
+
+def test_failed_batch_is_retried_with_the_base(nft):
+    enforcer, transactions, fail = nft
+    reconciler = Reconciler(enforcer, ttl_s=0)
+    reconciler.set_desired("a", FLOW_A, "EF")
+    fail.touch()
+    with pytest.raises(RuntimeError, match="transaction rejected"):
+        reconciler.reconcile()
+    assert enforcer.applied == {} and FLOW_A in enforcer.pending
+    assert enforcer.stats["errors"] == 1
+
+    os.unlink(fail)
+    reconciler.reconcile()
+    sent = transactions()
+    assert len(sent) == 1 and "delete table" in sent[0]
+    assert enforcer.applied == {FLOW_A: "EF"} and not enforcer.pending
+
+
+def test_full_resync_repairs_drift(nft):
+    enforcer, transactions, _ = nft
+    reconciler = Reconciler(enforcer, ttl_s=0)
+    reconciler.set_desired("a", FLOW_A, "EF")
+    reconciler.reconcile()
+    # something outside the reconciler changed the applied state
+    enforcer.applied[FLOW_A] = "CS1"
+    enforcer.applied[FLOW_B] = "AF41"
+
+    reconciler.reconcile(full=False)
+    assert len(transactions()) == 1
+    reconciler.reconcile(full=True)
+    assert reconciler.stats["last_drift"] == 2
+    assert enforcer.applied == {FLOW_A: "EF"}
+
+
+def test_expired_owners_are_cleared():
+    enforcer = NftEnforcer(dry_run=True, ruleset_path=os.devnull)
+    reconciler = Reconciler(enforcer, ttl_s=10.0)
+    reconciler.set_desired("a", FLOW_A, "EF", ts=100.0)
+    reconciler.set_desired("b", FLOW_B, "EF", ts=100.0)
+    reconciler.touch("b", ts=105.0)
+    assert reconciler.pop_expired(now=111.0) == ["a"]
+    assert list(reconciler.desired) == [FLOW_B]
+
+
+def test_dry_run_appends_each_delta(tmp_path):
+    path = tmp_path / "sentinel_qos.nft"
+    enforcer = NftEnforcer(dry_run=True, ruleset_path=str(path))
+    reconciler = Reconciler(enforcer, ttl_s=0)
+    reconciler.set_desired("a", FLOW_A, "EF")
+    reconciler.reconcile()
+    first = path.read_text()
+    assert first.startswith("table inet sentinel_qos\n")
+
+    reconciler.set_desired("b", FLOW_B, "AF41")
+    reconciler.reconcile()
+    log = path.read_text()
+    assert log.startswith(first) and log.count("delete table") == 1
+    assert log[len(first):] == "add element inet sentinel_qos flow_dscp6 { 2001:db8::1 . 2001:db8::2 . 8443 : af41 }\n"
+    # the compact form is rendered only on request
+    assert enforcer.render_ruleset().count("add element") == 2
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+lightgbm = pytest.importorskip("lightgbm")
+
+from sentry_artifact import NATIVE_BATCH_ROWS, ArtifactModel, is_artifact, load_payload, write_artifact  # noqa: E402
+
+COLUMNS = ["packet_count", "avg_pkt_len", "duration_seconds", "bytes_total", "dest_port"]
+
+
+def training_set(n_classes, seed=0, n=1500):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, len(COLUMNS))) * [500, 400, 30, 1e6, 8000]
+    y = (X[:, 0] > 0).astype(int) + (X[:, 1] > 200).astype(int) * (n_classes > 2)
+    # missing and exactly-zero values in training, so trees learn missing-value directions
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0.0
+    return X, y
+
+
+def queries(seed=1, n=400):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, len(COLUMNS))) * [500, 400, 30, 1e6, 8000]
+    X[rng.random(X.shape) < 0.15] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0.0
+    X[rng.random(X.shape) < 0.02] = 1e-40  # below LightGBM's zero threshold
+    return X
+
+
+@pytest.fixture(params=[
+    {"n_classes": 3},
+    {"n_classes": 2},
+    {"n_classes": 3, "zero_as_missing": True},
+    {"n_classes": 3, "use_missing": False},
+], ids=["multiclass", "binary", "zero-as-missing", "no-missing"])
+def trained(request, tmp_path):
+    params = dict(request.param)
+    X, y = training_set(params.pop("n_classes"))
+    clf = lightgbm.LGBMClassifier(n_estimators=40, num_leaves=15, verbose=-1, **params).fit(X, y)
+    path = str(tmp_path / "model.sentry")
+    write_artifact({"model": clf, "label_encoder": None, "feature_columns": COLUMNS}, path, {"generation": 3})
+    return clf, path
+
+
+def test_predict_proba_matches_lightgbm(trained):
+    clf, path = trained
+    model = ArtifactModel.load(path)
+    X = queries()
+    expected = clf.predict_proba(X)
+    # single rows and small batches take the NumPy tree walk, large ones the embedded booster
+    for rows in (X[:1], X[:NATIVE_BATCH_ROWS - 1], X):
+        got = model.predict_proba(rows)
+        assert got.shape == (len(rows), expected.shape[1])
+        assert np.max(np.abs(got - expected[:len(rows)])) < 1e-12
+    # artifact class names are strings
+    assert list(model.predict(X[:50])) == [str(c) for c in clf.predict(X[:50])]
+
+
+def test_payload_round_trip(trained):
+    clf, path = trained
+    assert is_artifact(path)
+    payload = load_payload(path)
+    assert payload["feature_columns"] == COLUMNS
+    assert payload["generation"] == 3
+    assert payload["label_encoder"] is None
+
+
+def test_non_lightgbm_models_are_rejected(tmp_path):
+    from sklearn.tree import DecisionTreeClassifier
+    X, y = training_set(2)
+    clf = DecisionTreeClassifier().fit(np.nan_to_num(X), y)
+    with pytest.raises(ValueError):
+        write_artifact({"model": clf, "feature_columns": COLUMNS}, str(tmp_path / "model.sentry"))
@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from traffic_replay import RECORD_FIELDS, SEGMENT_SUFFIX, SegmentRecorder, read_segments
+
+
+def features(i):
+    return {"source_ip": f"10.0.0.{i % 250}", "dest_ip": "93.184.216.34", "dest_port": 443, "packet_count": i + 1,
+            "avg_pkt_len": 512.5, "duration_seconds": 1.25, "bytes_total": 512 * (i + 1), "protocol": "tcp",
+            "hostname": "video.example.com" if i % 2 else None}
+
+
+def segment_lines(n, start=0):
+    header = json.dumps({"format": 2, "fields": list(RECORD_FIELDS)}) + "\n"
+    return header + "".join(json.dumps([1000.0 + i] + [features(i)[f] for f in RECORD_FIELDS]) + "\n"
+                            for i in range(start, start + n))
+
+
+def segments(directory):
+    return sorted(os.path.join(directory, p) for p in os.listdir(directory) if p.endswith(SEGMENT_SUFFIX))
+
+
+def test_record_flush_close_round_trip(tmp_path):
+    recorder = SegmentRecorder(str(tmp_path), flush_records=3, flush_seconds=3600)
+    due = [recorder.record(features(i), ts=1000.0 + i) for i in range(7)]
+    assert due == [False, False, True, True, True, True, True]  # the caller flushes when told
+    recorder.flush()
+    recorder.record(features(7), ts=1007.0)
+    assert segments(str(tmp_path)) == []  # still open as .part
+    recorder.close()
+    records = list(read_segments(segments(str(tmp_path))))
+    assert records == [(1000.0 + i, features(i)) for i in range(8)]
+
+
+def test_part_segment_with_a_torn_last_line_is_recovered(tmp_path):
+    part = tmp_path / ("classify-1" + SEGMENT_SUFFIX + ".part")
+    with gzip.open(part, "wt") as fh:
+        fh.write(segment_lines(5) + '[1005.0,"10.0.0.5","93.1')
+    recorder = SegmentRecorder(str(tmp_path))
+    assert recorder.stats["recovered"] == 1 and not part.exists()
+    assert [f["packet_count"] for _, f in read_segments(segments(str(tmp_path)))] == [1, 2, 3, 4, 5]
+
+
+def test_truncated_gzip_stream_keeps_complete_records(tmp_path):
+    part = tmp_path / ("classify-1" + SEGMENT_SUFFIX + ".part")
+    data = gzip.compress(segment_lines(2000).encode(), compresslevel=1)
+    part.write_bytes(data[:len(data) // 2])
+    SegmentRecorder(str(tmp_path))
+    records = list(read_segments(segments(str(tmp_path))))
+    assert 0 < len(records) < 2000
+    assert records == [(1000.0 + i, features(i)) for i in range(len(records))]
+
+
+def test_empty_part_is_removed(tmp_path):
+    part = tmp_path / ("classify-1" + SEGMENT_SUFFIX + ".part")
+    part.write_bytes(b"")
+    SegmentRecorder(str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_legacy_and_future_formats(tmp_path):
+    legacy = tmp_path / ("a" + SEGMENT_SUFFIX)
+    with gzip.open(legacy, "wt") as fh:
+        fh.write(json.dumps([1.0] + [features(0)[f] for f in RECORD_FIELDS[:8]]) + "\n")
+    ((_, row),) = read_segments([str(legacy)])
+    assert "hostname" not in row and row["packet_count"] == 1
+
+    future = tmp_path / ("b" + SEGMENT_SUFFIX)
+    with gzip.open(future, "wt") as fh:
+        fh.write(json.dumps({"format": 99, "fields": ["x"]}) + "\n")
+    with pytest.raises(ValueError, match="newer"):
+        list(read_segments([str(future)]))
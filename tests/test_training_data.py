@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas")
+
+from training_data import load_training_data  # noqa: E402
+
+
+def write_csv(path, rows=6):
+    lines = ["packet_count,avg_pkt_len,label,kind"]
+    lines += [f"{10 * i},{100.5 + i},{'Gaming' if i % 2 else 'Browsing'},{'a' if i < 3 else 'b'}" for i in range(rows)]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_cache_hit_for_renamed_copy(tmp_path):
+    cache = str(tmp_path / "cache")
+    write_csv(tmp_path / "one.csv")
+    features, codes, names = load_training_data(str(tmp_path / "one.csv"), cache_dir=cache)
+    os.replace(tmp_path / "one.csv", tmp_path / "two.csv")
+    cached = load_training_data(str(tmp_path / "two.csv"), cache_dir=cache)
+    assert isinstance(cached[1], np.memmap)
+    assert names == cached[2] == ["Browsing", "Gaming"]
+    assert np.array_equal(codes, cached[1])
+    assert np.array_equal(features["avg_pkt_len"], cached[0]["avg_pkt_len"])
+
+
+def test_label_is_part_of_the_cache_key(tmp_path):
+    cache = str(tmp_path / "cache")
+    csv = str(tmp_path / "flows.csv")
+    write_csv(tmp_path / "flows.csv")
+    _, _, by_label = load_training_data(csv, label="label", cache_dir=cache)
+    _, codes, by_kind = load_training_data(csv, label="kind", cache_dir=cache)
+    assert by_label == ["Browsing", "Gaming"] and by_kind == ["a", "b"]
+    assert list(codes) == [0, 0, 0, 1, 1, 1]
+    assert len([d for d in os.listdir(cache) if d != "digests.json"]) == 2
+
+
+def test_edited_csv_misses_the_cache(tmp_path):
+    cache = str(tmp_path / "cache")
+    csv = tmp_path / "flows.csv"
+    write_csv(csv)
+    load_training_data(str(csv), cache_dir=cache)
+    write_csv(csv, rows=8)
+    assert len(load_training_data(str(csv), cache_dir=cache)[1]) == 8